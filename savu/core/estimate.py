@@ -0,0 +1,373 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: estimate
+   :platform: Unix
+   :synopsis: Estimate the data movement, memory and run time of a process \
+   list from the plugin list check, without processing any data.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import time
+import ctypes
+import ctypes.util
+import logging
+import tempfile
+import h5py
+import numpy as np
+
+import savu.core.utils as cu
+import savu.plugins.utils as pu
+import savu.core.plugin_fusion as fusion
+import savu.core.frame_batching as fb
+from savu.data.chunking import Chunking
+
+MB = 1e6
+
+
+def get_estimates(exp):
+    """ Estimate the cost of each plugin in the process list, as it would be
+    run by the hdf5 transport.
+
+    :param Experiment exp: The current experiment, after the plugin list
+        check.
+    :returns: a dictionary for each plugin, with the bytes read and written
+        by each process, the read amplification (bytes read from the chunks
+        of the files per byte used), the number of files created and the
+        peak memory used by each process for the slice groups.
+    :rtype: list(dict)
+    """
+    expInfo = exp.meta_data
+    plugin_list = expInfo.plugin_list
+    n_loaders = plugin_list._get_n_loaders()
+    datasets_list = plugin_list._get_datasets_list()
+    names = [p['name'] for p in plugin_list.plugin_list]
+    nProcs = len(expInfo.get_meta_data('processes'))
+    in_flight = fb.get_slice_groups_in_flight(expInfo.get_dictionary())
+    fusion.set_fused_plugins(exp)
+
+    chunks = {}
+    saved = {}
+    estimates = []
+    for i in range(len(datasets_list)):
+        idx = i + n_loaders
+        read = needed = written = group = 0
+        for data in datasets_list[i]['in_datasets']:
+            name = data['name']
+            nbytes = _get_nbytes(data['shape'], data['dtype'])
+            group += _get_frames_nbytes(data)
+            if not saved.get(name, True):
+                continue
+            amplification = _read_amplification(
+                data['shape'], chunks.get(name, data['chunks']),
+                data['pattern'])
+            needed += nbytes
+            read += nbytes*amplification
+
+        files = 0
+        for data in datasets_list[i]['out_datasets']:
+            name = data['name']
+            group += _get_frames_nbytes(data)
+            saved[name] = fusion.is_saved(exp, idx, name)
+            if saved[name]:
+                files += 1
+                written += _get_nbytes(data['shape'], data['dtype'])
+            if saved[name] and 'var' not in data['shape']:
+                chunks[name] = Chunking(exp, {
+                    'current': data['pattern'],
+                    'next': __find_next_pattern(datasets_list[i+1:], name)
+                    })._calculate_chunking(data['shape'], data['dtype'])
+
+        estimates.append({
+            'name': names[idx], 'read': read/nProcs,
+            'amplification': read/needed if needed else 1.0,
+            'written': float(written)/nProcs, 'files': files,
+            'memory': group*in_flight})
+    return estimates
+
+
+def __find_next_pattern(datasets_list, name):
+    for entry in datasets_list:
+        for data in entry['in_datasets']:
+            if data['name'] == name:
+                return data['pattern']
+    return []
+
+
+def _get_nbytes(shape, dtype):
+    if 'var' in shape:
+        return 0
+    return int(np.prod(shape))*np.dtype(dtype).itemsize
+
+
+def _get_frames_shape(shape, pattern):
+    """ The shape of the block of data read for a slice group. """
+    pattern = pattern.values()[0]
+    frames = [1]*len(shape)
+    for dim in pattern['core_dir']:
+        frames[dim] = shape[dim]
+    sdir = pattern['slice_dir'][0]
+    frames[sdir] = min(pattern['max_frames'], shape[sdir])
+    return frames
+
+
+def _get_frames_nbytes(data):
+    if 'var' in data['shape']:
+        return 0
+    return _get_nbytes(_get_frames_shape(data['shape'], data['pattern']),
+                       data['dtype'])
+
+
+def _read_amplification(shape, chunks, pattern):
+    """ The number of bytes read from the chunks of a dataset for each byte
+    in a slice group, assuming the slice groups are aligned with the chunks.
+
+    :param tuple shape: the shape of the dataset.
+    :param tuple chunks: the chunk shape (or None if not chunked).
+    :param dict pattern: the pattern the dataset is read in.
+    """
+    if not isinstance(chunks, tuple) or 'var' in shape:
+        return 1.0
+    frames = _get_frames_shape(shape, pattern)
+    touched = [min(s, int(np.ceil(float(f)/c))*c) for s, f, c in
+               zip(shape, frames, chunks)]
+    return float(np.prod(touched))/np.prod(frames)
+
+
+def _drop_cache(filename, sync=False):
+    """ Ask the kernel to drop the pages of a file from the page cache, so
+    that it is next read from the file system.  The pages must be written
+    first, so the file is synced if ``sync`` is True.
+
+    :returns: whether the pages were dropped.
+    :rtype: bool
+    """
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        if sync:
+            os.fsync(fd)
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            return True
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.posix_fadvise.argtypes = [ctypes.c_int, ctypes.c_longlong,
+                                       ctypes.c_longlong, ctypes.c_int]
+        # POSIX_FADV_DONTNEED on Linux
+        return libc.posix_fadvise(fd, 0, 0, 4) == 0
+    except (OSError, AttributeError):
+        return False
+    finally:
+        os.close(fd)
+
+
+def calibrate(path, nbytes=64*MB):
+    """ Measure the rates at which a process writes and reads an hdf5 file
+    in ``path``, while all other processes do the same.  The write is timed
+    until the file is synced, and the file is dropped from the page cache
+    before it is read, so neither rate is that of the page cache.
+
+    :returns: the write and read rates in bytes per second.
+    :rtype: tuple(float)
+    """
+    nFrames = 64
+    frame = np.ones(max(1, int(nbytes/nFrames/4)), dtype=np.float32)
+    fd, filename = tempfile.mkstemp(suffix='.h5', dir=path)
+    os.close(fd)
+    try:
+        cu.COMM_WORLD.barrier()
+        start = time.time()
+        with h5py.File(filename, 'w') as h5:
+            data = h5.create_dataset('data', (nFrames, frame.size),
+                                     np.float32)
+            for i in range(nFrames):
+                data[i] = frame
+        dropped = _drop_cache(filename, sync=True)
+        write = time.time() - start
+        if not dropped:
+            logging.warn("The calibration file could not be dropped from "
+                         "the page cache: the read rate may be too high.")
+
+        cu.COMM_WORLD.barrier()
+        start = time.time()
+        with h5py.File(filename, 'r') as h5:
+            for i in range(nFrames):
+                h5['data'][i]
+        read = time.time() - start
+    finally:
+        os.remove(filename)
+    size = float(nFrames*frame.nbytes)
+    return size/max(write, 1e-6), size/max(read, 1e-6)
+
+
+def time_processing(exp, nGroups=2):
+    """ Estimate the time each process spends processing the data of each
+    plugin, from the time process_frames takes (after pre_process) to
+    process ``nGroups`` slice groups of random frames, while all other
+    processes do the same.
+
+    :param Experiment exp: The current experiment, after the plugin list
+        check.
+    :returns: the processing time of each plugin in seconds, or None if the
+        plugin could not process random frames (e.g. it needs a GPU, or the
+        slice list of the frames).
+    :rtype: list(float)
+    """
+    expInfo = exp.meta_data
+    plugin_list = expInfo.plugin_list.plugin_list
+    n_loaders = expInfo.plugin_list._get_n_loaders()
+    nProcs = len(expInfo.get_meta_data('processes'))
+    for i in range(n_loaders):
+        pu.plugin_loader(exp, plugin_list[i])
+
+    times = []
+    for plugin_dict in plugin_list[n_loaders:-1]:
+        plugin = pu.plugin_loader(exp, plugin_dict)
+        exp._barrier()
+        seconds = cu.COMM_WORLD.allgather(__time_plugin(plugin, nGroups))
+        if None in seconds:
+            times.append(None)
+        else:
+            pData = plugin.get_plugin_in_datasets()[0]
+            nFrames = pData._get_frame_chunk()
+            times.append(max(seconds)*int(np.ceil(
+                float(pData.get_total_frames())/nFrames/nProcs)))
+        exp._merge_out_data_to_in()
+    exp._clear_data_objects()
+    return times
+
+
+def __time_plugin(plugin, nGroups):
+    """ The time taken to process a slice group of random frames, or None if
+    the plugin fails to process them.  A plugin that fills the output buffers
+    it is lent is timed filling them, as in a real run.
+    """
+    try:
+        frames = [__get_random_frames(pData) for pData in
+                  plugin.get_plugin_in_datasets()]
+        out = __get_out_buffers(plugin)
+        plugin.pre_process()
+        try:
+            start = time.time()
+            for i in range(nGroups):
+                plugin.process_frames(frames, None, **out)
+            return (time.time() - start)/nGroups
+        finally:
+            plugin.post_process()
+    except Exception as e:
+        logging.warn("%s - the processing is not estimated: %s",
+                     plugin.name, e)
+        return None
+
+
+def __get_frames_shape(pData, result=False):
+    """ The shape of the slice groups of a dataset that the plugin is passed
+    (including the padding), or of the results it returns, which do not keep
+    the slice dimension of single padded frames.
+    """
+    data = pData.data_obj
+    shape = data.get_shape()
+    padding = data._get_padding_dict() if pData.padding else {}
+    nFrames = pData._get_frame_chunk()
+    sdir = pData.get_slice_directions()[0]
+    frames = []
+    for dim in range(len(shape)):
+        if dim in pData.get_core_directions():
+            frames.append(shape[dim] + 2*padding.get(dim, 0))
+        elif dim == sdir and \
+                (nFrames > 1 or (padding.get(dim, 0) and not result)):
+            frames.append(nFrames + 2*padding.get(dim, 0))
+    return tuple(frames)
+
+
+def __get_random_frames(pData):
+    """ A slice group of random frames, with the shape and type of the slice
+    groups the plugin is passed.
+    """
+    data = pData.data_obj
+    dtype = data.dtype
+    if dtype is None:
+        dtype = getattr(data.data, 'dtype', np.float32)
+    return (1 + 1000*np.random.rand(*__get_frames_shape(pData))).astype(dtype)
+
+
+def __get_out_buffers(plugin):
+    """ The output buffers the plugin is lent for its results, if it fills
+    them.
+
+    :returns: the keyword arguments for process_frames.
+    :rtype: dict
+    """
+    out_datasets = plugin.get_plugin_out_datasets()
+    if not plugin.reuse_output_buffers() or \
+            [p for p in out_datasets if 'var' in p.data_obj.get_shape()]:
+        return {}
+    out = []
+    for pData in out_datasets:
+        dtype = pData.data_obj.dtype
+        out.append(np.empty(__get_frames_shape(pData, result=True),
+                            np.float32 if dtype is None else dtype))
+    return {'out': out}
+
+
+def report(exp):
+    """ Report the estimated cost of each plugin, and the predicted time spent
+    reading, writing and processing the data, to the user.  The i/o of a
+    plugin overlaps its processing if slice groups are read ahead or written
+    behind.  The estimates are also added to the experiment metadata as
+    ``estimates``.
+    """
+    expInfo = exp.meta_data
+    estimates = get_estimates(exp)
+    write_rate, read_rate = calibrate(expInfo.get_meta_data('inter_path'))
+    logging.debug("Calibrated write %.1f MB/s and read %.1f MB/s",
+                  write_rate/MB, read_rate/MB)
+    processing = time_processing(exp)
+    options = expInfo.get_dictionary()
+    overlap = options.get('read_ahead', 0) or options.get('write_behind', 0)
+
+    nProcs = len(expInfo.get_meta_data('processes'))
+    cu.user_message("*Estimate for %i processes (write %.1f MB/s, read %.1f "
+                    "MB/s per process)*" % (nProcs, write_rate/MB,
+                                            read_rate/MB))
+    for est, seconds in zip(estimates, processing):
+        est['io_time'] = est['read']/read_rate + est['written']/write_rate
+        est['processing'] = seconds
+        if seconds is None:
+            est['time'] = est['io_time']
+            processed = "processing not estimated"
+        else:
+            est['time'] = max(est['io_time'], seconds) if overlap else \
+                est['io_time'] + seconds
+            processed = "processing %.1fs" % seconds
+        cu.user_message(
+            "%s - read %.1f MB (amplification %.2f), written %.1f MB, %i "
+            "files, peak memory %.1f MB, i/o %.1fs, %s, time %.1fs" %
+            (est['name'], est['read']/MB, est['amplification'],
+             est['written']/MB, est['files'], est['memory']/MB,
+             est['io_time'], processed, est['time']))
+
+    unknown = len([e for e in estimates if e['processing'] is None])
+    cu.user_message(
+        "Total - %i files, peak memory %.1f MB, predicted wall time %.1fs%s" %
+        (sum([e['files'] for e in estimates]),
+         max([e['memory'] for e in estimates] + [0])/MB,
+         sum([e['time'] for e in estimates]),
+         " (excluding the processing of %i plugins)" % unknown if unknown
+         else ""))
+    expInfo.set_meta_data('estimates', estimates)
+    return estimates
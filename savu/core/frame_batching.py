@@ -0,0 +1,152 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_batching
+   :platform: Unix
+   :synopsis: Choose the number of frames in each slice group of a plugin \
+   from a memory budget, rather than using the plugin maximum.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import numpy as np
+
+import savu.core.utils as cu
+
+# the largest acceptable ratio of frames read to frames processed, when the
+# slice groups are padded with neighbouring frames
+MAX_PAD_AMPLIFICATION = 1.5
+
+
+def get_slice_groups_in_flight(options):
+    """ The number of slice groups held in memory at once by a process. """
+    workers = options.get('frame_workers', 1)
+    in_flight = 2*workers if workers > 1 else 1
+    return in_flight + options.get('read_ahead', 0) + \
+        options.get('write_behind', 0)
+
+
+def set_frame_batches(plugin):
+    """ Set the number of frames in each slice group of the plugin from the
+    per-process memory budget ``frame_budget_mb``, if there is one.  The
+    plugin maximum (get_max_frames) is the upper bound, and the datasets that
+    do not use it are not changed.
+
+    :param Plugin plugin: The plugin, after setup.
+    """
+    expInfo = plugin.exp.meta_data
+    options = expInfo.get_dictionary()
+    budget = options.get('frame_budget_mb', None)
+    in_pData = plugin.parameters.get('plugin_in_datasets', [])
+    if not budget or not in_pData:
+        return
+    out_pData = plugin.parameters.get('plugin_out_datasets', [])
+    max_frames = plugin.get_max_frames()
+    pData_list = [p for p in in_pData + out_pData if
+                  p.meta_data.get_meta_data('nFrames') == max_frames]
+    if not pData_list or 'var' in in_pData[0].data_obj.get_shape():
+        return
+
+    frame_bytes = plugin.get_memory_per_frame()
+    pad_frames = 0
+    for pData in pData_list:
+        nbytes, pad = __get_frame_nbytes(pData)
+        frame_bytes += nbytes
+        if pData in in_pData:
+            pad_frames = max(pad_frames, pad)
+    in_bytes = __get_frame_nbytes(in_pData[0])[0]
+    budget = budget*1e6/get_slice_groups_in_flight(options)
+
+    nFrames = choose_frames(
+        __get_frame_counts(in_pData[0]), len(expInfo.get_meta_data(
+            'processes')), max_frames, frame_bytes, pad_frames, in_bytes,
+        budget)
+    if nFrames == max_frames:
+        return
+    cu.user_message("%s - processing %i frames at a time (the maximum is %i)"
+                    % (plugin.name, nFrames, max_frames))
+    for pData in pData_list:
+        pData.plugin_data_setup(pData.get_pattern_name(), nFrames)
+
+
+def __get_frame_nbytes(pData):
+    """ The bytes in a frame of a dataset, including the padding of the core
+    dimensions, and the padding in the slice dimension (in frames).
+    """
+    data = pData.data_obj
+    shape = data.get_shape()
+    padding = data._get_padding_dict() if pData.padding else {}
+    dtype = data.dtype
+    if dtype is None:
+        dtype = getattr(data.data, 'dtype', np.float32)
+    nbytes = np.dtype(dtype).itemsize
+    for dim in pData.get_core_directions():
+        nbytes *= shape[dim] + 2*padding.get(dim, 0)
+    return nbytes, padding.get(pData.get_slice_directions()[0], 0)
+
+
+def __get_frame_counts(pData):
+    """ The number of frames in the main slice dimension and the number of
+    times it is repeated in the other slice dimensions.
+    """
+    shape = pData.data_obj.get_shape()
+    slice_dirs = pData.get_slice_directions()
+    return shape[slice_dirs[0]], int(np.prod([shape[d] for d in
+                                              slice_dirs[1:]]))
+
+
+def choose_frames(counts, nProcs, max_frames, frame_bytes, pad_frames,
+                  pad_bytes, budget):
+    """ Choose the number of frames in each slice group.
+
+    The slice groups of all processes must fit in the memory budget, and the
+    frames read to pad each slice group must not be more than
+    MAX_PAD_AMPLIFICATION times the frames processed where possible.  The
+    largest number of frames that fits gives the fewest slice groups for the
+    busiest process, and the smallest number of frames that gives the same
+    number of slice groups is chosen, which evens out the work of the
+    processes.
+
+    :param tuple(int) counts: the frames in the main slice dimension and the
+        number of times they are repeated.
+    :param int nProcs: the number of processes.
+    :param int max_frames: the plugin maximum.
+    :param int frame_bytes: the memory used for each frame.
+    :param int pad_frames: the padding in the main slice dimension.
+    :param int pad_bytes: the memory used for each padding frame.
+    :param float budget: the memory available for a slice group.
+    :returns: the number of frames.
+    :rtype: int
+    """
+    nMain, nRepeat = counts
+    upper = int((budget - 2*pad_frames*pad_bytes)/max(frame_bytes, 1))
+    upper = max(1, min(max_frames, nMain, upper))
+    lower = 1
+    if pad_frames:
+        lower = int(np.ceil(2*pad_frames/(MAX_PAD_AMPLIFICATION - 1)))
+        lower = min(lower, upper)
+
+    def busiest(nFrames):
+        groups = int(np.ceil(float(nMain)/nFrames))*nRepeat
+        return int(np.ceil(float(groups)/nProcs))
+
+    nFrames = upper
+    while nFrames > lower and busiest(nFrames - 1) == busiest(upper):
+        nFrames -= 1
+    logging.debug("Frames per slice group: %i (between %i and %i)", nFrames,
+                  lower, upper)
+    return nFrames
@@ -0,0 +1,169 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_pool
+   :platform: Unix
+   :synopsis: Strategies for processing several slice groups at the same \
+   time in a single process, using a pool of threads or of forked processes.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import collections
+import multiprocessing
+import numpy as np
+
+from multiprocessing.pool import ThreadPool
+
+# the function run by the forked worker processes, which inherit it from the
+# parent (bound methods can not be pickled in python 2)
+_function = None
+# the directory in shared memory that holds the frames and results of the
+# current map, which is removed when the map ends
+_directory = None
+
+
+class SerialPool(object):
+    """ Processes one slice group at a time. """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+
+    def map(self, function, items):
+        """ Yield ``function(item)`` for each item, in order. """
+        for item in items:
+            yield function(item)
+
+
+class ThreadFramePool(SerialPool):
+    """ Processes up to ``workers`` slice groups at the same time in a pool
+    of threads.  Only useful for plugins that release the GIL (numpy, scipy
+    and astra calls), which must also be safe to call from several threads.
+    """
+
+    def map(self, function, items):
+        """ Yield ``function(item)`` for each item, in the original order.
+        At most two items per worker are in progress at any time.
+        """
+        pool = ThreadPool(self.workers)
+        try:
+            for result in self._ordered(pool, function, items):
+                yield result
+        finally:
+            pool.terminate()
+
+    def _ordered(self, pool, function, items):
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.apply_async(function, (item,)))
+            if len(pending) >= 2*self.workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+class ProcessFramePool(ThreadFramePool):
+    """ Processes up to ``workers`` slice groups at the same time in a pool
+    of forked processes, for plugins that hold the GIL.  The frames and
+    results are handed over in files in shared memory (/dev/shm), rather
+    than pickled, and the plugin must not change its state in
+    ``process_frames`` (the changes are lost with the worker process).  The
+    files that are not consumed, after an error in a worker or when the pool
+    is terminated, are removed with the pool.
+    """
+
+    def map(self, function, items):
+        """ Yield ``function(item)`` for each item, in the original order.
+        """
+        global _function, _directory
+        _function = function
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        _directory = tempfile.mkdtemp(prefix='savu_frames_', dir=shm)
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for result in self._ordered(
+                    pool, _run_shared, (_share(item) for item in items)):
+                yield _load(result)
+        finally:
+            pool.terminate()
+            pool.join()
+            shutil.rmtree(_directory, ignore_errors=True)
+            _function = _directory = None
+
+
+def _run_shared(item):
+    return _share(_function(_load(item)))
+
+
+class _SharedArray(object):
+    """ Describes an array that is held in a file in shared memory. """
+
+    def __init__(self, array):
+        fd, self.filename = tempfile.mkstemp(suffix='.npy', dir=_directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+
+    def load(self):
+        """ Map the array into memory and remove the file. """
+        array = np.load(self.filename, mmap_mode='r+')
+        os.remove(self.filename)
+        return array
+
+
+def _share(obj):
+    """ Move the arrays in a (nested) list or tuple to shared memory. """
+    if isinstance(obj, np.ndarray):
+        return _SharedArray(obj)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)([_share(o) for o in obj])
+    return obj
+
+
+def _load(obj):
+    """ Reverse of _share. """
+    if isinstance(obj, _SharedArray):
+        return obj.load()
+    if isinstance(obj, (list, tuple)):
+        return type(obj)([_load(o) for o in obj])
+    return obj
+
+
+def get_frame_pool(kinds, workers, mpi=False):
+    """ Return the strategy for processing the slice groups of a plugin.
+
+    :param list(str) kinds: the type of pool supported by each plugin that is
+        run: 'thread', 'process' or None (one slice group at a time).
+    :param int workers: the number of slice groups to process at once.
+    :param bool mpi: True if this is an MPI process, which can not safely
+        fork a process pool.
+    """
+    if workers < 2 or None in kinds:
+        return SerialPool()
+    if 'process' in kinds:
+        if mpi:
+            logging.warn("A process pool can not be forked from an MPI "
+                         "process: processing one slice group at a time")
+            return SerialPool()
+        logging.debug("Processing %i slice groups at once in a process pool",
+                      workers)
+        return ProcessFramePool(workers)
+    logging.debug("Processing %i slice groups at once in a thread pool",
+                  workers)
+    return ThreadFramePool(workers)
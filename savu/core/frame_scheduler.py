@@ -0,0 +1,121 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_scheduler
+   :platform: Unix
+   :synopsis: Strategies for sharing the slice groups of a plugin between \
+   the processes, and reporting how evenly the work was shared.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import time
+import logging
+import numpy as np
+
+import savu.core.utils as cu
+
+
+class StaticScheduler(object):
+    """ Processes the slice groups that were assigned to this process before
+    the plugin started (a contiguous block of the slice list).
+    """
+
+    def __init__(self, nSlices, comm):
+        self.nSlices = nSlices
+        self.comm = comm
+        self.processed = 0
+        self.start = time.time()
+
+    def __iter__(self):
+        for count in range(self.nSlices):
+            self.processed += 1
+            yield count
+
+    def close(self, name):
+        """ Report the work done by each process.  This is collective over
+        the communicator.
+        """
+        elapsed = time.time() - self.start
+        logging.info("%s: processed %i slice groups in %.2fs", name,
+                     self.processed, elapsed)
+        if self.comm.size == 1:
+            return
+        stats = self.comm.gather((self.processed, elapsed), root=0)
+        if self.comm.rank == 0:
+            self.__report(name, stats)
+
+    def __report(self, name, stats):
+        groups, times = [np.array(s) for s in zip(*stats)]
+        imbalance = times.max()/times.mean() if times.mean() else 1.0
+        cu.user_message(
+            "%s - %i-%i slice groups and %.1f-%.1fs per process "
+            "(load imbalance %.2f)" % (name, groups.min(), groups.max(),
+                                       times.min(), times.max(), imbalance))
+
+
+class DynamicScheduler(StaticScheduler):
+    """ Each process takes the next slice group from a counter shared by all
+    processes, when it is ready for more work, so that slow frames do not hold
+    up the processes with fast ones.  The counter is held by the first
+    process and incremented with an MPI one-sided atomic fetch and add.
+    """
+
+    def __init__(self, nSlices, comm):
+        super(DynamicScheduler, self).__init__(nSlices, comm)
+        itemsize = cu.MPI.INT64_T.Get_size()
+        self.window = cu.MPI.Win.Allocate(
+            itemsize if comm.rank == 0 else 0, itemsize, comm=comm)
+        if comm.rank == 0:
+            self.window.Lock(0, cu.MPI.LOCK_EXCLUSIVE)
+            np.frombuffer(self.window.tomemory(), dtype=np.int64)[0] = 0
+            self.window.Unlock(0)
+        comm.Barrier()
+
+    def __iter__(self):
+        one = np.ones(1, dtype=np.int64)
+        count = np.zeros(1, dtype=np.int64)
+        while True:
+            self.window.Lock(0, cu.MPI.LOCK_SHARED)
+            self.window.Fetch_and_op(one, count, 0, 0, cu.MPI.SUM)
+            self.window.Unlock(0)
+            if count[0] >= self.nSlices:
+                return
+            self.processed += 1
+            yield int(count[0])
+
+    def close(self, name):
+        """ Free the shared counter and report the work done by each process.
+        This is collective over the communicator.
+        """
+        self.comm.Barrier()
+        self.window.Free()
+        super(DynamicScheduler, self).close(name)
+
+
+def get_scheduler(nSlices, comm, scheduler='static'):
+    """ Return the strategy that shares the slice groups of a plugin between
+    the processes.
+
+    :param int nSlices: the number of slice groups in the slice list of this
+        process (all slice groups for the dynamic scheduler).
+    :param Intracomm comm: the processes running the plugin.
+    :param str scheduler: 'static' or 'dynamic'.
+    """
+    if scheduler == 'dynamic' and comm.size > 1:
+        logging.debug("Sharing %i slice groups dynamically", nSlices)
+        return DynamicScheduler(nSlices, comm)
+    return StaticScheduler(nSlices, comm)
@@ -0,0 +1,286 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: io_pipeline
+   :platform: Unix
+   :synopsis: Readers and writers that move slice groups between the backing \
+   files and a plugin, either in line or in background threads.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import sys
+import logging
+import threading
+import Queue
+import numpy as np
+
+
+class BufferLimit(object):
+    """ Limits the total number of bytes held in a read or write queue.
+
+    A request larger than the limit is granted when nothing else is held, so a
+    single oversized slice group can never deadlock the pipeline.
+    """
+
+    def __init__(self, nbytes):
+        self.limit = nbytes
+        self.held = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, nbytes):
+        """ Block until ``nbytes`` can be held within the limit. """
+        with self.condition:
+            while self.held and (self.held + nbytes) > self.limit:
+                self.condition.wait()
+            self.held += nbytes
+
+    def release(self, nbytes):
+        """ Return ``nbytes`` to the pool. """
+        with self.condition:
+            self.held -= nbytes
+            self.condition.notify_all()
+
+
+class BufferPool(object):
+    """ Output buffers for the slice groups of a plugin, which are reused
+    once the slice group they were lent for has been written.
+    """
+
+    def __init__(self):
+        self.free = {}
+        self.lent = {}
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def get(self, count, shape, dtype):
+        """ Lend a buffer of ``shape`` and ``dtype`` for slice group
+        ``count``.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            free = self.free.get(key, [])
+            if free:
+                array = free.pop()
+            else:
+                array = np.empty(*key)
+                self.created += 1
+            self.lent.setdefault(count, []).append((key, array))
+        return array
+
+    def release(self, count):
+        """ Return the buffers lent for slice group ``count``. """
+        with self.lock:
+            for key, array in self.lent.pop(count, []):
+                self.free.setdefault(key, []).append(array)
+
+    def close(self):
+        logging.debug("Created %i output buffers", self.created)
+        self.free = {}
+        self.lent = {}
+
+
+def get_nbytes(arrays):
+    """ Total size in bytes of an array or a (nested) list of arrays. """
+    if isinstance(arrays, list):
+        return sum([get_nbytes(a) for a in arrays])
+    return getattr(arrays, 'nbytes', 0)
+
+
+class FrameReader(object):
+    """ Reads slice groups in line, as they are requested. """
+
+    def __init__(self, get_frames, indices):
+        self.get_frames = get_frames
+        self.indices = indices
+
+    def __iter__(self):
+        """ Yield the slice group index and the (padded data, slice list) for
+        each slice group in turn.
+        """
+        for count in self.indices:
+            yield count, self.get_frames(count)
+
+    def close(self):
+        pass
+
+
+class ReadAheadReader(FrameReader):
+    """ Reads slice groups in a background thread, up to ``depth`` groups
+    ahead of the slice group currently being processed.
+    """
+
+    def __init__(self, get_frames, indices, depth, limit):
+        super(ReadAheadReader, self).__init__(get_frames, indices)
+        self.limit = limit
+        self.queue = Queue.Queue(maxsize=depth)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.__read, name='read_ahead')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __read(self):
+        try:
+            for count in self.indices:
+                if self.stop.is_set():
+                    return
+                frames = self.get_frames(count)
+                nbytes = get_nbytes(frames[0])
+                self.limit.acquire(nbytes)
+                self.queue.put((count, frames, nbytes))
+        except Exception:
+            self.queue.put((None, None, sys.exc_info()))
+            return
+        self.queue.put((None, None, None))
+
+    def __iter__(self):
+        """ Yield the prefetched slice groups, in the order they were read.
+        """
+        while True:
+            count, frames, info = self.queue.get()
+            if frames is None:
+                if info is not None:
+                    raise info[0], info[1], info[2]
+                return
+            self.limit.release(info)
+            yield count, frames
+
+    def close(self):
+        """ Stop the reader thread, discarding anything not yet consumed. """
+        self.stop.set()
+        while self.thread.is_alive() or not self.queue.empty():
+            try:
+                count, frames, info = self.queue.get(timeout=0.1)
+                if frames is not None:
+                    self.limit.release(info)
+            except Queue.Empty:
+                pass
+        self.thread.join()
+
+
+class FrameWriter(object):
+    """ Writes slice groups in line, as soon as they are processed. """
+
+    def __init__(self, set_frames):
+        self.set_frames = set_frames
+
+    def put(self, count, result):
+        """ Write the plugin result for slice group ``count``. """
+        self.set_frames(count, result)
+
+    def close(self):
+        pass
+
+
+class WriteBehindWriter(FrameWriter):
+    """ Writes slice groups in a background thread, holding at most ``depth``
+    processed slice groups that are waiting to be written.
+
+    The plugin must return new arrays from ``process_frames`` (not buffers it
+    re-uses on the next call), as the results are written after the next
+    slice group has started processing.
+    """
+
+    def __init__(self, set_frames, depth, limit):
+        super(WriteBehindWriter, self).__init__(set_frames)
+        self.limit = limit
+        self.queue = Queue.Queue(maxsize=depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.__write,
+                                       name='write_behind')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __write(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            count, result, nbytes = item
+            try:
+                if self.error is None:
+                    self.set_frames(count, result)
+            except Exception:
+                self.error = sys.exc_info()
+            finally:
+                self.limit.release(nbytes)
+
+    def put(self, count, result):
+        """ Queue the plugin result for slice group ``count`` to be written.
+        """
+        self.__check_error()
+        nbytes = get_nbytes(result)
+        self.limit.acquire(nbytes)
+        self.queue.put((count, result, nbytes))
+
+    def close(self):
+        """ Wait for all queued slice groups to be written. """
+        self.queue.put(None)
+        self.thread.join()
+        self.__check_error()
+
+    def __check_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+
+
+def get_buffer_limits(nbytes, read_ahead, write_behind):
+    """ Split a memory limit between the read ahead and write behind queues.
+
+    The reader and the writer each have their own limit: with a shared limit
+    the frame loop can block in the writer, waiting for bytes that only its
+    own next read would release.
+
+    :param int nbytes: the memory limit for both queues.
+    :param int read_ahead: the read ahead depth (0 if reading in line).
+    :param int write_behind: the write behind depth (0 if writing in line).
+    :returns: the limits of the reader and the writer
+    :rtype: BufferLimit, BufferLimit
+    """
+    if read_ahead and write_behind:
+        nbytes /= 2.
+    return BufferLimit(nbytes), BufferLimit(nbytes)
+
+
+def get_frame_reader(get_frames, indices, depth, limit):
+    """ Return a reading strategy for the plugin frame loop.
+
+    :param function get_frames: returns the (padded data, slice list) for a
+        slice group index.
+    :param iterable indices: the slice group indices to read, in order.
+    :param int depth: the number of slice groups to read ahead (0 to read in
+        line).
+    :param BufferLimit limit: memory limit for the buffered data.
+    """
+    if depth > 0:
+        logging.debug("Reading up to %i slice groups ahead", depth)
+        return ReadAheadReader(get_frames, indices, depth, limit)
+    return FrameReader(get_frames, indices)
+
+
+def get_frame_writer(set_frames, depth, limit):
+    """ Return a writing strategy for the plugin frame loop.
+
+    :param function set_frames: writes the result for a slice group index.
+    :param int depth: the number of processed slice groups that may wait to be
+        written (0 to write in line).
+    :param BufferLimit limit: memory limit for the buffered data.
+    """
+    if depth > 0:
+        logging.debug("Writing up to %i slice groups behind", depth)
+        return WriteBehindWriter(set_frames, depth, limit)
+    return FrameWriter(set_frames)
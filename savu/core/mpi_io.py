@@ -0,0 +1,116 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: mpi_io
+   :platform: Unix
+   :synopsis: The MPI-IO hints used to open hdf5 files with the mpio driver, \
+   and whether writes are collective.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import h5py
+
+import savu.core.utils as cu
+
+# named sets of ROMIO hints, chosen with the mpi_hints option
+HINT_PROFILES = {
+    # data sieving off, as the files have always been opened
+    'default': {'romio_ds_read': 'disable', 'romio_ds_write': 'disable'},
+    # the MPI library defaults
+    'none': {},
+    # two-phase i/o through aggregator processes
+    'collective': {'romio_ds_read': 'disable', 'romio_ds_write': 'disable',
+                   'romio_cb_read': 'enable', 'romio_cb_write': 'enable'},
+    # new files in 4 MB stripes, which the aggregators write whole (set the
+    # number of stripes with mpi_hint striping_factor=n)
+    'lustre': {'romio_ds_read': 'disable', 'romio_ds_write': 'disable',
+               'romio_cb_write': 'enable', 'striping_unit': '4194304',
+               'cb_buffer_size': '4194304'},
+    # aggregator buffers of the block size of the file system
+    'gpfs': {'romio_ds_read': 'disable', 'romio_ds_write': 'disable',
+             'romio_cb_write': 'enable', 'cb_buffer_size': '16777216'},
+}
+
+
+def get_hints(options):
+    """ The hints of the ``mpi_hints`` profile, updated with the
+    ``mpi_hint`` options (each 'key=value').
+
+    :rtype: dict
+    """
+    profile = options.get('mpi_hints', 'default')
+    if profile not in HINT_PROFILES:
+        raise ValueError("Unknown MPI-IO hint profile %s (choose from %s)"
+                         % (profile, ', '.join(sorted(HINT_PROFILES))))
+    hints = dict(HINT_PROFILES[profile])
+    for hint in options.get('mpi_hint', None) or []:
+        if '=' not in hint:
+            raise ValueError("MPI-IO hints are 'key=value', not %s" % hint)
+        key, value = hint.split('=', 1)
+        hints[key.strip()] = value.strip()
+    return hints
+
+
+def get_info(options):
+    """ An MPI.Info object holding the hints for opening a file. """
+    info = cu.MPI.Info.Create()
+    for key, value in sorted(get_hints(options).items()):
+        info.Set(key, value)
+    logging.debug("MPI-IO hints %s", get_hints(options))
+    return info
+
+
+def use_collective_writes(options, communicator):
+    """ Whether the slice groups are written with collective operations.
+    Every process that opened the file must take part in each write, so the
+    slice groups must be shared out up front to all of the processes, and
+    h5py must be built with MPI.
+    """
+    return __use_collective_writes(options, communicator.size, True)
+
+
+def compress_shared_files(options, nProcs):
+    """ Whether the datasets in a file shared by the processes can be
+    compressed.  Parallel hdf5 (from version 1.10.2) only writes compressed
+    datasets with collective operations.
+
+    :param int nProcs: the number of processes that run the plugin.
+    """
+    if not options.get('mpi', False):
+        return True
+    return h5py.version.hdf5_version_tuple >= (1, 10, 2) and \
+        __use_collective_writes(options, nProcs, False)
+
+
+def __use_collective_writes(options, nProcs, warn):
+    if not options.get('collective_writes', False) or \
+            not options.get('mpi', False):
+        return False
+    log = logging.warn if warn else logging.debug
+    if options.get('per_rank_files', False):
+        log("Each process writes to its own files: writing independently.")
+        return False
+    if not h5py.get_config().mpi:
+        log("h5py is not built with MPI: writing independently.")
+        return False
+    if options.get('scheduler', 'static') == 'dynamic' or \
+            nProcs != cu.COMM_WORLD.size:
+        log("Collective writes need all processes to have their slice "
+            "groups up front: writing independently.")
+        return False
+    return True
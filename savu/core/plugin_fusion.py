@@ -0,0 +1,141 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: plugin_fusion
+   :platform: Unix
+   :synopsis: Finds runs of adjacent plugins that can be processed in a \
+   single pass over the data, passing the frames between them in memory.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+
+import savu.core.utils as cu
+
+
+def set_fused_plugins(exp):
+    """ Find the plugins to be run together and the datasets that are passed
+    between them without being saved.
+
+    Plugins are only fused if the ``fusion`` option is set.  Two adjacent
+    plugins are fused if the second processes the only output
+    of the first, in the same pattern and with the same number of frames, and
+    that dataset is not used again.  The results are added to the experiment
+    metadata as ``fused_plugins`` (a list of lists of plugin indices) and
+    ``unsaved_datasets`` (a dictionary of dataset names for each plugin
+    index).
+
+    :param Experiment exp: The current experiment, after the plugin list
+        check.
+    """
+    expInfo = exp.meta_data
+    plugin_list = expInfo.plugin_list
+    n_loaders = plugin_list._get_n_loaders()
+    datasets_list = plugin_list._get_datasets_list()
+    names = [p['name'] for p in plugin_list.plugin_list]
+
+    groups = []
+    if datasets_list:
+        groups.append([0])
+    fusion = expInfo.get_dictionary().get('fusion', False)
+    for i in range(1, len(datasets_list)):
+        reason = __get_reason_not_to_fuse(datasets_list, i-1) if fusion \
+            else "plugin fusion is switched off"
+        if reason is None:
+            groups[-1].append(i)
+        else:
+            logging.info("Not fusing %s and %s: %s", names[i-1+n_loaders],
+                         names[i+n_loaders], reason)
+            groups.append([i])
+
+    fused = []
+    unsaved = {}
+    for group in [g for g in groups if len(g) > 1]:
+        fused.append([i + n_loaders for i in group])
+        for i in group[:-1]:
+            unsaved[i + n_loaders] = \
+                [datasets_list[i]['out_datasets'][0]['name']]
+        cu.user_message("Fusing the %s plugins into a single pass" %
+                        ', '.join([names[i] for i in fused[-1]]))
+
+    expInfo.set_meta_data('fused_plugins', fused)
+    expInfo.set_meta_data('unsaved_datasets', unsaved)
+
+
+def __get_reason_not_to_fuse(datasets_list, idx):
+    """ Check if plugin ``idx`` can pass its output to plugin ``idx+1`` in
+    memory.
+
+    :returns: The reason the plugins can not be fused, or None.
+    :rtype: str
+    """
+    first, second = datasets_list[idx], datasets_list[idx+1]
+    if len(first['in_datasets']) != 1 or len(first['out_datasets']) != 1 \
+            or len(second['in_datasets']) != 1 \
+            or len(second['out_datasets']) != 1:
+        return "fusion requires a single input and output dataset"
+    out_data = first['out_datasets'][0]
+    in_data = second['in_datasets'][0]
+    if out_data['name'] != in_data['name']:
+        return "the output dataset is not the next input dataset"
+    if out_data['pattern'] != in_data['pattern']:
+        return "the patterns or number of frames differ"
+    if out_data['shape'] != in_data['shape'] or in_data['preview'] or \
+            'var' in in_data['shape']:
+        return "the data is previewed or reshaped"
+    if in_data['padding']:
+        return "the input data is padded"
+    if first['driver'] != 'cpu' or second['driver'] != 'cpu':
+        return "only cpu plugins can be fused"
+    if first['tuning'] or second['tuning']:
+        return "parameter tuning is not supported"
+    if first['post_process']:
+        return "the first plugin has a post_process step"
+    if __is_used_later(datasets_list, idx+2, out_data['name']):
+        return "the dataset is used by a later plugin"
+    return None
+
+
+def __is_used_later(datasets_list, start, name):
+    """ Is the dataset ``name`` an input to any plugin from index ``start``,
+    before it is replaced?
+    """
+    for entry in datasets_list[start:]:
+        if name in [d['name'] for d in entry['in_datasets']]:
+            return True
+        if name in [d['name'] for d in entry['out_datasets']]:
+            return False
+    return False
+
+
+def get_fused_plugins(exp, idx):
+    """ Get the indices of the plugins that run in a single pass with plugin
+    ``idx`` (which must be the first in the group).
+
+    :returns: plugin indices
+    :rtype: list(int)
+    """
+    for group in exp.meta_data.get_dictionary().get('fused_plugins', []):
+        if group[0] == idx:
+            return group
+    return [idx]
+
+
+def is_saved(exp, idx, name):
+    """ Is the output dataset ``name`` of plugin ``idx`` saved? """
+    unsaved = exp.meta_data.get_dictionary().get('unsaved_datasets', {})
+    return name not in unsaved.get(idx, [])
@@ -24,6 +24,8 @@
 import logging
 
 import savu.core.utils as cu
+import savu.core.estimate as estimate
+import savu.core.trace as trace
 import savu.plugins.utils as pu
 from savu.data.experiment_collection import Experiment
 
@@ -44,15 +46,22 @@ class PluginRunner(object):
         """ Create an experiment and run the plugin list.
         """
         self.exp = Experiment(self.options)
+        if self.options.get('trace', False):
+            trace.start()
         plugin_list = self.exp.meta_data.plugin_list.plugin_list
 
         logging.info("run_plugin_list: 1")
         self.exp._barrier()
         self._run_plugin_list_check(plugin_list)
 
+        expInfo = self.exp.meta_data
+        if expInfo.get_dictionary().get('estimate', False):
+            estimate.report(self.exp)
+            self.exp.nxs_file.close()
+            return self.exp
+
         logging.info("run_plugin_list: 2")
         self.exp._barrier()
-        expInfo = self.exp.meta_data
         logging.debug("Running process List.save_list_to_file")
         expInfo.plugin_list._save_plugin_list(
             expInfo.get_meta_data("nxs_filename"), exp=self.exp)
@@ -63,6 +72,7 @@ class PluginRunner(object):
 
         logging.info("run_plugin_list: 4")
         self.exp._barrier()
+        trace.close(self.exp)
 
         cu.user_message("***********************")
         cu.user_message("* Processing Complete *")
@@ -0,0 +1,211 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: trace
+   :platform: Unix
+   :synopsis: Records the time spent reading, processing and writing the \
+   data in each process, as Chrome trace events, and summarises them for \
+   each plugin.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+
+import savu.core.utils as cu
+
+# the events of this process, or None if tracing is switched off
+_events = None
+_start = 0
+
+
+class _Span(object):
+    """ A traced section of code, recorded as a complete event when it
+    exits.
+    """
+
+    def __init__(self, name, plugin, args):
+        self.event = {'name': name, 'cat': plugin, 'ph': 'X',
+                      'pid': cu.COMM_WORLD.rank, 'args': args}
+
+    def set(self, **kwargs):
+        """ Add values (e.g. bytes, frames) to the event. """
+        self.event['args'].update(kwargs)
+
+    def set_plugin(self, plugin):
+        """ Set the plugin, if it is not known until the span has started
+        (e.g. while it is loaded).
+        """
+        self.event['cat'] = plugin
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        end = time.time()
+        self.event['ts'] = (self.start - _start)*1e6
+        self.event['dur'] = (end - self.start)*1e6
+        self.event['tid'] = threading.current_thread().ident
+        _events.append(self.event)
+
+
+class _NullSpan(object):
+    """ Used in place of a span when tracing is switched off. """
+
+    def set(self, **kwargs):
+        pass
+
+    def set_plugin(self, plugin):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+def start():
+    """ Switch tracing on. """
+    global _events, _start
+    _events = []
+    _start = time.time()
+
+
+def stop():
+    """ Switch tracing off and return the events. """
+    global _events
+    events, _events = _events, None
+    return events
+
+
+def is_enabled():
+    return _events is not None
+
+
+def span(name, plugin, **kwargs):
+    """ Trace a section of code (use in a with statement).
+
+    :param str name: the type of event: 'setup', 'read', 'process',
+        'write', 'barrier', 'pre_process' or 'post_process'.
+    :param str plugin: the name of the plugin (or plugins) being run.
+    :keyword: values to add to the event (e.g. bytes, frames).
+    """
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, plugin, kwargs)
+
+
+def summarise(events):
+    """ Total the time, bytes and frames of each type of event, for each
+    plugin.
+
+    :returns: {plugin: {name: [time, bytes, frames]}}, including the elapsed
+        time of each plugin, from its first event after setup to its last,
+        as 'elapsed'.
+    :rtype: dict
+    """
+    summary = {}
+    extent = {}
+    for event in events:
+        plugin = summary.setdefault(event['cat'], {})
+        totals = plugin.setdefault(event['name'], [0.0, 0, 0])
+        totals[0] += event['dur']/1e6
+        totals[1] += event['args'].get('bytes', 0)
+        totals[2] += event['args'].get('frames', 0)
+        if event['name'] == 'setup':
+            # the plugins are all set up before the first one is run
+            continue
+        start, end = extent.get(event['cat'], (event['ts'], event['ts']))
+        extent[event['cat']] = (min(start, event['ts']),
+                                max(end, event['ts'] + event['dur']))
+    for plugin, (start, end) in extent.iteritems():
+        summary[plugin]['elapsed'] = [(end - start)/1e6, 0, 0]
+    for plugin in set(summary) - set(extent):
+        summary[plugin]['elapsed'] = [0.0, 0, 0]
+    return summary
+
+
+def _get_table(summaries):
+    """ Merge the summaries of all processes into a row for each plugin.
+
+    :returns: {plugin: {column: value}}
+    :rtype: dict
+    """
+    def total(summary, name, idx):
+        return summary.get(name, [0, 0, 0])[idx]
+
+    table = {}
+    for plugin in set([p for s in summaries for p in s]):
+        rows = [s.get(plugin, {}) for s in summaries]
+        elapsed = max([total(r, 'elapsed', 0) for r in rows])
+        busy = np.array([total(r, 'elapsed', 0) - total(r, 'barrier', 0)
+                         for r in rows])
+        read_time = sum([total(r, 'read', 0) for r in rows])
+        write_time = sum([total(r, 'write', 0) for r in rows])
+        frames = sum([total(r, 'process', 2) for r in rows])
+        table[plugin] = {
+            'elapsed': elapsed,
+            'frames_per_second': frames/elapsed if elapsed else 0.0,
+            'read_bandwidth': sum([total(r, 'read', 1) for r in rows]) /
+            read_time if read_time else 0.0,
+            'write_bandwidth': sum([total(r, 'write', 1) for r in rows]) /
+            write_time if write_time else 0.0,
+            'setup_time': sum([total(r, 'setup', 0) for r in rows]),
+            'process_time': sum([total(r, 'process', 0) for r in rows]),
+            'read_time': read_time, 'write_time': write_time,
+            'barrier_time': sum([total(r, 'barrier', 0) for r in rows]),
+            'imbalance': busy.max()/busy.mean() if busy.mean() else 1.0}
+    return table
+
+
+def close(exp):
+    """ Switch tracing off, write the events of this process to
+    trace_<rank>.json in the log folder, and add a summary table for each
+    plugin to the nexus file.  This is collective.
+    """
+    events = stop()
+    if events is None:
+        return
+    comm = cu.COMM_WORLD
+    filename = os.path.join(exp.meta_data.get_meta_data('log_path'),
+                            'trace_%03i.json' % comm.rank)
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    logging.debug("Written %i trace events to %s", len(events), filename)
+
+    table = _get_table(comm.allgather(summarise(events)))
+    entry = exp.nxs_file['entry'].require_group('trace')
+    entry.attrs['NX_class'] = 'NXcollection'
+    for plugin in sorted(table.keys()):
+        group = entry.create_group(plugin)
+        group.attrs['NX_class'] = 'NXcollection'
+        for key, value in sorted(table[plugin].items()):
+            group.create_dataset(key, data=value)
+        cu.user_message(
+            "%s - %.1f frames/s, read %.1f MB/s, write %.1f MB/s, load "
+            "imbalance %.2f" % (plugin, table[plugin]['frames_per_second'],
+                                table[plugin]['read_bandwidth']/1e6,
+                                table[plugin]['write_bandwidth']/1e6,
+                                table[plugin]['imbalance']))
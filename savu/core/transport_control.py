@@ -45,9 +45,24 @@ class TransportControl(object):
         raise NotImplementedError("transport_run_plugin_list needs to be "
                                   "implemented in %s", self.__class__)
 
-    def _process(self, plugin):
+    def _transport_pre_plugin(self, plugins):
         """
-        A function to process the plugin, including the passing of data frames.
+        Any data preparation required, by all processes, before the plugins
+        are run (in a single pass).
+        """
+        pass
+
+    def _transport_post_plugin(self, plugins):
+        """
+        Any tidying up required, by all processes, after the plugins have
+        run.
+        """
+        pass
+
+    def _process(self, plugin, communicator):
+        """
+        A function to process the plugin, including the passing of data frames,
+        shared between the processes in the communicator.
         """
         raise NotImplementedError("process needs to be implemented in  %s",
                                   self.__class__)
@@ -0,0 +1,92 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+.. module:: dist_array_transport
+   :platform: Unix
+   :synopsis: Transport that keeps intermediate datasets in the memory of the \
+   processes as distributed arrays, redistributing them between plugins.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+
+from savu.core.transports.hdf5_transport import Hdf5Transport
+from savu.plugins.driver.gpu_plugin import GpuPlugin
+
+
+class DistArrayTransport(Hdf5Transport):
+    """ Passes the data to and from the plugins in the same way as the hdf5
+    transport, but intermediate datasets are distributed arrays (see
+    DistArrayTransportData): each process keeps the frames it wrote in
+    memory and, before each plugin, the processes exchange the blocks that
+    the plugin reads.  Only final results are saved to hdf5 files.
+    """
+
+    def _transport_control_setup(self, options):
+        """ Fill the options dictionary with MPI related values.  Each
+        process must read a fixed part of the data, so slice groups are not
+        shared dynamically.
+        """
+        super(DistArrayTransport, self)._transport_control_setup(options)
+        if options.get('scheduler', 'static') != 'static':
+            logging.warn("The dist_array transport requires the static "
+                         "scheduler.")
+            options['scheduler'] = 'static'
+        self.__read_data = []
+
+    def _transport_pre_plugin(self, plugins):
+        """ Allocate the distributed output datasets and fetch the part of
+        each distributed input dataset that this process reads.  This is
+        collective.
+        """
+        for plugin in plugins:
+            for data in plugin.get_out_datasets():
+                if data._is_distributed():
+                    data._allocate(self.__get_slice_list(plugin, data))
+
+        # only the first plugin reads from the datasets
+        for data in plugins[0].get_in_datasets():
+            if data._is_distributed():
+                data._gather(self.__get_slice_list(plugins[0], data))
+                self.__read_data.append(data)
+
+    def _transport_post_plugin(self, plugins):
+        """ Remove the parts of the input datasets that were fetched. """
+        for data in self.__read_data:
+            if data._is_distributed():
+                data.data.release()
+        self.__read_data = []
+
+    def __get_slice_list(self, plugin, data):
+        """ Get the slice list of a dataset for this process, when running
+        the plugin.  GPU plugins only run on the GPU processes.
+        """
+        expInfo = self.exp.meta_data
+        if not self.mpi or not isinstance(plugin, GpuPlugin):
+            return data._get_slice_list_per_process(expInfo)
+
+        processes = expInfo.get_meta_data('processes')
+        process = expInfo.get_meta_data('process')
+        gpus = [i for i in range(len(processes)) if 'GPU' in processes[i]]
+        if process not in gpus:
+            return []
+        expInfo.set_meta_data('processes', [processes[i] for i in gpus])
+        expInfo.set_meta_data('process', gpus.index(process))
+        try:
+            return data._get_slice_list_per_process(expInfo)
+        finally:
+            expInfo.set_meta_data('processes', processes)
+            expInfo.set_meta_data('process', process)
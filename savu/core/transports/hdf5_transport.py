@@ -27,11 +27,18 @@ import os
 import copy
 import numpy as np
 
-from mpi4py import MPI
 from itertools import chain
 from savu.core.transport_control import TransportControl
 import savu.plugins.utils as pu
 import savu.core.utils as cu
+import savu.core.io_pipeline as iop
+import savu.core.plugin_fusion as fusion
+import savu.core.frame_scheduler as fs
+import savu.core.frame_pool as fp
+import savu.core.trace as trace
+import savu.core.mpi_io as mpi_io
+import savu.data.transport_data.chunk_cache as cc
+import savu.data.transport_data.local_tier as lt
 
 
 class Hdf5Transport(TransportControl):
@@ -59,8 +66,8 @@ class Hdf5Transport(TransportControl):
         """
         print("Running mpi_setup")
         RANK_NAMES = options["process_names"].split(',')
-        RANK = MPI.COMM_WORLD.rank
-        SIZE = MPI.COMM_WORLD.size
+        RANK = cu.COMM_WORLD.rank
+        SIZE = cu.COMM_WORLD.size
         RANK_NAMES_SIZE = len(RANK_NAMES)
         if RANK_NAMES_SIZE > SIZE:
             RANK_NAMES_SIZE = SIZE
@@ -77,7 +84,7 @@ class Hdf5Transport(TransportControl):
                                    MACHINE_RANK_NAME,
                                    options)
 
-        MPI.COMM_WORLD.barrier()
+        cu.COMM_WORLD.barrier()
         logging.debug("Rank : %i - Size : %i - host : %s", RANK, SIZE,
                       socket.gethostname())
         IP = socket.gethostbyname(socket.gethostname())
@@ -90,7 +97,7 @@ class Hdf5Transport(TransportControl):
         """ Call MPI _barrier before an experiment is created.
         """
         logging.debug("Waiting at the _barrier")
-        MPI.COMM_WORLD.barrier()
+        cu.COMM_WORLD.barrier()
 
     def __get_log_level(self, options):
         """ Gets the right log level for the flags -v or -q
@@ -129,7 +136,7 @@ class Hdf5Transport(TransportControl):
         # a lot of output, just a summary, but we want the user messages
         # tagged in all rank processes
         cu.add_user_log_level()
-        if MPI.COMM_WORLD.rank == 0:
+        if cu.COMM_WORLD.rank == 0:
             logging.getLogger()
             cu.add_user_log_handler(logging.getLogger(),
                                     os.path.join(options["out_path"],
@@ -143,11 +150,16 @@ class Hdf5Transport(TransportControl):
         plugin_obj = exp.meta_data.plugin_list
         n_loaders = plugin_obj._get_n_loaders()
         plugin_list = exp.meta_data.plugin_list.plugin_list
+        fusion.set_fused_plugins(exp)
+        exp.local_tier = lt.get_local_tier(exp.meta_data.get_dictionary())
 
         for i in range(n_loaders):
             pu.plugin_loader(exp, plugin_list[i])
 
         start = n_loaders
+        if exp.meta_data.get_dictionary().get('resume', False):
+            in_data = exp.index["in_data"][exp.index["in_data"].keys()[0]]
+            start = in_data._resume_data(start)
         stop = 0
         n_plugins = len(plugin_list) - 1  # minus 1 for saver
 
@@ -164,71 +176,455 @@ class Hdf5Transport(TransportControl):
 
         for key in exp.index["in_data"].keys():
             exp.index["in_data"][key]._close_file()
+        if exp.local_tier is not None:
+            exp.local_tier.close(exp.nxs_file)
 
         return
 
     def __real_plugin_run(self, plugin_list, out_data_objs, start, stop):
+        """ Execute the plugins, running each group of fused plugins in a
+        single pass.
+        """
+        i = start
+        while i < stop:
+            group = fusion.get_fused_plugins(self.exp, i)
+            if len(group) > 1:
+                self.__run_fused_plugins(plugin_list, out_data_objs, start,
+                                         group)
+            else:
+                self.__run_plugin(plugin_list, out_data_objs, start, i)
+            i = group[-1] + 1
+
+    def __run_plugin(self, plugin_list, out_data_objs, start, i):
         """ Execute the plugin.
         """
         exp = self.exp
-        for i in range(start, stop):
-            link_type = "final_result" if i is len(plugin_list)-2 else \
-                "intermediate"
+        exp._barrier()
+        self.__set_out_data_objects(out_data_objs[i - start])
 
-            exp._barrier()
+        exp._barrier()
+        with trace.span('setup', plugin_list[i]['id']) as span:
+            plugin = pu.plugin_loader(exp, plugin_list[i])
+            span.set_plugin(plugin.name)
 
-            for key in out_data_objs[i - start]:
-                exp.index["out_data"][key] = out_data_objs[i - start][key]
+        exp._barrier()
+        cu.user_message("*Running the %s plugin*" % (plugin_list[i]['id']))
+        self._transport_pre_plugin([plugin])
+        plugin._run_plugin(exp, self)
+        self._transport_post_plugin([plugin])
 
-            exp._barrier()
-            plugin = pu.plugin_loader(exp, plugin_list[i])
+        exp._barrier()
+        self.__finalise_plugin(plugin, plugin_list, i)
 
+    def __run_fused_plugins(self, plugin_list, out_data_objs, start, group):
+        """ Execute a group of plugins in a single pass over the data, where
+        each plugin passes its output frames to the next plugin in memory.
+        """
+        exp = self.exp
+        in_data = exp.index["in_data"].copy()
+        plugins = []
+        for i in group:
             exp._barrier()
-            cu.user_message("*Running the %s plugin*" % (plugin_list[i]['id']))
-            plugin._run_plugin(exp, self)
+            self.__set_out_data_objects(out_data_objs[i - start])
 
             exp._barrier()
-            if self.mpi:
-                cu.user_messages_from_all(plugin.name,
-                                          plugin.executive_summary())
-            else:
-                for message in plugin.executive_summary():
-                    cu.user_message("%s - %s" % (plugin.name, message))
-
+            with trace.span('setup', plugin_list[i]['id']) as span:
+                plugin = pu.plugin_loader(exp, plugin_list[i])
+                span.set_plugin(plugin.name)
+            plugin._copy_meta_data()
+            plugins.append(plugin)
+
+            # the output becomes the input to the next plugin
+            for key, data in exp.index["out_data"].iteritems():
+                exp.index["in_data"][key] = copy.deepcopy(data)
+            exp.index["out_data"] = {}
+        exp.index["in_data"] = in_data
+
+        exp._barrier()
+        cu.user_message("*Running the %s plugins in a single pass*" %
+                        (', '.join([plugin_list[i]['id'] for i in group])))
+        self._transport_pre_plugin(plugins)
+        for plugin in plugins:
+            logging.info("%s.%s", plugin.__class__.__name__, 'pre_process')
+            with trace.span('pre_process', plugin.name):
+                plugin.pre_process()
+
+        self._process_plugins(plugins)
+
+        # the events of the single pass are traced under the joined names
+        with trace.span('barrier', '+'.join([p.name for p in plugins])):
+            exp._barrier()
+        for plugin in plugins:
+            logging.info("%s.%s", plugin.__class__.__name__, 'post_process')
+            with trace.span('post_process', plugin.name):
+                plugin.post_process()
+            for data in plugin.get_out_datasets():
+                if data.data is not None:
+                    data.set_shape(data.data.shape)
+        self._transport_post_plugin(plugins)
+        for plugin in plugins:
+            plugin._clean_up()
+
+        for i, plugin in zip(group, plugins):
             exp._barrier()
-            out_datasets = plugin.parameters["out_datasets"]
-            exp._reorganise_datasets(out_datasets, link_type)
+            self.__set_out_data_objects(out_data_objs[i - start])
+            self.__finalise_plugin(plugin, plugin_list, i)
+
+    def __set_out_data_objects(self, out_data_objs):
+        for key in out_data_objs:
+            self.exp.index["out_data"][key] = out_data_objs[key]
+
+    def __finalise_plugin(self, plugin, plugin_list, i):
+        """ Report the plugin summary and move the output datasets to the
+        input datasets.
+        """
+        exp = self.exp
+        link_type = "final_result" if i is len(plugin_list)-2 else \
+            "intermediate"
+
+        if self.mpi:
+            cu.user_messages_from_all(plugin.name,
+                                      plugin.executive_summary())
+        else:
+            for message in plugin.executive_summary():
+                cu.user_message("%s - %s" % (plugin.name, message))
 
-    def _process(self, plugin):
+        exp._barrier()
+        out_datasets = plugin.parameters["out_datasets"]
+        exp._reorganise_datasets(out_datasets, link_type)
+
+    def _process(self, plugin, communicator=cu.COMM_WORLD):
         """ Organise required data and execute the main plugin processing.
 
         :param plugin plugin: The current plugin instance.
+        :param Intracomm communicator: The processes running the plugin.
+        """
+        self._process_plugins([plugin], communicator)
+
+    def _process_plugins(self, plugins, communicator=cu.COMM_WORLD):
+        """ Organise required data and pass each slice group through the
+        plugins in turn.  The output of each plugin, other than the last, is
+        the input to the next and is only written if it is saved.
+
+        :param list(plugin) plugins: The plugin instances.
+        :param Intracomm communicator: The processes running the plugins.
         """
         self.process_checks()
-        in_data, out_data = plugin.get_datasets()
+        expInfo = self.exp.meta_data
+        stages = [self.__get_stage(plugin, expInfo) for plugin in plugins]
+        self.__check_stages(stages)
+        first = stages[0]
+        name = '+'.join([plugin.name for plugin in plugins])
+
+        number_of_slices_to_process = len(first['in_slice_list'][0])
+        scheduler = fs.get_scheduler(
+            number_of_slices_to_process, communicator,
+            expInfo.get_dictionary().get('scheduler', 'static'))
+        self.__set_chunk_caches(stages, expInfo)
+        collective = self.__set_collective_writes(stages, expInfo,
+                                                  communicator, True)
+        self.__plan_reads(first, expInfo)
+        pool = self._get_frame_pool(plugins)
+        buffers = self.__get_buffer_pool(stages, pool)
+        reader, writer = self.__get_reader_and_writer(
+            expInfo, scheduler,
+            lambda count: self.__read_frames(first, count, name),
+            lambda count, results: self.__write_frames(
+                stages, results, count, name, buffers))
+
+        try:
+            for count, results in pool.map(
+                    lambda item: self.__process_frames(
+                        stages, name, buffers, *item), reader):
+                percent_complete = count/(number_of_slices_to_process * 0.01)
+                cu.user_message("%s - %3i%% complete" %
+                                (name, percent_complete))
+                writer.put(count, results)
+        finally:
+            reader.close()
+            writer.close()
+        if collective:
+            self.__finish_collective_writes(
+                collective, number_of_slices_to_process, communicator)
+            self.__set_collective_writes(stages, expInfo, communicator,
+                                         False)
+        scheduler.close(name)
+        if buffers is not None:
+            buffers.close()
+        for data in first['in_data']:
+            data._clear_read_plan()
+
+        cu.user_message("%s - 100%% complete" % (name))
+        for stage in stages:
+            stage['plugin']._revert_preview(stage['in_data'])
+
+    def _get_frame_pool(self, plugins):
+        """ Get the pool that runs process_frames for the plugins, which
+        processes several slice groups at once if all of the plugins allow
+        it.
+        """
+        workers = self.exp.meta_data.get_dictionary().get('frame_workers', 1)
+        return fp.get_frame_pool(
+            [plugin.get_frame_pool() for plugin in plugins], workers,
+            mpi=self.mpi)
 
-        expInfo = plugin.exp.meta_data
-        in_slice_list = self.__get_all_slice_lists(in_data, expInfo)
-        out_slice_list = self.__get_all_slice_lists(out_data, expInfo)
+    def __set_collective_writes(self, stages, expInfo, communicator, on):
+        """ Switch the writes of the datasets that are saved to collective
+        operations, if requested.
 
-        squeeze_dict = self.__set_functions(in_data, 'squeeze')
-        expand_dict = self.__set_functions(out_data, 'expand')
+        :returns: the datasets written collectively.
+        :rtype: list(Data)
+        """
+        if on and not mpi_io.use_collective_writes(expInfo.get_dictionary(),
+                                                   communicator):
+            return []
+        written = []
+        for idx in range(len(stages)):
+            if idx == len(stages) - 1 or self.__is_saved(stages[idx]):
+                written += stages[idx]['out_data']
+        for data in written:
+            data._set_collective_writes(on)
+        return written
+
+    def __finish_collective_writes(self, written, nSlices, communicator):
+        """ Take part in the collective writes of the processes that have
+        more slice groups than this one.
+        """
+        most = communicator.allreduce(nSlices, op=cu.MPI.MAX)
+        logging.debug("%i empty collective writes", most - nSlices)
+        for i in range(most - nSlices):
+            for data in written:
+                data._set_empty_slice_data()
+
+    def __set_chunk_caches(self, stages, expInfo):
+        """ Size the chunk cache of each hdf5 dataset that is read or written
+        to hold the chunks of a slice group, sharing the per-process budget
+        between them.
+        """
+        budget = expInfo.get_dictionary().get('chunk_cache_mb', 256)*1e6
+        if not budget:
+            return
+        datasets = zip(stages[0]['in_data'], stages[0]['in_slice_list'],
+                       [0.75]*len(stages[0]['in_data']))
+        for stage in stages:
+            datasets += zip(stage['out_data'], stage['out_slice_list'],
+                            [1.0]*len(stage['out_data']))
+        unique = []
+        for entry in datasets:
+            if entry[0] not in [u[0] for u in unique]:
+                unique.append(entry)
+        needs = [data._get_chunk_cache_size(sl) for data, sl, _ in unique]
+        sizes = cc.share_budget(needs, budget)
+        for (data, slice_list, w0), need, nbytes in zip(unique, needs, sizes):
+            if need:
+                data._set_chunk_cache(slice_list, nbytes, w0)
+
+    def __plan_reads(self, stage, expInfo):
+        """ Read contiguous datasets from memory maps and compressed datasets
+        as raw chunks, and merge the reads of the slice groups of this
+        process from other datasets.  The dynamic scheduler does not know
+        which slice groups a process will read.  Stepped selections that
+        are not read from a memory map are read with the strategy of
+        strided_reads.
+        """
+        options = expInfo.get_dictionary()
+        nbytes = int(options.get('read_buffer_mb', 64)*1e6)
+        strided = (nbytes, options.get('strided_reads', 'auto'))
+        if options.get('scheduler', 'static') == 'dynamic':
+            nbytes = 0
+        memmap = options.get('memmap', True)
+        threads = options.get('read_threads', 4)
+        # the decompressed chunks are kept within the chunk cache budget
+        cache = max(int(options.get('chunk_cache_mb', 256)*1e6) //
+                    max(len(stage['in_data']), 1), cc.DEFAULT_NBYTES)
+        for data, slice_list in zip(stage['in_data'],
+                                    stage['in_slice_list']):
+            if memmap and data._map_data():
+                continue
+            data._set_strided_reads(*strided)
+            if not data._read_chunks(threads, cache):
+                data._plan_reads(slice_list, nbytes)
+
+    def __read_frames(self, stage, count, name):
+        """ Read a slice group for the first plugin. """
+        with trace.span('read', name, group=count) as span:
+            frames = self.__get_all_padded_data(
+                stage['in_data'], stage['in_slice_list'], count,
+                stage['squeeze'])
+            span.set(bytes=iop.get_nbytes(frames[0]))
+        return frames
+
+    def __write_frames(self, stages, results, count, name, buffers):
+        """ Write the results of a slice group, and return the output buffers
+        that were lent for it to the pool.
+        """
+        with trace.span('write', name, group=count,
+                        bytes=iop.get_nbytes(results)):
+            self.__set_all_out_data(stages, results, count)
+        if buffers is not None:
+            buffers.release(count)
 
-        number_of_slices_to_process = len(in_slice_list[0])
-        for count in range(number_of_slices_to_process):
-            percent_complete = count/(number_of_slices_to_process * 0.01)
-            cu.user_message("%s - %3i%% complete" %
-                            (plugin.name, percent_complete))
+    def __process_frames(self, stages, name, buffers, count, frames):
+        """ Pass a slice group through the plugins in turn.
 
-            section, slice_list = \
-                self.__get_all_padded_data(in_data, in_slice_list, count,
-                                           squeeze_dict)
-            result = plugin.process_frames(section, slice_list)
-            self.__set_out_data(out_data, out_slice_list, result, count,
-                                expand_dict)
+        :returns: the slice group index and the result of each plugin.
+        """
+        section, slice_list = frames
+        results = []
+        with trace.span('process', name, group=count) as span:
+            if trace.is_enabled():
+                span.set(frames=self.__get_nframes(stages[0], slice_list))
+            for idx in range(len(stages)):
+                result = stages[idx]['plugin'].process_frames(
+                    section, slice_list,
+                    **self.__get_out_buffers(stages[idx], buffers, count))
+                results.append(result)
+                if idx < len(stages) - 1:
+                    section, slice_list = self.__get_next_frames(
+                        stages[idx], stages[idx+1], result, count)
+        return count, results
+
+    def __get_buffer_pool(self, stages, pool):
+        """ Create a pool of output buffers if any of the plugins fill the
+        buffers they are given.  Forked frame workers can not fill buffers
+        in this process.
+        """
+        if isinstance(pool, fp.ProcessFramePool) or not \
+                [s for s in stages if s['plugin'].reuse_output_buffers()]:
+            return None
+        return iop.BufferPool()
 
-        cu.user_message("%s - 100%% complete" % (plugin.name))
-        plugin._revert_preview(in_data)
+    def __get_out_buffers(self, stage, buffers, count):
+        """ Lend the plugin a buffer for its result for each output dataset,
+        if it fills them.
+
+        :returns: the keyword arguments for process_frames.
+        :rtype: dict
+        """
+        if buffers is None or not stage['plugin'].reuse_output_buffers() or \
+                [d for d in stage['out_data'] if 'var' in d.get_shape()]:
+            return {}
+        out = []
+        for data, slice_list in zip(stage['out_data'],
+                                    stage['out_slice_list']):
+            dtype = np.float32 if data.dtype is None else data.dtype
+            out.append(buffers.get(count, self.__get_result_shape(
+                data, slice_list[count]), dtype))
+        return {'out': out}
+
+    def __get_result_shape(self, data, sl):
+        """ The shape of the result a plugin returns for the slice group
+        ``sl`` of an output dataset, which includes the padding and not the
+        dimensions that are squeezed.
+        """
+        pData = data._get_plugin_data()
+        shape = data.get_shape()
+        padding = data._get_padding_dict() if pData.padding else {}
+        squeeze_dims = pData.get_slice_directions()
+        if (pData._get_frame_chunk() or 1) > 1:
+            squeeze_dims = squeeze_dims[1:]
+        result = []
+        for dim in range(len(shape)):
+            if dim not in squeeze_dims:
+                length = len(xrange(*sl[dim].indices(shape[dim]))) if \
+                    isinstance(sl[dim], slice) else 1
+                result.append(length + 2*padding.get(dim, 0))
+        return tuple(result)
+
+    def __get_nframes(self, stage, slice_list):
+        """ The number of frames in a slice group of the first dataset. """
+        data = stage['in_data'][0]
+        shape = data.get_shape()
+        nFrames = 1
+        for dim in data._get_plugin_data().get_slice_directions():
+            sl = slice_list[0][dim]
+            if isinstance(sl, slice) and isinstance(shape[dim], int):
+                nFrames *= len(xrange(*sl.indices(shape[dim])))
+        return nFrames
+
+    def __get_stage(self, plugin, expInfo):
+        """ Get the datasets, slice lists and functions required to pass the
+        data to and from a plugin.
+        """
+        in_data, out_data = plugin.get_datasets()
+        return {'plugin': plugin, 'in_data': in_data, 'out_data': out_data,
+                'in_slice_list': self.__get_all_slice_lists(in_data, expInfo),
+                'out_slice_list':
+                    self.__get_all_slice_lists(out_data, expInfo),
+                'squeeze': self.__set_functions(in_data, 'squeeze'),
+                'expand': self.__set_functions(out_data, 'expand')}
+
+    def __check_stages(self, stages):
+        """ Each plugin must write the frames the next plugin reads. """
+        for first, second in zip(stages[:-1], stages[1:]):
+            out_list = [tuple(sl) for sl in first['out_slice_list'][0]]
+            in_list = [tuple(sl) for sl in second['in_slice_list'][0]]
+            if out_list != in_list:
+                raise Exception("The %s and %s plugins can not be fused: the "
+                                "slice lists differ." %
+                                (first['plugin'].name, second['plugin'].name))
+
+    def __get_next_frames(self, stage, next_stage, result, count):
+        """ Convert a plugin result into the input of the next plugin, as if
+        it had been written to and read back from the dataset.
+        """
+        result = result[0] if type(result) is list else result
+        out_data = stage['out_data'][0]
+        frames = stage['expand'][0](out_data._get_unpadded_slice_data(
+            stage['out_slice_list'][0][count], result))
+        dtype = np.float32 if out_data.dtype is None else out_data.dtype
+        # copy if the result is still to be written
+        frames = np.array(frames, dtype=dtype, copy=self.__is_saved(stage))
+        return [next_stage['squeeze'][0](frames)], \
+            [next_stage['in_slice_list'][0][count]]
+
+    def __is_saved(self, stage):
+        return stage['out_data'][0].data is not None
+
+    def __set_all_out_data(self, stages, results, count):
+        """ Write the results of all plugins that are saved. """
+        for idx in range(len(stages)):
+            if idx == len(stages) - 1 or self.__is_saved(stages[idx]):
+                self.__set_out_data(
+                    stages[idx]['out_data'], stages[idx]['out_slice_list'],
+                    results[idx], count, stages[idx]['expand'])
+
+    def __get_reader_and_writer(self, expInfo, indices, get_frames,
+                                set_frames):
+        """ Create the objects that read slice groups for, and write results
+        from, the plugin.  Reading ahead and writing behind are performed in
+        background threads if requested in the options, otherwise all reads
+        and writes are in line with the processing.
+
+        :param meta_data expInfo: The experiment metadata.
+        :param iterable indices: The slice groups to process.
+        :param function get_frames: Reads the data for a slice group.
+        :param function set_frames: Writes the result for a slice group.
+        :returns: reader and writer
+        :rtype: FrameReader, FrameWriter
+        """
+        options = expInfo.get_dictionary()
+        read_ahead = options.get('read_ahead', 0)
+        write_behind = options.get('write_behind', 0)
+        if (read_ahead or write_behind) and not self.__threads_supported():
+            logging.warn("The MPI library does not support multiple threads:"
+                         " reading and writing in line with processing.")
+            read_ahead = write_behind = 0
+
+        read_limit, write_limit = iop.get_buffer_limits(
+            options.get('io_buffer_mb', 1024)*1e6, read_ahead, write_behind)
+        reader = iop.get_frame_reader(get_frames, indices, read_ahead,
+                                      read_limit)
+        writer = iop.get_frame_writer(set_frames, write_behind, write_limit)
+        return reader, writer
+
+    def __threads_supported(self):
+        """ HDF5 calls are made from background threads when reading ahead
+        or writing behind, which requires a thread-safe MPI library.
+        """
+        if not self.mpi:
+            return True
+        return cu.MPI.Query_thread() == cu.MPI.THREAD_MULTIPLE
 
     def process_checks(self):
         pass
@@ -343,8 +739,8 @@ class Hdf5Transport(TransportControl):
         for idx in range(len(data_list)):
             temp = data_list[idx]._get_unpadded_slice_data(
                 slice_list[idx][count], result[idx])
-            data_list[idx].data[slice_list[idx][count]] = \
-                expand_dict[idx](temp)
+            data_list[idx]._set_slice_data(slice_list[idx][count],
+                                           expand_dict[idx](temp))
 
 #    def _transfer_to_meta_data(self, return_dict):
 #        """
@@ -0,0 +1,65 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+.. module:: memory_transport
+   :platform: Unix
+   :synopsis: Transport for single node runs, which keeps intermediate \
+   datasets in memory shared by all processes on the node.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import logging
+
+from savu.core.transports.hdf5_transport import Hdf5Transport
+import savu.core.utils as cu
+
+
+class MemoryTransport(Hdf5Transport):
+    """ Passes the data to and from the plugins in the same way as the hdf5
+    transport, but intermediate datasets are held in shared memory (see
+    MemoryTransportData).  Only final results, and datasets that do not fit
+    in the memory budget, are saved to hdf5 files.
+    """
+
+    def _transport_control_setup(self, options):
+        """ Fill the options dictionary with MPI related values and the shared
+        memory settings.
+        """
+        super(MemoryTransport, self)._transport_control_setup(options)
+
+        budget = options.get('memory_budget_mb', None)
+        budget = self.__get_default_budget() if budget is None else \
+            budget*1e6
+
+        options['node_comm'] = None
+        if self.mpi:
+            node_comm = cu.COMM_WORLD.Split_type(cu.MPI.COMM_TYPE_SHARED)
+            if node_comm.size != cu.COMM_WORLD.size:
+                logging.warn("The memory transport requires all processes to"
+                             " be on a single node: saving all datasets to "
+                             "hdf5 files.")
+                budget = 0
+            options['node_comm'] = node_comm
+
+        options['memory_budget'] = int(budget)
+        options['memory_used'] = 0
+        cu.user_message("Shared memory budget for intermediate datasets: "
+                        "%i MB" % (budget/1e6))
+
+    def __get_default_budget(self):
+        """ Half of the physical memory on the node. """
+        return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')/2
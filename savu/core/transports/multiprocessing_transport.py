@@ -0,0 +1,66 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+.. module:: multiprocessing_transport
+   :platform: Unix
+   :synopsis: Transport for single node runs without MPI, which shares the \
+   processing between a pool of local worker processes.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import multiprocessing
+
+from savu.core.transports.hdf5_transport import Hdf5Transport
+import savu.core.frame_pool as fp
+import savu.core.utils as cu
+
+
+class MultiprocessingTransport(Hdf5Transport):
+    """ Runs the plugin list in a single process, which reads and writes all
+    the data, while the slice groups are shared out to a pool of forked
+    worker processes that run process_frames.  The results are written in
+    order and no MPI library (or mpirun) is required.
+
+    There is one worker for each process name (-n CPU0,CPU1,...), or one for
+    each core if a single name is given.  Only the plugins that declare a
+    frame pool (see Plugin.get_frame_pool) are run in the worker processes,
+    which includes the stateless reconstructions and filters: the state
+    other plugins set in process_frames would be lost with the worker, so
+    they run one slice group at a time in the main process.  Workers do not
+    read or write the data themselves, as the files are not opened with a
+    parallel hdf5 driver.
+    """
+
+    def _transport_control_setup(self, options):
+        """ Set the number of worker processes and run the rest of the setup
+        as for a single process.
+        """
+        names = options["process_names"].split(',')
+        workers = len(names) if len(names) > 1 else \
+            multiprocessing.cpu_count()
+        options["process_names"] = names[0]
+        super(MultiprocessingTransport, self)._transport_control_setup(
+            options)
+        options["frame_workers"] = workers
+        cu.user_message("Processing with %i worker processes" % workers)
+
+    def _get_frame_pool(self, plugins):
+        """ Process the slice groups in the worker processes, if the plugins
+        allow it.
+        """
+        workers = self.exp.meta_data.get_meta_data('frame_workers')
+        return fp.get_frame_pool(
+            [plugin.get_frame_pool() for plugin in plugins], workers)
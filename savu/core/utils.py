@@ -22,7 +22,43 @@
 
 import logging
 import itertools
-from mpi4py import MPI
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    # MPI is only required for runs with more than one process
+    MPI = None
+
+
+class SerialComm(object):
+    """ Stands in for MPI.COMM_WORLD when mpi4py is not installed, for runs
+    in a single process.
+    """
+    rank = 0
+    size = 1
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.size
+
+    def barrier(self):
+        pass
+
+    def Barrier(self):
+        pass
+
+    def gather(self, obj, root=0):
+        return [obj]
+
+    def allgather(self, obj):
+        return [obj]
+
+    def bcast(self, obj, root=0):
+        return obj
+
+COMM_WORLD = SerialComm() if MPI is None else MPI.COMM_WORLD
 
 
 def logfunction(func):
@@ -112,7 +148,7 @@ def user_message(message):
 
 
 def user_messages_from_all(header, message_list):
-    comm = MPI.COMM_WORLD
+    comm = COMM_WORLD
     messages = comm.gather(message_list, root=0)
     if  messages is None:
         return
@@ -19,21 +19,36 @@
 .. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
 """
 
-import copy
+import os
+import time
 import logging
-from fractions import gcd
+import tempfile
+import h5py
 import numpy as np
 
 from savu.plugins.utils import register_plugin
 
+# the largest chunk, if the filesystem block is smaller
+DEFAULT_TARGET = 1000000
+# the cost of accessing a chunk (locating it in the file and the request to
+# the filesystem), as the bytes that could be read in the same time
+CHUNK_OVERHEAD = 100000
+
 
 @register_plugin
 class Chunking(object):
     """
-    A class to save tomography data to a hdf5 file
+    Choose the chunk shape of a dataset that minimises the cost of writing it
+    in the current pattern and reading it in the next pattern.
+
+    The cost of a candidate chunk shape for a pattern is the bytes moved per
+    byte used by a slice group: each chunk the slice group touches costs its
+    size, rounded up to the filesystem block, plus CHUNK_OVERHEAD.  The chunks
+    are no larger than the target size, which is the ``chunk_target_mb``
+    option or the filesystem block size (but at least 1 MB).
     """
 
-    def __init__(self, exp, patternDict):
+    def __init__(self, exp, patternDict, nProcs=None):
         self.pattern_dict = patternDict
         self.current = patternDict['current'][patternDict['current'].keys()[0]]
         if patternDict['next']:
@@ -47,127 +62,114 @@ class Chunking(object):
             self.next_pattern = patternDict['current'].keys()[0]
 
         self.exp = exp
-        self.core = None
-        self.slice1 = None
-        self.other = None
+        # the processes writing the dataset, if not all of them
+        self.nProcs = nProcs
+        self.block, self.target = self.__get_block_and_target()
 
     def _calculate_chunking(self, shape, ttype):
         """
         Calculate appropriate chunk sizes for this dataset
         """
         logging.debug("shape = %s", shape)
-        if len(shape) < 3:
+        if len(shape) < 2 or 0 in shape:
             return True
 
-        chunks = [1]*len(shape)
-        adjust = self.__set_adjust_params(shape)
-        self.__set_chunks(chunks, shape, adjust)
+        chunks, cost = self._rank_chunks(shape, ttype)[0]
+        logging.debug("chunks %s (%.2f bytes moved per byte used)", chunks,
+                      cost)
+        return chunks
 
-        if 0 in chunks:
-            return True
-        else:
-            chunks = self.__adjust_chunk_size(chunks, ttype, shape, adjust)
-            logging.debug("chunks before %s", chunks)
-            for chunk in chunks:
-                chunk += 1
-            logging.debug("chunks after %s", chunks)
-            return tuple(chunks)
+    def _rank_chunks(self, shape, ttype, n=1):
+        """ The ``n`` candidate chunk shapes with the lowest cost that are no
+        larger than the target, with the larger chunks first when the costs
+        are equal.
 
-    def __set_adjust_params(self, shape):
+        :returns: the chunk shapes and their costs.
+        :rtype: list(tuple(tuple, float))
         """
-        Set adjustable dimension parameters (the dimension number, increment
-        and max value)
+        itemsize = np.dtype(ttype).itemsize
+        candidates = [self.__get_candidates(dim, shape) for dim in
+                      range(len(shape))]
+        cost = self._get_cost(shape, itemsize, candidates)
+        nbytes = itemsize*self.__outer([np.array(c) for c in candidates])
+        cost[nbytes > self.target] = np.inf
+
+        ranked = []
+        for best in np.lexsort((-nbytes.ravel(), cost.ravel()))[:n]:
+            index = np.unravel_index(best, cost.shape)
+            ranked.append((tuple([int(c[i]) for c, i in
+                                  zip(candidates, index)]),
+                           float(cost[index])))
+        return ranked
+
+    def _get_cost(self, shape, itemsize, candidates):
+        """ The cost of every combination of the candidate chunk lengths of
+        each dimension, for the current and next patterns.
+
+        :returns: an array with a dimension for each dimension of the data.
+        :rtype: np.ndarray
         """
-        adjust_dim = self.__get_adjustable_dims()
-        array_len = len(adjust_dim)
-        adjust_max = [1]*array_len
-        for i in range(array_len):
-            adjust_max[i] = shape[adjust_dim[i]]
-        inc_dict = {'up': [1]*array_len, 'down': [1]*array_len}
-        bounds = {'min': [1]*array_len, 'max': adjust_max}
-        return {'dim': adjust_dim, 'inc': inc_dict, 'bounds': bounds}
-
-    def __get_adjustable_dims(self):
+        lengths = [np.array(c) for c in candidates]
+        nbytes = itemsize*self.__outer(lengths)
+        moved = np.ceil(nbytes/float(self.block))*self.block + CHUNK_OVERHEAD
+        cost = np.zeros(nbytes.shape)
+        for pattern in [self.current, self.next]:
+            frames = self.__get_frames(pattern, shape)
+            touched = self.__outer(
+                [self.__chunks_touched(n, f, c) for n, f, c in
+                 zip(shape, frames, lengths)])
+            cost += touched*moved/float(itemsize*np.prod(frames))
+        return cost
+
+    def __outer(self, arrays):
+        result = arrays[0].astype(np.float64)
+        for array in arrays[1:]:
+            result = np.multiply.outer(result, array)
+        return result
+
+    def __get_frames(self, pattern, shape):
+        """ The shape of a slice group in a pattern. """
+        frames = [1]*len(shape)
+        for dim in pattern['core_dir']:
+            frames[dim] = shape[dim]
+        sdir = pattern['slice_dir'][0]
+        frames[sdir] = min(pattern['max_frames'], shape[sdir])
+        return frames
+
+    def __chunks_touched(self, length, frames, chunks):
+        """ The mean number of chunks of each length in ``chunks`` that a
+        slice group of ``frames`` touches, in a dimension of ``length``.
         """
-        Get all core dimensions and fastest changing slice dimension (all
-        potentially adjustable)
+        starts = np.arange(0, length, frames)
+        stops = np.minimum(starts + frames, length)
+        return np.array([np.mean((stops - 1)//c - starts//c + 1) for c in
+                         chunks])
+
+    def __get_candidates(self, dim, shape):
+        """ The chunk lengths to try in a dimension: halvings of the length,
+        powers of two and multiples of the frames in a slice group.
         """
-        self.core = \
-            list(self.current['core_dir']) + list(self.next['core_dir'])
-        c_sl = list(self.current['slice_dir'])
-        n_sl = list(self.next['slice_dir'])
-        self.slice1 = [c_sl[0]] + [n_sl[0]]
-        self.other = c_sl[1:] + n_sl[1:]
-        return list(set(self.core + self.slice1))
-
-    def __set_chunks(self, chunks, shape, adjust):
-        """
-        Calculate initial chunk values
-        """
-        chunk_functions = {0: self.__slice_slice, 1: self.__slice_other,
-                           2: self.__core_core, 3: self.__core_other,
-                           4: self.__core_slice}
-        adj_idx = 0
-        for dim in adjust['dim']:
-            count = (dim in self.core)*4 + (dim in self.slice1)*2 + \
-                (dim in self.other) - 2
-            chunks[dim] = chunk_functions[count](dim, adj_idx, adjust, shape)
-            if 'VOLUME' in self.next_pattern:
-                self.__set_volume_bounds(adjust, dim, chunks)
-            adj_idx += 1
-        return chunks
-
-    def __set_volume_bounds(self, adjust, dim, chunks):
-        adjust['bounds']['min'][dim] = \
-            eval(str(62) + adjust['inc']['down'][dim])
-        chunks[dim] = int(min(adjust['bounds']['max'][dim], 62))
-
-    def __core_core(self, dim, adj_idx, adjust, shape):
-        adjust['inc']['up'][adj_idx] = '+1'
-        adjust['inc']['down'][adj_idx] = '/2'
-        adjust['bounds']['max'][adj_idx] = shape[dim]
-        return shape[dim]
-
-    def __core_slice(self, dim, adj_idx, adjust, shape):
-        max_frames = self.__get_max_frames_dict()[dim]
-        adjust['inc']['up'][adj_idx] = '+' + str(max_frames)
-        adjust['inc']['down'][adj_idx] = '-' + str(max_frames)
-        adjust['bounds']['max'][adj_idx] = \
-            self.__max_frames_per_process(shape[dim], max_frames)
-        return min(max_frames, shape[dim])
-
-    def __core_other(self, dim, adj_idx, adjust, shape):
-        adjust['inc']['up'][adj_idx] = '+1'
-        adjust['inc']['down'][adj_idx] = '-1'
-        adjust['bounds']['max'][adj_idx] = shape[dim]
-        return 1
-
-    def __slice_slice(self, dim, adj_idx, adjust, shape):
-        max_frames = self.__get_max_frames_dict()[dim]
-        adjust['inc']['up'][adj_idx] = '+' + str(max_frames)
-        adjust['inc']['down'][adj_idx] = '-' + str(max_frames)
-        adjust['bounds']['max'][adj_idx] = \
-            self.__max_frames_per_process(shape[dim], max_frames)
-        return min(max_frames, shape[dim])
-
-    def __slice_other(self, dim, adj_idx, adjust, shape):
-        adjust['inc']['up'][adj_idx] = '+1'
-        adjust['inc']['down'][adj_idx] = '-1'
-        adjust['bounds']['max'][adj_idx] = shape[dim]
-        return 1
-
-    def __get_max_frames_dict(self):
-        current_sdir = self.current['slice_dir'][0]
-        next_sdir = self.next['slice_dir'][0]
-        if current_sdir == next_sdir:
-            c_max = self.current['max_frames']
-            n_max = self.next['max_frames']
-            least_common_multiple = (c_max*n_max)/gcd(c_max, n_max)
-            ddict = {current_sdir: least_common_multiple}
-        else:
-            ddict = {self.current['slice_dir'][0]: self.current['max_frames'],
-                     self.next['slice_dir'][0]: self.next['max_frames']}
-        return ddict
+        patterns = [self.current, self.next]
+        if not [p for p in patterns if dim in p['core_dir'] or
+                dim == p['slice_dir'][0]]:
+            return [1]
+        bound = shape[dim]
+        if dim == self.current['slice_dir'][0]:
+            # processes should not write to the same chunk
+            bound = self.__max_frames_per_process(
+                shape[dim], self.current['max_frames'])
+
+        candidates = set([shape[dim]])
+        n = shape[dim]
+        while n > 1:
+            n = int(np.ceil(n/2.0))
+            candidates.add(n)
+        candidates.update([2**i for i in range(int(np.log2(shape[dim])) + 1)])
+        for p in patterns:
+            if dim == p['slice_dir'][0]:
+                candidates.update([p['max_frames']*2**i for i in
+                                   range(int(np.log2(shape[dim])) + 1)])
+        return sorted([c for c in candidates if c <= bound]) or [1]
 
     def __max_frames_per_process(self, shape, nFrames):
         """
@@ -175,7 +177,8 @@ class Chunking(object):
         """
         total_plugin_runs = np.ceil(float(shape)/nFrames)
         frame_list = np.arange(total_plugin_runs)
-        nProcs = len(self.exp.meta_data.get_meta_data('processes'))
+        nProcs = self.nProcs or \
+            len(self.exp.meta_data.get_meta_data('processes'))
         frame_list_per_proc = np.array_split(frame_list, nProcs)
         flist_len = []
         for flist in frame_list_per_proc:
@@ -183,94 +186,71 @@ class Chunking(object):
         runs_per_proc = int(np.median(np.array(flist_len)))
         return int(min(runs_per_proc*nFrames, shape))
 
-    def __adjust_chunk_size(self, chunks, ttype, shape, adjust):
-        """
-        Adjust the chunk size to as close to 1MB as possible
-        """
-        chunks = np.array(chunks)
-        chunk_size = np.prod(chunks)*np.dtype(ttype).itemsize
-        cache_size = 1000000
-        if (chunk_size > cache_size):
-            self.__decrease_chunks(chunks, ttype, adjust)
-        else:
-            chunks = self.__increase_chunks(chunks, ttype, shape, adjust)
-        return tuple(chunks)
-
-    def __decrease_chunks(self, chunks, ttype, adjust):
+    def __get_block_and_target(self):
+        """ The filesystem block size of the intermediate files, and the
+        target chunk size.
         """
-        Decrease the chunk size to below but as close to 1MB as possible
-        """
-        while ((np.prod(chunks)*np.dtype(ttype).itemsize) > 1000000):
-            idx = self.__get_idx_decrease(chunks, adjust)
-            dim = adjust['dim'].index(idx)
-#            if idx == -1:
-#                break
-            chunks[idx] = int(np.ceil(eval(str(float(chunks[idx])) +
-                              adjust['inc']['down'][dim])))
-
-    def __increase_chunks(self, chunks, ttype, shape, adjust):
-        """
-        Increase the chunk size as close to 1MB as possible
-        """
-        next_chunks = copy.copy(chunks)
-        while ((np.prod(next_chunks)*np.dtype(ttype).itemsize) <= 1000000):
-            chunks = copy.copy(next_chunks)
-            idx = self.__get_idx_increase(next_chunks, adjust)
-            if idx == -1:
-                break
-            dim = adjust['dim'].index(idx)
-            next_chunks[idx] = \
-                eval(str(next_chunks[idx]) + adjust['inc']['up'][dim])
-        return chunks
-
-    def __get_idx_decrease(self, chunks, adjust):
-        """
-        Determine the chunk dimension to decrease
-        """
-        self.check = lambda a, b, c, i: \
-            True if (eval(str(a) + b[i])) < c['min'][i] else False
-        self.__check_adjust_dims(adjust, chunks, 'down')
-        return self.__get_idx_order(adjust, chunks, 'down')
-
-    def __get_idx_increase(self, chunks, adjust):
-        """
-        Determine the chunk dimension to increase
-        """
-        self.check = lambda a, b, c, i: \
-            True if (eval(str(a) + b[i])) > c['max'][i] else False
-        self.__check_adjust_dims(adjust, chunks, 'up')
-        return self.__get_idx_order(adjust, chunks, 'up')
-
-    def __get_idx_order(self, adjust, chunks, direction):
-        process_order = [self.slice1, self.core]
-        sl = slice(None, None, -1)
-        if direction is 'up':
-            sl = slice(None, None, 1)
-            process_order = process_order[::-1]
-
-        avail1 = list(set(adjust['dim']).intersection(process_order[0]))
-        idx_order = np.argsort(chunks[avail1])[sl]
-
-        if not idx_order.size:
-            avail2 = list(set(adjust['dim']).intersection(process_order[1]))
-            idx_order = np.argsort(chunks[avail2])[sl]
-
-        return adjust['dim'][idx_order[0]] if idx_order.size else -1
-
-    def __check_adjust_dims(self, adjust, chunks, up_down):
-        nDel = 0
-        for i in range(len(adjust['dim'])):
-            i -= nDel
-            dim = adjust['dim'][i]
-            if self.check(chunks[dim], adjust['inc'][up_down],
-                          adjust['bounds'], i):
-                adjust['inc']['down'][i] = '-1'
-            if self.check(chunks[dim], adjust['inc'][up_down],
-                          adjust['bounds'], i):
-                del adjust['dim'][i]
-                del adjust['inc']['up'][i]
-                del adjust['inc']['down'][i]
-                del adjust['bounds']['max'][i]
-                del adjust['bounds']['min'][i]
-                nDel += 1
-
+        options = self.exp.meta_data.get_dictionary()
+        path = options.get('inter_path', options.get('out_path', None))
+        block = 4096
+        try:
+            block = max(os.statvfs(path).f_bsize, os.stat(path).st_blksize)
+        except (OSError, TypeError):
+            logging.debug("Unable to find the filesystem block size of %s",
+                          path)
+        target = options.get('chunk_target_mb', None)
+        target = target*1e6 if target else max(DEFAULT_TARGET, block)
+        return block, target
+
+
+def benchmark(chunking, shape, dtype, path, nCandidates=4):
+    """ Measure the time taken to write a dataset in the current pattern and
+    read it in the next pattern, for the chunk shapes with the lowest cost,
+    to check the cost model against a filesystem.
+
+    :param Chunking chunking: the patterns of the dataset.
+    :param tuple shape: the shape of the dataset.
+    :param dtype: the type of the dataset.
+    :param str path: the directory to create the test files in.
+    :param int nCandidates: the number of chunk shapes to measure.
+    :returns: the chunk shape, the cost and the time taken for each
+        candidate, in order of cost.
+    :rtype: list(tuple)
+    """
+    results = []
+    for chunks, cost in chunking._rank_chunks(shape, dtype, nCandidates):
+        fd, filename = tempfile.mkstemp(suffix='.h5', dir=path)
+        os.close(fd)
+        try:
+            results.append((chunks, cost, __time_patterns(
+                chunking, filename, shape, dtype, chunks)))
+        finally:
+            os.remove(filename)
+        logging.info("chunks %s: cost %.2f, %.3fs", *results[-1])
+    return results
+
+
+def __time_patterns(chunking, filename, shape, dtype, chunks):
+    start = time.time()
+    with h5py.File(filename, 'w') as h5:
+        data = h5.create_dataset('data', shape, dtype, chunks=chunks)
+        for sl in __slice_groups(chunking.current, shape):
+            frames = [len(xrange(*s.indices(n))) for s, n in zip(sl, shape)]
+            data[sl] = np.ones(frames, dtype=dtype)
+    with h5py.File(filename, 'r') as h5:
+        for sl in __slice_groups(chunking.next, shape):
+            h5['data'][sl]
+    return time.time() - start
+
+
+def __slice_groups(pattern, shape):
+    """ The slice groups of a pattern, with the other slice dimensions at
+    their first index.
+    """
+    sdir = pattern['slice_dir'][0]
+    for start in range(0, shape[sdir], pattern['max_frames']):
+        sl = [slice(0, 1)]*len(shape)
+        for dim in pattern['core_dir']:
+            sl[dim] = slice(None)
+        sl[sdir] = slice(start, start + pattern['max_frames'])
+        yield tuple(sl)
@@ -26,7 +26,6 @@ import os
 import logging
 import copy
 import h5py
-from mpi4py import MPI
 
 import savu.core.utils as cu
 from savu.data.plugin_list import PluginList
@@ -46,6 +45,8 @@ class Experiment(object):
         self.__meta_data_setup(options["process_file"])
         self.index = {"in_data": {}, "out_data": {}, "mapping": {}}
         self.nxs_file = None
+        # node-local storage for intermediate datasets (see local_tier)
+        self.local_tier = None
 
     def get_meta_data(self, entry):
         """ Get the meta data dictionary. """
@@ -89,7 +90,7 @@ class Experiment(object):
 
         if self.meta_data.get_meta_data("mpi") is True:
             self.nxs_file = h5py.File(filename, 'w', driver='mpio',
-                                      comm=MPI.COMM_WORLD)
+                                      comm=cu.COMM_WORLD)
         else:
             self.nxs_file = h5py.File(filename, 'w')
 
@@ -143,7 +144,7 @@ class Experiment(object):
             data_names.append(key)
         return data_names
 
-    def _barrier(self, communicator=MPI.COMM_WORLD):
+    def _barrier(self, communicator=cu.COMM_WORLD):
         comm_dict = {'comm': communicator}
         if self.meta_data.get_meta_data('mpi') is True:
             logging.debug("About to hit a _barrier %s", comm_dict)
@@ -162,22 +162,49 @@ class PluginList(object):
         return data
 
     def _set_datasets_list(self, plugin):
+        from savu.plugins.driver.cpu_plugin import CpuPlugin
         in_pData, out_pData = plugin.get_plugin_datasets()
         max_frames = plugin.get_max_frames()
+        if plugin.exp.meta_data.get_dictionary().get('frame_budget_mb'):
+            # the frames in each slice group are chosen from the budget
+            max_frames = None
         in_data_list = self._populate_datasets_list(in_pData, max_frames)
         out_data_list = self._populate_datasets_list(out_pData, max_frames)
-        self.datasets_list.append({'in_datasets': in_data_list,
-                                   'out_datasets': out_data_list})
+        self.datasets_list.append({
+            'in_datasets': in_data_list, 'out_datasets': out_data_list,
+            'driver': 'cpu' if isinstance(plugin, CpuPlugin) else 'gpu',
+            'tuning': bool(plugin.extra_dims),
+            'post_process': pu.has_post_process(plugin)})
 
-    def _populate_datasets_list(self, data, max_frames):
+    def _populate_datasets_list(self, data, max_frames=None):
         data_list = []
         for d in data:
             name = d.data_obj.get_name()
             pattern = copy.deepcopy(d.get_pattern())
-            pattern[pattern.keys()[0]]['max_frames'] = max_frames
-            data_list.append({'name': name, 'pattern': pattern})
+            nFrames = max_frames if max_frames is not None else \
+                d.meta_data.get_meta_data('nFrames')
+            pattern[pattern.keys()[0]]['max_frames'] = nFrames
+            data_list.append({'name': name, 'pattern': pattern,
+                              'shape': d.data_obj.get_shape(),
+                              'dtype': self.__get_dtype(d.data_obj),
+                              'chunks': getattr(d.data_obj.data, 'chunks',
+                                                None),
+                              'padding': d.padding is not None,
+                              'preview': self.__is_previewed(d.data_obj)})
         return data_list
 
+    def __get_dtype(self, data):
+        dtype = data.dtype
+        if dtype is None:
+            dtype = getattr(data.data, 'dtype', np.float32)
+        return np.dtype(dtype).name
+
+    def __is_previewed(self, data):
+        starts, stops, steps, chunks = \
+            data.get_preview().get_starts_stops_steps()
+        return [s for s in starts if s] != [] or \
+            [s for s in steps + chunks if s != 1] != []
+
     def _get_datasets_list(self):
         return self.datasets_list
 
@@ -0,0 +1,145 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: raw_cache
+   :platform: Unix
+   :synopsis: A persistent copy of the raw data of a loader, rechunked for \
+   both projection and sinogram access.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import hashlib
+import logging
+import h5py
+import numpy as np
+
+import savu.core.utils as cu
+import savu.data.transport_data.chunk_compression as cc
+from savu.data.chunking import Chunking
+
+# the frames of a slice group assumed by the cached layout
+CACHE_FRAMES = 1
+
+# the cached copies opened by this process, which are shared by the loaders
+# that ask for them again
+__open_copies = {}
+
+
+def get_data(exp, backing_file, data_path):
+    """ The raw dataset ``data_path`` of ``backing_file``, or its copy in the
+    ``raw_cache`` directory.  The copy is made, by the first process, on the
+    first run that asks for it.
+
+    :returns: the dataset to read.
+    :rtype: h5py.Dataset
+    """
+    data = backing_file[data_path]
+    path = exp.meta_data.get_dictionary().get('raw_cache', None)
+    if not path or len(data.shape) != 3 or 0 in data.shape:
+        return data
+    chunks = get_chunks(exp, data.shape, data.dtype)
+    if data.chunks == chunks:
+        return data
+
+    filters = cc.get_filters(exp.meta_data.get_dictionary())
+    filename = get_cache_filename(path, backing_file.filename, data_path,
+                                  chunks, filters)
+    created = True
+    if cu.COMM_WORLD.rank == 0 and not os.path.exists(filename):
+        created = __create_cache(data, path, filename, chunks, filters)
+    # every process falls back to the source if the copy failed
+    created = cu.COMM_WORLD.bcast(created, root=0)
+    exp._barrier()
+    if not created:
+        return data
+    logging.info("Reading %s from the cached copy %s", data_path, filename)
+    copy = __open_copies.get(filename, None)
+    if copy is None or not copy.id.valid:
+        copy = h5py.File(filename, 'r')['data']
+        __open_copies[filename] = copy
+    return copy
+
+
+def get_chunks(exp, shape, dtype):
+    """ The chunk shape of the cached copy, balanced between reading
+    projections and sinograms.  The copy is written by a single process, so
+    the chunks do not depend on the number of processes of a run.
+    """
+    projection = {'core_dir': (1, 2), 'slice_dir': (0,),
+                  'max_frames': CACHE_FRAMES}
+    sinogram = {'core_dir': (0, 2), 'slice_dir': (1,),
+                'max_frames': CACHE_FRAMES}
+    chunking = Chunking(exp, {'current': {'PROJECTION': projection},
+                              'next': {'SINOGRAM': sinogram}}, nProcs=1)
+    return chunking._calculate_chunking(shape, dtype)
+
+
+def get_cache_filename(path, source, data_path, chunks, filters=None):
+    """ The cached copy of dataset ``data_path`` in file ``source``, with
+    the chunk shape and compression ``filters`` (see
+    chunk_compression.get_filters), which is replaced when the source file
+    changes.
+    """
+    source = os.path.abspath(source)
+    key = repr((source, os.path.getmtime(source), data_path, tuple(chunks),
+                sorted((filters or {}).items())))
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(
+        path, "%s_%s.h5" % (name, hashlib.sha1(key).hexdigest()[:16]))
+
+
+def __create_cache(data, path, filename, chunks, filters):
+    """ Copy the raw data to a temporary file that is renamed once it is
+    complete.  A failed copy is removed.
+
+    :returns: whether the copy was made.
+    :rtype: bool
+    """
+    logging.info("Caching %s of %s in %s", data.name, data.file.filename,
+                 filename)
+    tmpname = "%s.%i.tmp" % (filename, os.getpid())
+    try:
+        if not os.path.exists(path):
+            os.makedirs(path)
+        __copy(data, tmpname, chunks, filters)
+        os.rename(tmpname, filename)
+    except Exception as e:
+        logging.error("Failed to cache %s of %s: %s", data.name,
+                      data.file.filename, e)
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        return False
+    return True
+
+
+def __copy(data, filename, chunks, filters):
+    """ Copy a dataset, a row of chunks at a time. """
+    with h5py.File(filename, 'w') as cache:
+        copy = cache.create_dataset('data', data.shape, data.dtype,
+                                    chunks=chunks, **filters)
+        copy.attrs['source'] = os.path.abspath(data.file.filename)
+        copy.attrs['data_path'] = data.name
+        step = chunks[0]
+        frames = np.empty((step,) + data.shape[1:], dtype=data.dtype)
+        for start in range(0, data.shape[0], step):
+            stop = min(start + step, data.shape[0])
+            sl = np.s_[start:stop]
+            data.read_direct(frames, source_sel=sl,
+                             dest_sel=np.s_[0:stop - start])
+            copy.write_direct(frames, source_sel=np.s_[0:stop - start],
+                              dest_sel=sl)
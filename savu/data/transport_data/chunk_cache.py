@@ -0,0 +1,132 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_cache
+   :platform: Unix
+   :synopsis: Sizes the hdf5 chunk cache of a dataset to hold the chunks of \
+   a slice group.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import itertools
+import collections
+import numpy as np
+import h5py
+
+# the hdf5 default
+DEFAULT_NBYTES = 1024**2
+# the slice groups used to estimate the hit rate of a cache
+MAX_SIMULATED = 128
+
+
+def get_chunk_indices(slice_tup, shape, chunks):
+    """ The indices of the chunks in each dimension that a selection
+    touches.
+
+    :rtype: list(np.ndarray)
+    """
+    indices = []
+    for sl, n, c in zip(slice_tup, shape, chunks):
+        if isinstance(sl, slice):
+            idx = np.arange(*sl.indices(n))
+        else:
+            idx = np.ravel(np.asarray(sl))
+            if idx.dtype == bool:
+                idx = np.where(idx)[0]
+        indices.append(np.unique(idx // c))
+    return indices
+
+
+def get_chunks_touched(slice_list, shape, chunks):
+    """ The most chunks touched by a slice group of the list. """
+    touched = 0
+    for sl in itertools.islice(slice_list, MAX_SIMULATED):
+        touched = max(touched, int(np.prod(
+            [len(i) for i in get_chunk_indices(sl, shape, chunks)])))
+    return touched
+
+
+def estimate_hit_rate(slice_list, shape, chunks, nChunks):
+    """ Estimate the fraction of chunk accesses that are found in a least
+    recently used cache of ``nChunks`` chunks, when the slice groups are read
+    or written in turn.  hdf5 does not report the hit rate of the chunk
+    cache.
+    """
+    cache = collections.OrderedDict()
+    hits = accesses = 0
+    for sl in itertools.islice(slice_list, MAX_SIMULATED):
+        for chunk in itertools.product(
+                *[i.tolist() for i in get_chunk_indices(sl, shape, chunks)]):
+            accesses += 1
+            if chunk in cache:
+                hits += 1
+                del cache[chunk]
+            elif len(cache) >= nChunks and cache:
+                cache.popitem(last=False)
+            if nChunks:
+                cache[chunk] = None
+    return hits/float(accesses) if accesses else 0.0
+
+
+def get_nslots(nChunks):
+    """ The number of hash table slots for a cache of ``nChunks`` chunks,
+    which is a prime about 100 times the number of chunks, as recommended by
+    hdf5.
+    """
+    n = max(100*nChunks, 521)
+    n += 1 - n % 2
+    while [d for d in xrange(3, int(n**0.5) + 1, 2) if n % d == 0]:
+        n += 2
+    return n
+
+
+def share_budget(needs, budget):
+    """ Share the budget between the datasets in proportion to the cache each
+    one needs, but not below the hdf5 default.
+    """
+    total = float(sum(needs))
+    scale = min(1.0, budget/total) if total else 1.0
+    return [max(int(n*scale), DEFAULT_NBYTES) for n in needs]
+
+
+def set_chunk_cache(dataset, nbytes, nslots, w0):
+    """ Reopen a dataset with a chunk cache of ``nbytes``.  hdf5 ignores the
+    cache of a dataset that is already open, so the dataset is closed first
+    and the h5py object is bound to the reopened dataset, which keeps other
+    references to it valid.  If the dataset is open elsewhere it is not
+    changed.
+
+    :returns: True if the cache is set.
+    :rtype: bool
+    """
+    name = h5py.h5i.get_name(dataset.id)
+    fid = h5py.h5i.get_file_id(dataset.id)
+    if __is_open_elsewhere(dataset, fid, name):
+        return False
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(nslots, nbytes, w0)
+    dataset.id._close()
+    h5py.Dataset.__init__(dataset, h5py.h5d.open(fid, name, dapl))
+    return True
+
+
+def __is_open_elsewhere(dataset, fid, name):
+    # the identifiers returned hold a reference to the dataset until they
+    # are released
+    ids = h5py.h5f.get_obj_ids(fid, h5py.h5f.OBJ_DATASET)
+    return len([i for i in ids if i.id != dataset.id.id and
+                h5py.h5i.get_name(i) == name]) > 0
@@ -0,0 +1,225 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_compression
+   :platform: Unix
+   :synopsis: Compresses the chunks of a slice group in worker threads and \
+   writes them to an hdf5 dataset with direct chunk writes.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import time
+import zlib
+import itertools
+import numpy as np
+
+from multiprocessing.pool import ThreadPool
+
+# the deflate level of gzip compression, which favours speed
+GZIP_LEVEL = 1
+# the memory limit for the chunks that slice groups have partly written
+MAX_BUFFERED = 256e6
+
+
+def get_filters(options):
+    """ The keyword arguments for create_dataset that compress a dataset,
+    from the ``compression`` option.
+
+    :rtype: dict
+    """
+    compression = options.get('compression', None)
+    if not compression:
+        return {}
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': GZIP_LEVEL,
+                'shuffle': True}
+    return {'compression': compression, 'shuffle': True}
+
+
+class ChunkCompressor(object):
+    """ Writes the slice groups of a compressed dataset.  The frames are
+    gathered into the chunks of the dataset, and each chunk, once complete,
+    is shuffled and deflated in a pool of threads (zlib releases the GIL)
+    while the next slice group is processed.  The compressed chunks are
+    written with write_direct_chunk, which bypasses the hdf5 filter pipeline.
+    Datasets that are not compressed with shuffle and gzip are written
+    through h5py.
+
+    Slice groups must not overlap: a chunk is complete once as many elements
+    have been written to it as it holds.
+
+    :param h5py.Dataset dataset: the compressed dataset.
+    :param int workers: the number of compression threads.
+    :param int nbytes: the memory limit for incomplete chunks.  Frames for
+        further chunks are written through h5py.
+    """
+
+    def __init__(self, dataset, workers, nbytes=MAX_BUFFERED):
+        self.dataset = dataset
+        self.direct = dataset.compression == 'gzip' and dataset.shuffle and \
+            dataset.chunks is not None and not dataset.fletcher32 and \
+            not dataset.scaleoffset
+        self.level = dataset.compression_opts
+        self.pool = ThreadPool(max(workers, 1)) if self.direct else None
+        self.max_partial = nbytes
+        # offset: [chunk, elements written, regions written]
+        self.partial = {}
+        self.pending = []
+        # bytes written, and the thread and frame loop time spent compressing
+        self.nbytes = 0
+        self.seconds = 0.0
+        self.waited = 0.0
+
+    def write(self, slice_tup, frames):
+        """ Write the frames of a slice group.  Compressed chunks are written
+        when the next slice group arrives, or on flush.
+
+        :returns: False if the frames are not written (the caller writes
+            them).
+        """
+        self.nbytes += np.size(frames)*self.dataset.dtype.itemsize
+        ranges = self.__get_ranges(slice_tup) if self.direct else None
+        if ranges is None:
+            return False
+        shape = tuple([b - a for a, b in ranges])
+        frames = np.asarray(frames, dtype=self.dataset.dtype)
+        if frames.size != np.prod(shape):
+            return False
+        frames = frames.reshape(shape)
+        self.flush()
+
+        chunks = self.dataset.chunks
+        for offset in itertools.product(*[range(a - a % c, b, c) for (a, b), c
+                                          in zip(ranges, chunks)]):
+            # the part of the chunk in the frames, and the part of the frames
+            # in the chunk
+            inner = [(max(a, o), min(b, o + c, n)) for (a, b), o, c, n in
+                     zip(ranges, offset, chunks, self.dataset.shape)]
+            in_chunk = tuple([slice(i - o, j - o) for (i, j), o in
+                              zip(inner, offset)])
+            in_frames = tuple([slice(i - a, j - a) for (i, j), (a, b) in
+                               zip(inner, ranges)])
+            self.__add(offset, in_chunk, frames[in_frames])
+        return True
+
+    def __get_ranges(self, slice_tup):
+        """ The start and stop of a selection in each dimension, or None if
+        it is stepped.
+        """
+        if len(slice_tup) != len(self.dataset.shape):
+            return None
+        ranges = []
+        for sl, n in zip(slice_tup, self.dataset.shape):
+            if not isinstance(sl, slice):
+                sl = slice(sl, sl + 1, 1)
+            start, stop, step = sl.indices(n)
+            if step != 1 or stop <= start:
+                return None
+            ranges.append((start, stop))
+        return ranges
+
+    def __add(self, offset, in_chunk, block):
+        chunks = self.dataset.chunks
+        size = np.prod([min(c, n - o) for o, c, n in
+                        zip(offset, chunks, self.dataset.shape)])
+        if offset not in self.partial:
+            if block.size == size:
+                # the whole chunk (the chunks at the end of the dataset are
+                # stored in full)
+                if block.shape == chunks:
+                    chunk = np.array(block)
+                else:
+                    chunk = np.zeros(chunks, self.dataset.dtype)
+                    chunk[in_chunk] = block
+                self.__compress(offset, chunk)
+                return
+            if (len(self.partial) + 1)*np.prod(chunks) * \
+                    self.dataset.dtype.itemsize > self.max_partial:
+                self.__write_region(offset, in_chunk, block)
+                return
+            self.partial[offset] = \
+                [np.zeros(chunks, self.dataset.dtype), 0, []]
+        entry = self.partial[offset]
+        entry[0][in_chunk] = block
+        entry[1] += block.size
+        entry[2].append(in_chunk)
+        if entry[1] == size:
+            del self.partial[offset]
+            self.__compress(offset, entry[0])
+
+    def __compress(self, offset, chunk):
+        self.pending.append(
+            (offset, self.pool.apply_async(_compress, (chunk, self.level))))
+
+    def __write_region(self, offset, in_chunk, block):
+        """ Write part of a chunk through h5py. """
+        self.dataset[tuple([slice(o + sl.start, o + sl.stop) for o, sl in
+                            zip(offset, in_chunk)])] = block
+
+    def flush(self):
+        """ Write the compressed chunks of the last slice group. """
+        start = time.time()
+        for offset, result in self.pending:
+            data, seconds = result.get()
+            self.seconds += seconds
+            self.dataset.id.write_direct_chunk(offset, data, 0)
+        self.pending = []
+        self.waited += time.time() - start
+
+    def close(self):
+        """ Write the remaining chunks, with the parts of incomplete chunks
+        written through h5py.
+        """
+        self.flush()
+        for offset, (chunk, _, regions) in sorted(self.partial.items()):
+            for in_chunk in regions:
+                self.__write_region(offset, in_chunk, chunk[in_chunk])
+        self.partial = {}
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def get_stats(self):
+        """ The bytes written by this process, the bytes they are stored in,
+        the thread time spent compressing and the time the frame loop waited
+        for it.
+        """
+        return (self.nbytes, self.dataset.id.get_storage_size(),
+                self.seconds, self.waited)
+
+
+def _compress(chunk, level):
+    start = time.time()
+    shuffled = chunk.view(np.uint8).reshape(-1, chunk.dtype.itemsize).T
+    data = zlib.compress(shuffled.tobytes(), level)
+    return data, time.time() - start
+
+
+def get_report(name, stats):
+    """ A message on the compression of a dataset.
+
+    :param list(tuple) stats: the stats of each process (see
+        ChunkCompressor.get_stats).
+    """
+    nbytes, stored, seconds, waited = [sum(s) for s in zip(*stats)]
+    message = "%s: compressed %.1f MB to %.1f MB (ratio %.2f)" % \
+        (name, nbytes/1e6, stored/1e6, nbytes/float(max(stored, 1)))
+    if seconds:
+        message += ", %.2fs of thread time (%.1f MB/s), %.2fs waiting" % \
+            (seconds, nbytes/1e6/seconds, waited)
+    return message
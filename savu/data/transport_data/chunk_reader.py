@@ -0,0 +1,312 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_reader
+   :platform: Unix
+   :synopsis: Reads the raw chunks of a compressed hdf5 dataset and \
+   decompresses them in a pool of threads.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import zlib
+import ctypes
+import struct
+import logging
+import itertools
+import collections
+import h5py
+import numpy as np
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import lz4.block as lz4
+except ImportError:
+    lz4 = None
+try:
+    import bitshuffle
+except ImportError:
+    bitshuffle = None
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
+# hdf5 filter ids
+DEFLATE = 1
+SHUFFLE = 2
+LZ4 = 32004
+BITSHUFFLE = 32008
+BLOSC = 32001
+
+
+def __unshuffle(data, dtype, values):
+    itemsize = dtype.itemsize
+    size = len(data) - len(data) % itemsize
+    array = np.frombuffer(data, np.uint8, size)
+    return array.reshape(itemsize, -1).T.tobytes() + data[size:]
+
+
+def __inflate(data, dtype, values):
+    return zlib.decompress(data)
+
+
+def __lz4(data, dtype, values):
+    """ The hdf5 lz4 filter: the total size and block size, then each block
+    with its compressed size (stored as is if it did not compress).
+    """
+    total, block = struct.unpack('>QI', data[:12])
+    out, pos = [], 12
+    while total > 0:
+        n = min(block, total)
+        size = struct.unpack('>I', data[pos:pos + 4])[0]
+        pos += 4
+        chunk = data[pos:pos + size]
+        out.append(chunk if size == n else
+                   lz4.decompress(chunk, uncompressed_size=n))
+        pos += size
+        total -= n
+    return b''.join(out)
+
+
+def __bitshuffle(data, dtype, values):
+    """ The hdf5 bitshuffle filter, with or without lz4 compression.  The
+    total size and block size are only written before the data if it is
+    compressed, else the block size (in elements) is a filter value.
+    """
+    if len(values) > 4 and values[4] == 2:
+        total, block = struct.unpack('>QI', data[:12])
+        array = np.frombuffer(data, np.uint8, offset=12)
+        frames = bitshuffle.decompress_lz4(
+            array, (total // dtype.itemsize,), dtype, block // dtype.itemsize)
+    else:
+        block = values[3] if len(values) > 3 else 0
+        array = np.frombuffer(data, dtype, len(data) // dtype.itemsize)
+        frames = bitshuffle.bitunshuffle(array, block)
+    return frames.tobytes()
+
+
+def __blosc(data, dtype, values):
+    return blosc.decompress(data)
+
+
+# the filters that can be decoded, and the module they need
+DECODERS = {DEFLATE: (__inflate, zlib), SHUFFLE: (__unshuffle, np),
+            LZ4: (__lz4, lz4), BITSHUFFLE: (__bitshuffle, bitshuffle),
+            BLOSC: (__blosc, blosc)}
+
+
+def _read_h5py_chunk(dataset, offset):
+    return dataset.id.read_direct_chunk(offset)
+
+
+def _read_hdf5_chunk(dataset, offset):
+    """ Read a raw chunk with H5Dread_chunk (hdf5 1.10.2 and later), called
+    through ctypes in the hdf5 library h5py is linked to, holding the h5py
+    lock.
+    """
+    offset = (ctypes.c_ulonglong*len(offset))(*offset)
+    nbytes = ctypes.c_ulonglong(0)
+    mask = ctypes.c_uint32(0)
+    with h5py._objects.phil:
+        if _hdf5.H5Dget_chunk_storage_size(
+                dataset.id.id, offset, ctypes.byref(nbytes)) < 0 or \
+                not nbytes.value:
+            raise RuntimeError("The chunk %s has not been written" %
+                               list(offset))
+        buf = ctypes.create_string_buffer(nbytes.value)
+        if _hdf5.H5Dread_chunk(dataset.id.id, 0, offset, ctypes.byref(mask),
+                               buf) < 0:
+            raise RuntimeError("Failed to read the chunk %s" % list(offset))
+    return mask.value, buf.raw
+
+
+def __load_hdf5():
+    """ The hdf5 library h5py is linked to, if it has H5Dread_chunk, else
+    None.  It is found in the libraries mapped into this process, as another
+    copy of the library would not know the h5py identifiers.
+    """
+    try:
+        with open('/proc/self/maps') as f:
+            paths = set([line.split()[-1] for line in f if
+                         '/libhdf5' in line and '/libhdf5_' not in line])
+        if len(paths) != 1:
+            return None
+        lib = ctypes.CDLL(paths.pop())
+        lib.H5Dread_chunk.argtypes = [
+            ctypes.c_int64, ctypes.c_int64,
+            ctypes.POINTER(ctypes.c_ulonglong),
+            ctypes.POINTER(ctypes.c_uint32), ctypes.c_void_p]
+        lib.H5Dget_chunk_storage_size.argtypes = [
+            ctypes.c_int64, ctypes.POINTER(ctypes.c_ulonglong),
+            ctypes.POINTER(ctypes.c_ulonglong)]
+        return lib
+    except (IOError, OSError, AttributeError):
+        return None
+
+
+def __get_chunk_reader():
+    """ The function that reads the raw chunks of a dataset as bytes, or
+    None if they can not be read.  Under Python 2, h5py 2.10 returns the
+    text of the array the chunk is read into, so the hdf5 library is called
+    directly.
+    """
+    f = h5py.File('direct_chunk_reads', 'w', driver='core',
+                  backing_store=False)
+    try:
+        data = f.create_dataset('data', data=np.arange(4, dtype=np.uint8),
+                                chunks=(4,))
+        for read in [_read_h5py_chunk, _read_hdf5_chunk]:
+            try:
+                if read(data, (0,))[1] == b'\0\1\2\3':
+                    return read
+            except (AttributeError, RuntimeError):
+                pass
+        return None
+    finally:
+        f.close()
+
+_hdf5 = __load_hdf5()
+# reads a raw chunk as (filter mask, bytes)
+read_chunk = __get_chunk_reader()
+DIRECT_CHUNK_READS = read_chunk is not None
+
+
+def get_filters(dataset):
+    """ The filter pipeline of a chunked dataset, if every filter in it can
+    be decoded, else None.
+
+    :returns: the id and values of each filter, in the order they are
+        applied when writing.
+    :rtype: list(tuple) or None
+    """
+    if dataset.chunks is None or not DIRECT_CHUNK_READS:
+        return None
+    plist = dataset.id.get_create_plist()
+    filters = []
+    for i in range(plist.get_nfilters()):
+        code, flags, values, name = plist.get_filter(i)
+        if code not in DECODERS or DECODERS[code][1] is None:
+            logging.debug("%s: the %s filter is decoded by h5py",
+                          dataset.name, name)
+            return None
+        filters.append((code, values))
+    return filters
+
+
+def _decode(data, mask, filters, dtype, chunks):
+    for i, (code, values) in reversed(list(enumerate(filters))):
+        if not mask & (1 << i):
+            data = DECODERS[code][0](data, dtype, values)
+    return np.frombuffer(data, dtype, int(np.prod(chunks))).reshape(chunks)
+
+
+class ChunkReader(object):
+    """ Reads slice groups of a compressed dataset.  The raw chunks a slice
+    group touches are read (see read_chunk), decompressed in a pool of
+    threads and copied into the slice group.  The most recently used chunks
+    are kept, up to ``nbytes``, for the slice groups that share them.
+
+    :param h5py.Dataset dataset: the dataset that is read.
+    :param list(tuple) filters: the filter pipeline (see get_filters).
+    :param int workers: the number of decompression threads.
+    :param int nbytes: the memory limit for decompressed chunks.
+    """
+
+    def __init__(self, dataset, filters, workers, nbytes):
+        self.dataset = dataset
+        self.filters = filters
+        self.pool = ThreadPool(max(workers, 1))
+        chunk_bytes = dataset.dtype.itemsize*int(np.prod(dataset.chunks))
+        self.max_chunks = max(int(nbytes // chunk_bytes), 1)
+        self.cache = collections.OrderedDict()
+
+    def read(self, slice_tup):
+        """ Read a selection of slices and indices with a step of 1.
+
+        :returns: the frames, or None if the selection is not supported.
+        """
+        ranges = self.__get_ranges(slice_tup)
+        if ranges is None:
+            return None
+        chunks = self.dataset.chunks
+        shape = tuple([b - a for a, b in ranges])
+        frames = np.empty(shape, dtype=self.dataset.dtype)
+        offsets = list(itertools.product(
+            *[range(a - a % c, b, c) for (a, b), c in zip(ranges, chunks)]))
+        for offset, chunk in zip(offsets, self.__get_chunks(offsets)):
+            inner = [(max(a, o), min(b, o + c)) for (a, b), o, c in
+                     zip(ranges, offset, chunks)]
+            frames[tuple([slice(i - a, j - a) for (i, j), (a, b) in
+                          zip(inner, ranges)])] = \
+                chunk[tuple([slice(i - o, j - o) for (i, j), o in
+                             zip(inner, offset)])]
+        return frames.reshape([len(xrange(*sl.indices(n))) for sl, n in
+                               zip(slice_tup, self.dataset.shape) if
+                               isinstance(sl, slice)])
+
+    def __get_ranges(self, slice_tup):
+        if len(slice_tup) != len(self.dataset.shape):
+            return None
+        ranges = []
+        for sl, n in zip(slice_tup, self.dataset.shape):
+            if isinstance(sl, (int, long, np.integer)):
+                sl = slice(sl, sl + 1, 1)
+            if not isinstance(sl, slice):
+                return None
+            start, stop, step = sl.indices(n)
+            if step != 1 or stop <= start:
+                return None
+            ranges.append((start, stop))
+        return ranges
+
+    def __get_chunks(self, offsets):
+        """ The decompressed chunks, read in order in this thread (the hdf5
+        library is not called from more than one thread) and decompressed as
+        they arrive.
+        """
+        results = []
+        for offset in offsets:
+            if offset in self.cache:
+                self.cache[offset] = self.cache.pop(offset)
+                results.append(self.cache[offset])
+                continue
+            try:
+                mask, data = read_chunk(self.dataset, offset)
+            except RuntimeError:
+                # the chunk has not been written
+                results.append(np.full(self.dataset.chunks,
+                                       self.dataset.fillvalue,
+                                       self.dataset.dtype))
+                continue
+            results.append(self.pool.apply_async(
+                _decode, (data, mask, self.filters, self.dataset.dtype,
+                          self.dataset.chunks)))
+        chunks = []
+        for offset, result in zip(offsets, results):
+            if not isinstance(result, np.ndarray):
+                result = result.get()
+                self.cache[offset] = result
+                if len(self.cache) > self.max_chunks:
+                    self.cache.popitem(last=False)
+            chunks.append(result)
+        return chunks
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.cache.clear()
@@ -0,0 +1,307 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: dist_array_transport_data
+   :platform: Unix
+   :synopsis: A data transport class that is inherited by Data class at \
+   runtime.  Intermediate datasets are distributed arrays, held in the \
+   memory of the processes that wrote them, and final results are saved to \
+   hdf5.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+import logging
+import numpy as np
+
+import savu.core.utils as cu
+from savu.data.transport_data.hdf5_transport_data import Hdf5TransportData
+
+
+class DistArray(object):
+    """ A dataset that is distributed over the memory of all processes,
+    which replaces the hdf5 file as the backing of a dataset.
+
+    Each process owns the blocks of the dataset that it wrote, one for each
+    run of adjacent slice groups.  Before a plugin reads the dataset, every
+    process is sent the block (a box, including padding) that its slice list
+    covers by the processes that own it, so a change of pattern (e.g.
+    PROJECTION to SINOGRAM) is an exchange between the processes rather than
+    a round trip through an hdf5 file.
+    """
+
+    def __init__(self, name, shape, dtype, comm):
+        self.filename = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.comm = comm
+        self.owned = []
+        self.view = None
+
+    @property
+    def nbytes(self):
+        return sum([a.nbytes for b, a in self.owned])
+
+    def allocate(self, boxes):
+        """ Allocate the blocks that this process writes.
+
+        :param list(tuple) boxes: the (start, stop) of each dimension for
+            each block.
+        """
+        self.owned = [(b, np.zeros(_box_shape(b), self.dtype)) for b in boxes]
+
+    def gather(self, box):
+        """ Fetch the block ``box`` (None if nothing is read) from the
+        processes that own it, ready to be read.  This is collective over
+        the communicator.
+        """
+        owned_all = self.comm.allgather([b for b, a in self.owned])
+        needed_all = self.comm.allgather(box)
+        rank = self.comm.rank
+
+        if all([n is None or o == [n] for o, n in zip(owned_all,
+                                                      needed_all)]):
+            # each process reads the block it wrote
+            self.view = (box, self.owned[0][1]) if box else None
+            return
+
+        view = np.zeros(_box_shape(box), self.dtype) if box else None
+        for shift in range(self.comm.size):
+            dest = (rank + shift) % self.comm.size
+            source = (rank - shift) % self.comm.size
+            send = [a[_local(i, b)] for b, a in self.owned for i in
+                    [_intersect(b, needed_all[dest])] if i]
+            recv = [i for b in owned_all[source] for i in
+                    [_intersect(b, box)] if i]
+            sendbuf = _pack(send, self.dtype)
+            recvbuf = np.empty(sum([np.prod(_box_shape(i)) for i in recv]),
+                               self.dtype)
+            if dest == rank:
+                recvbuf = sendbuf
+            else:
+                self.comm.Sendrecv(sendbuf.view(np.uint8), dest,
+                                   recvbuf=recvbuf.view(np.uint8),
+                                   source=source)
+            start = 0
+            for i in recv:
+                size = int(np.prod(_box_shape(i)))
+                view[_local(i, box)] = \
+                    recvbuf[start:start+size].reshape(_box_shape(i))
+                start += size
+        self.view = (box, view) if box else None
+
+    def release(self):
+        """ Remove the block fetched for reading. """
+        self.view = None
+
+    def close(self):
+        """ Free the memory. """
+        self.owned = []
+        self.view = None
+
+    def __getitem__(self, index):
+        box, array = self.__find(index, [self.view] if self.view else [])
+        return array[_local(_index_box(index, self.shape), box, index)]
+
+    def __setitem__(self, index, value):
+        box, array = self.__find(index, self.owned)
+        array[_local(_index_box(index, self.shape), box, index)] = value
+
+    def __find(self, index, blocks):
+        ibox = _index_box(index, self.shape)
+        for box, array in blocks + self.owned:
+            if _intersect(ibox, box) == ibox:
+                return box, array
+        raise IndexError("%s is not held by process %i of %s" %
+                         (str(index), self.comm.rank, self.filename))
+
+
+def _box_shape(box):
+    return tuple([stop - start for start, stop in box])
+
+
+def _intersect(box1, box2):
+    """ The overlap of two boxes, or None. """
+    if box1 is None or box2 is None:
+        return None
+    box = tuple([(max(a[0], b[0]), min(a[1], b[1])) for a, b in
+                 zip(box1, box2)])
+    return None if [b for b in box if b[0] >= b[1]] else box
+
+
+def _index_box(index, shape):
+    """ The box that contains the slices (or integers) in ``index``. """
+    index = index if isinstance(index, tuple) else (index,)
+    box = []
+    for dim in range(len(shape)):
+        sl = index[dim] if dim < len(index) else slice(None)
+        if isinstance(sl, slice):
+            start, stop, step = sl.indices(shape[dim])
+            # up to and including the last element
+            box.append((start, start + ((stop - start - 1)//step)*step + 1))
+        else:
+            box.append((sl, sl+1))
+    return tuple(box)
+
+
+def _local(inner, box, index=None):
+    """ Convert the box ``inner`` (or the ``index`` it contains) to an index
+    into the array that holds ``box``.
+    """
+    if index is None:
+        return tuple([slice(i[0] - b[0], i[1] - b[0]) for i, b in
+                      zip(inner, box)])
+    index = index if isinstance(index, tuple) else (index,)
+    local = []
+    for dim in range(len(box)):
+        sl = index[dim] if dim < len(index) else slice(None)
+        if isinstance(sl, slice):
+            local.append(slice(inner[dim][0] - box[dim][0],
+                               inner[dim][1] - box[dim][0], sl.step))
+        else:
+            local.append(sl - box[dim][0])
+    return tuple(local)
+
+
+def _pack(arrays, dtype):
+    if not arrays:
+        return np.empty(0, dtype)
+    return np.concatenate([a.ravel() for a in arrays])
+
+
+def get_boxes(slice_list, shape, padding=None):
+    """ The boxes covered by a slice list, merging adjacent slice groups.
+
+    :param list(tuple(slice)) slice_list: the slice list of a process.
+    :param tuple shape: the shape of the dataset.
+    :param dict padding: the padding for each dimension.
+    :returns: a list of boxes (the (start, stop) of each dimension).
+    """
+    boxes = []
+    for sl in slice_list:
+        box = list(_index_box(tuple(sl), shape))
+        for dim, pad in (padding or {}).iteritems():
+            box[dim] = (max(0, box[dim][0] - pad),
+                        min(shape[dim], box[dim][1] + pad))
+        box = tuple(box)
+        if boxes and __adjacent(boxes[-1], box):
+            boxes[-1] = tuple([(min(a[0], b[0]), max(a[1], b[1])) for a, b
+                               in zip(boxes[-1], box)])
+        else:
+            boxes.append(box)
+    return boxes
+
+
+def __adjacent(box1, box2):
+    """ Can the boxes be merged into one (they differ in one dimension, where
+    they touch or overlap)?
+    """
+    diff = [d for d in range(len(box1)) if box1[d] != box2[d]]
+    if len(diff) > 1:
+        return False
+    if not diff:
+        return True
+    a, b = box1[diff[0]], box2[diff[0]]
+    return a[0] <= b[1] and b[0] <= a[1]
+
+
+class DistArrayTransportData(Hdf5TransportData):
+    """
+    The DistArrayTransportData class keeps the intermediate datasets in the
+    memory of the processes, as distributed arrays, falling back to the hdf5
+    transport for final results and datasets that can not be distributed.
+    """
+
+    def __init__(self):
+        super(DistArrayTransportData, self).__init__()
+
+    def _create_backing(self, saver_plugin, count):
+        """ Create a distributed array for each of the output datasets of
+        plugin number ``count`` that is not a final result.  The memory is
+        allocated when the plugin runs.
+        """
+        expInfo = self.exp.meta_data
+        plugin_list = expInfo.plugin_list
+        final = count == \
+            (plugin_list.n_plugins - plugin_list.n_loaders - 1)
+
+        for key, data in self.exp.index["out_data"].iteritems():
+            shape = data.get_shape()
+            if final or expInfo.get_meta_data(["filename", key]) is None \
+                    or 'var' in shape or data.mapping:
+                continue
+            group_name = expInfo.get_meta_data(["group_name", key])
+            data.data_info.set_meta_data('group_name', group_name)
+            dtype = np.float32 if data.dtype is None else data.dtype
+            data.backing_file = DistArray('distributed array (%s)' %
+                                          group_name, shape, dtype,
+                                          cu.COMM_WORLD)
+            data.data = data.backing_file
+            logging.debug("Distributing %s in memory", group_name)
+
+        saver_plugin.setup()
+
+    def _is_distributed(self):
+        return isinstance(self.backing_file, DistArray)
+
+    def _allocate(self, slice_list):
+        """ Allocate the blocks of the distributed array that this process
+        writes.
+        """
+        self.backing_file.allocate(get_boxes(slice_list, self.get_shape()))
+        logging.debug("Holding %i bytes of %s", self.backing_file.nbytes,
+                      self.backing_file.filename)
+
+    def _gather(self, slice_list):
+        """ Fetch the block of the distributed array that this process
+        reads, including padding.  This is collective.
+        """
+        padding = self._get_padding_dict() if \
+            self._get_plugin_data().padding is not None else None
+        boxes = get_boxes(slice_list, self.get_shape(), padding)
+        box = None
+        if boxes:
+            box = tuple([(min(b[d][0] for b in boxes),
+                          max(b[d][1] for b in boxes))
+                         for d in range(len(boxes[0]))])
+        self.backing_file.gather(box)
+
+    def _get_padded_slice_data(self, input_slice_list):
+        """ As for hdf5, the plugin is given a copy of the frames, so that
+        changing them does not change the dataset.
+        """
+        data = super(DistArrayTransportData, self)._get_padded_slice_data(
+            input_slice_list)
+        if self._is_distributed():
+            return np.array(data)
+        return data
+
+    def _save_data(self, link_type):
+        """ Distributed arrays are not linked in the nexus file, as they do
+        not exist after the run.
+        """
+        if not self._is_distributed():
+            return super(DistArrayTransportData, self)._save_data(link_type)
+        logging.info('save_data _barrier')
+        self.exp._barrier()
+
+    def _close_file(self):
+        """ Free the distributed array, or close the hdf5 backing file. """
+        if not self._is_distributed():
+            return super(DistArrayTransportData, self)._close_file()
+        logging.debug("Freeing %s", self.backing_file.filename)
+        self.backing_file.close()
+        self.backing_file = None
+        self.data = None
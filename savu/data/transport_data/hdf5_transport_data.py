@@ -22,12 +22,26 @@
 
 """
 import os
+import copy
 import h5py
 import logging
 import numpy as np
 
+import savu.core.utils as cu
+import savu.core.trace as trace
+import savu.core.mpi_io as mpi_io
 import savu.plugins.utils as pu
+import savu.core.plugin_fusion as fusion
+import savu.data.transport_data.slice_index as si
+import savu.data.transport_data.read_planner as rp
+import savu.data.transport_data.chunk_cache as cc
+import savu.data.transport_data.rank_files as rf
+import savu.data.transport_data.chunk_compression as comp
+import savu.data.transport_data.memory_map as mm
+import savu.data.transport_data.chunk_reader as cr
+import savu.data.transport_data.strided_reads as sr
 from savu.data.data_structures.data_add_ons import Padding
+from savu.plugins.loaders.savu_loader import SavuLoader
 
 NX_CLASS = 'NX_class'
 
@@ -38,6 +52,29 @@ class Hdf5TransportData(object):
     specific to a hdf5 transport mechanism.
     """
 
+    # the frames at the end of the last slice group read (see
+    # __read_with_halo)
+    __halo = None
+    # the merged reads of the slice groups of this process (see _plan_reads)
+    __read_plan = None
+    # a read-only memory map of a contiguous dataset (see _map_data)
+    __memmap = None
+    # decompresses the chunks of a compressed dataset in threads (see
+    # _read_chunks)
+    __chunk_reader = None
+    # the largest bulk read and the strategy for stepped selections (see
+    # _set_strided_reads)
+    __strided = None
+    # write the slice groups with collective operations
+    __collective = False
+    # the file of this process, and the slice groups written to it, when the
+    # processes write to their own files (see _create_rank_file)
+    __rank_file = None
+    __rank_regions = None
+    # compresses the chunks of a compressed dataset in threads (see
+    # __get_compressor)
+    __compressor = None
+
     def __init__(self):
         self.backing_file = None
 
@@ -59,10 +96,12 @@ class Hdf5TransportData(object):
                 datasets_list[count-n_loaders:])
             plugin_id = plugin_dict["id"]
             logging.info("Loading plugin %s", plugin_id)
-            plugin = pu.plugin_loader(exp, plugin_dict)
-            plugin._revert_preview(plugin.get_in_datasets())
-            self.__set_filenames(plugin, plugin_id, count)
-            saver_plugin.setup()
+            with trace.span('setup', plugin_id) as span:
+                plugin = pu.plugin_loader(exp, plugin_dict)
+                span.set_plugin(plugin.name)
+                plugin._revert_preview(plugin.get_in_datasets())
+                self.__set_filenames(plugin, plugin_id, count)
+                self._create_backing(saver_plugin, count)
 
             out_data_objects.append(exp.index["out_data"].copy())
             exp._merge_out_data_to_in()
@@ -71,6 +110,100 @@ class Hdf5TransportData(object):
         self.exp.meta_data.delete('current_and_next')
         return out_data_objects, count
 
+    def _resume_data(self, start):
+        """ Rebuild the experiment index from the output files of a previous
+        run of the process list that did not complete.  The plugins are set up
+        in turn, as in _load_data, until a saved output dataset is found that
+        was not completed, and the run continues from the last plugin after
+        which all of the datasets still required are complete.
+
+        :param int start: the index of the first plugin after the loaders.
+        :returns: the index of the first plugin to run.
+        :rtype: int
+        """
+        exp = self.exp
+        n_loaders = exp.meta_data.plugin_list._get_n_loaders()
+        plugin_list = exp.meta_data.plugin_list.plugin_list
+        datasets_list = exp.meta_data.plugin_list._get_datasets_list()
+
+        resume = (start, copy.deepcopy(exp.index['in_data']), {})
+        files = {}
+        # the final plugin is always run
+        for count in range(start, len(plugin_list) - 2):
+            self._get_current_and_next_patterns(
+                datasets_list[count-n_loaders:])
+            plugin_id = plugin_list[count]["id"]
+            plugin = pu.plugin_loader(exp, plugin_list[count])
+            plugin._revert_preview(plugin.get_in_datasets())
+            self.__set_filenames(plugin, plugin_id, count)
+
+            incomplete = False
+            for key in exp.index["out_data"].keys():
+                files[key] = self.__get_complete_file(key)
+                if files[key] is None and \
+                        exp.meta_data.get_meta_data(["filename", key]):
+                    incomplete = True
+            exp._merge_out_data_to_in()
+            if incomplete:
+                break
+            if None not in [files.get(key, '') for key in
+                            exp.index["in_data"].keys()]:
+                resume = (count + 1, copy.deepcopy(exp.index['in_data']),
+                          files.copy())
+
+        start, exp.index['in_data'], files = resume
+        exp.index['out_data'] = {}
+        self.exp.meta_data.delete('current_and_next')
+
+        for key, data in exp.index['in_data'].iteritems():
+            if key in files:
+                data.__reopen_complete_file(*files[key])
+        if files:
+            cu.user_message("Resuming the process list from the %s plugin" %
+                            plugin_list[start]['name'])
+        return start
+
+    def __get_complete_file(self, key):
+        """ The file name and group of output dataset ``key``, if it was
+        completed by a previous run, else None.
+        """
+        expInfo = self.exp.meta_data
+        filename = expInfo.get_meta_data(["filename", key])
+        group_name = expInfo.get_meta_data(["group_name", key])
+        if not filename or not os.path.exists(filename):
+            return None
+        try:
+            with h5py.File(filename, 'r') as backing_file:
+                if backing_file[group_name].attrs.get('complete', False):
+                    return filename, group_name
+        except (IOError, KeyError):
+            logging.debug("Unable to read %s in %s", group_name, filename)
+        return None
+
+    def __reopen_complete_file(self, filename, group_name):
+        """ Use the dataset saved by a previous run as the backing, with the
+        metadata that was saved with it.
+        """
+        logging.info("Reusing %s in %s", group_name, filename)
+        if self.exp.meta_data.get_meta_data("mpi") is True:
+            self.backing_file = h5py.File(
+                filename, 'r', driver='mpio', comm=cu.COMM_WORLD,
+                info=mpi_io.get_info(self.exp.meta_data.get_dictionary()))
+        else:
+            self.backing_file = h5py.File(filename, 'r')
+        self.data_info.set_meta_data('group_name', group_name)
+        self.group_name = group_name
+        self.group = self.backing_file[group_name]
+        self.data = self.group['data']
+        SavuLoader().add_meta_data(self, group_name)
+        self.__add_external_link('intermediate')
+
+    def _create_backing(self, saver_plugin, count):
+        """ Create the backing for the output datasets of plugin number
+        ``count``.  All output datasets are saved to hdf5 files.
+        """
+        saver_plugin.setup()
+
     def __set_filenames(self, plugin, plugin_id, count):
         exp = self.exp
         expInfo = exp.meta_data
@@ -78,6 +211,10 @@ class Hdf5TransportData(object):
             expInfo.plugin_list.n_plugins - expInfo.plugin_list.n_loaders - 1
         expInfo.set_meta_data("filename", {})
         expInfo.set_meta_data("group_name", {})
+        expInfo.set_meta_data("rank_files", {})
+        expInfo.set_meta_data("compress", {})
+        compress = mpi_io.compress_shared_files(
+            expInfo.get_dictionary(), self.__get_nprocs(plugin))
         for key in exp.index["out_data"].keys():
             name = key + '_p' + str(count) + '_' + \
                 plugin_id.split('.')[-1] + '.h5'
@@ -86,22 +223,90 @@ class Hdf5TransportData(object):
             else:
                 out_path = expInfo.get_meta_data('inter_path')
             filename = os.path.join(out_path, name)
+            if not fusion.is_saved(exp, count, key):
+                # passed straight to the next plugin
+                filename = None
+            elif count is not nPlugins and exp.local_tier is not None:
+                filename = exp.local_tier.place(
+                    count, key, filename,
+                    self.__get_nbytes(exp.index["out_data"][key]))
             group_name = "%i-%s-%s" % (count, plugin.name, key)
+            # intermediate datasets may be written to a file per process
+            expInfo.set_meta_data(
+                ["rank_files", key], bool(
+                    filename and count is not nPlugins and
+                    expInfo.get_dictionary().get('per_rank_files', False)))
+            expInfo.set_meta_data(["compress", key], compress)
             exp._barrier()
             logging.debug("(set_filenames) Creating output file after "
                           " _barrier %s", filename)
             expInfo.set_meta_data(["filename", key], filename)
             expInfo.set_meta_data(["group_name", key], group_name)
 
+    def __get_nprocs(self, plugin):
+        """ The number of processes that run the plugin. """
+        from savu.plugins.driver.gpu_plugin import GpuPlugin
+        processes = self.exp.meta_data.get_meta_data('processes')
+        if isinstance(plugin, GpuPlugin):
+            return len([p for p in processes if 'GPU' in p])
+        return len(processes)
+
+    def __get_nbytes(self, data):
+        dtype = data.dtype if data.dtype is not None else np.float32
+        return np.prod(data.get_shape())*np.dtype(dtype).itemsize
+
+    def _create_rank_file(self, chunks):
+        """ Create the file of this process for the dataset, which has the
+        shape of the dataset but only holds the slice groups written by this
+        process.  The files are joined by a virtual dataset in the backing
+        file when the dataset is saved.
+
+        :param chunks: the chunk shape (or True for automatic chunking).
+        :returns: the dataset in the file of this process.
+        """
+        filename = rf.get_rank_filename(self.backing_file.filename,
+                                        cu.COMM_WORLD.rank)
+        logging.debug("Creating the process file %s", filename)
+        self.__rank_file = h5py.File(filename, 'w')
+        self.__rank_regions = []
+        return self.__rank_file.create_dataset(
+            'data', self.get_shape(), self.dtype, chunks=chunks,
+            **rf.get_compression(self.exp.meta_data.get_dictionary()))
+
+    def __join_rank_files(self):
+        """ Close the file of this process and create the virtual dataset
+        that joins the files of all processes.
+        """
+        shape, dtype = self.data.shape, self.data.dtype
+        filename = self.__rank_file.filename
+        regions = rf.merge_regions(self.__rank_regions, shape)
+        self.__rank_file.close()
+        self.__rank_file = self.__rank_regions = None
+        self.exp._barrier()
+        sources = cu.COMM_WORLD.allgather((filename, regions))
+        self.data = rf.create_virtual_dataset(self.group, 'data', shape,
+                                              dtype, sources)
+
+    def __reopen_read_only(self):
+        """ Reopen the backing file of a virtual dataset in each process
+        without the mpio driver, which does not read virtual datasets.
+        """
+        filename = self.backing_file.filename
+        self.backing_file.close()
+        self.backing_file = h5py.File(filename, 'r')
+        self.group = self.backing_file[self.group_name]
+        self.data = self.group['data']
+
     def __add_data_links(self, linkType):
         nxs_filename = self.exp.meta_data.get_meta_data('nxs_filename')
         logging.info("Adding link to file %s", nxs_filename)
 
-        nxs_file = self.exp.nxs_file
-        entry = nxs_file['entry']
         group_name = self.data_info.get_meta_data('group_name')
         self.__output_metadata(self.backing_file[group_name])
+        self.__add_external_link(linkType)
 
+    def __add_external_link(self, linkType):
+        entry = self.exp.nxs_file['entry']
         if linkType is 'final_result':
             name = 'final_result_' + self.get_name()
             entry[name] = \
@@ -112,6 +317,9 @@ class Hdf5TransportData(object):
             entry.attrs['NX_class'] = 'NXcollection'
             entry[name] = \
                 h5py.ExternalLink(self.backing_file.filename, self.group_name)
+            if self.exp.local_tier is not None:
+                self.exp.local_tier.add_link(self.backing_file.filename,
+                                             entry.name + '/' + name)
         else:
             raise Exception("The link type is not known")
 
@@ -164,21 +372,53 @@ class Hdf5TransportData(object):
             nx_data.create_dataset(mData, data=meta_data[mData])
 
     def _save_data(self, link_type):
+        if self.backing_file is None:
+            logging.info("%s is not saved: no link added", self.get_name())
+            self.exp._barrier()
+            return
+        if isinstance(self.data, h5py.Dataset) and \
+                self.data.compression is not None:
+            self.__report_compression()
+        joined = self.__rank_file is not None
+        if joined:
+            self.__join_rank_files()
         self.__add_data_links(link_type)
+        # the dataset is complete, and may be reused by a resumed run
+        self.group.attrs['complete'] = True
+        self.backing_file.flush()
         logging.info('save_data _barrier')
         self.exp._barrier()
+        if joined and self.exp.meta_data.get_meta_data("mpi") is True:
+            self.__reopen_read_only()
+
+    def __report_compression(self):
+        """ Write the remaining chunks and report the compression ratio and
+        the time spent compressing, over all processes.
+        """
+        stats = (0, self.data.id.get_storage_size(), 0, 0)
+        if self.__compressor is not None:
+            self.__compressor.close()
+            stats = self.__compressor.get_stats()
+            self.__compressor = None
+        stats = cu.COMM_WORLD.gather(stats, root=0)
+        if cu.COMM_WORLD.rank == 0:
+            cu.user_message(comp.get_report(self.group_name, stats))
 
     def _close_file(self):
         """
         Closes the backing file and completes work
         """
         if self.backing_file is not None:
+            filename = None
             try:
                 logging.debug("Completing file %s", self.backing_file.filename)
+                filename = self.backing_file.filename
                 self.backing_file.close()
                 self.backing_file = None
             except:
                 pass
+            if filename and self.exp.local_tier is not None:
+                self.exp.local_tier.release(filename, self.exp.nxs_file)
 
     def __chunk_length_repeat(self, slice_dirs, shape):
         """
@@ -216,22 +456,6 @@ class Hdf5TransportData(object):
             sshape = [shape[sslice] for sslice in slice_dirs]
         return sshape
 
-    def __get_slice_dirs_index(self, slice_dirs, shape):
-        """
-        returns a list of arrays for each slice dimension, where each array
-        gives the indices for that slice dimension.
-        """
-        # create the indexing array
-        chunk, length, repeat = self.__chunk_length_repeat(slice_dirs, shape)
-        idx_list = []
-        for i in range(len(slice_dirs)):
-            c = chunk[i]
-            r = repeat[i]
-            values = self.__get_slice_dir_index(slice_dirs[i])
-            idx = np.ravel(np.kron(values, np.ones((r, c))))
-            idx_list.append(idx.astype(int))
-        return np.array(idx_list)
-
     def __get_slice_dir_index(self, dim, boolean=False):
         starts, stops, steps, chunks = \
             self.get_preview().get_starts_stops_steps()
@@ -265,30 +489,56 @@ class Hdf5TransportData(object):
         return dim_idx
 
     def _single_slice_list(self):
+        return self._get_slice_index().get_frame_slices()
+
+    def _get_slice_index(self):
+        """ Get the index of the slice groups of the dataset in the current
+        pattern.  The index is shared by all datasets with the same shape,
+        pattern, preview and frame chunk, so the plugin list check, the
+        loaders and the plugin runs only create it once.
+
+        :rtype: SliceIndex
+        """
         pData = self._get_plugin_data()
         slice_dirs = pData.get_slice_directions()
-        core_dirs = np.array(pData.get_core_directions())
         shape = self.get_shape()
-        index = self.__get_slice_dirs_index(slice_dirs, shape)
+        max_frames = pData._get_frame_chunk()
+        max_frames = (1 if max_frames is None else max_frames)
+        bank = self.__get_bank_length(slice_dirs, shape)
+        key = (shape, pData.get_pattern_name(), tuple(slice_dirs),
+               tuple(pData.get_core_directions()),
+               self.__freeze(pData._get_fixed_directions()),
+               self.__freeze(self.get_preview().get_starts_stops_steps()),
+               tuple(self.__get_shape_of_slice_dirs(slice_dirs, shape)),
+               max_frames, bank)
+        return si.get_slice_index(key, lambda: self.__create_slice_index(
+            slice_dirs, shape, max_frames, bank))
+
+    def __freeze(self, value):
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return tuple([self.__freeze(v) for v in value])
+        return value
+
+    def __create_slice_index(self, slice_dirs, shape, max_frames, bank):
+        pData = self._get_plugin_data()
+        core_dirs = pData.get_core_directions()
         fix_dirs, value = pData._get_fixed_directions()
-
-        nSlices = index.shape[1] if index.size else len(fix_dirs)
-        nDims = len(shape)
-        core_slice = self.__get_core_slices(core_dirs)
-
-        slice_list = []
-        for i in range(nSlices):
-            getitem = np.array([slice(None)]*nDims)
-            getitem[core_dirs] = core_slice[np.arange(len(core_dirs))]
-            for f in range(len(fix_dirs)):
-                getitem[fix_dirs[f]] = slice(value[f], value[f] + 1, 1)
-            for sdir in range(len(slice_dirs)):
-                getitem[slice_dirs[sdir]] = slice(index[sdir, i],
-                                                  index[sdir, i] + 1, 1)
-            slice_list.append(tuple(getitem))
-
-        slice_list = self.__remove_var_length_dimension(slice_list)
-        return slice_list
+        chunk, length, repeat = self.__chunk_length_repeat(slice_dirs, shape)
+        values = [self.__get_slice_dir_index(d) for d in slice_dirs]
+        nFrames = np.size(values[0])*chunk[0]*repeat[0] if slice_dirs else \
+            len(fix_dirs)
+
+        template = [slice(None)]*len(shape)
+        for dim, sl in zip(core_dirs, self.__get_core_slices(core_dirs)):
+            template[dim] = sl
+        for f in range(len(fix_dirs)):
+            template[fix_dirs[f]] = slice(value[f], value[f] + 1, 1)
+
+        steps = self.get_preview().get_starts_stops_steps()[2]
+        step = steps[slice_dirs[0]] if slice_dirs else 1
+        var_dim = list(shape).index('var') if 'var' in shape else None
+        return si.SliceIndex(template, slice_dirs, values, chunk, nFrames,
+                             bank, max_frames, step, var_dim=var_dim)
 
     def __get_core_slices(self, core_dirs):
         core_slice = []
@@ -308,28 +558,20 @@ class Hdf5TransportData(object):
                                     "multiple chunks.")
             else:
                 core_slice.append(slice(starts[c], stops[c], steps[c]))
-        return np.array(core_slice)
-
-    def __remove_var_length_dimension(self, slice_list):
-        shape = self.get_shape()
-        if 'var' in shape:
-            var_dim = list(shape).index('var')
-            for i in range(len(slice_list)):
-                sl = list(slice_list[i])
-                del sl[var_dim]
-                slice_list[i] = sl
-        return slice_list
-
-    def __banked_list(self, slice_list):
-        shape = self.get_shape()
-        slice_dirs = self._get_plugin_data().get_slice_directions()
-        chunk, length, repeat = self.__chunk_length_repeat(slice_dirs, shape)
+        return core_slice
 
+    def __get_bank_length(self, slice_dirs, shape):
+        """ The number of frames that are grouped together before a slice
+        group must end.
+        """
         if self.mapping:
             map_obj = self.exp.index['mapping'][self.get_name()]
-            new_length = map_obj.data_info.get_meta_data('map_dim_len')
+            return map_obj.data_info.get_meta_data('map_dim_len')
+        return self.__chunk_length_repeat(slice_dirs, shape)[1][0]
 
-        length = new_length if self.mapping else length[0]
+    def __banked_list(self, slice_list):
+        slice_dirs = self._get_plugin_data().get_slice_directions()
+        length = self.__get_bank_length(slice_dirs, self.get_shape())
         banked = self.__split_list(slice_list, length)
         return banked, length, slice_dirs
 
@@ -356,13 +598,19 @@ class Hdf5TransportData(object):
             return [the_list[x:x+size] for x in xrange(0, len(the_list), size)]
 
     def _get_grouped_slice_list(self):
-        max_frames = self._get_plugin_data()._get_frame_chunk()
-        max_frames = (1 if max_frames is None else max_frames)
+        """ Get the slice groups of the dataset in the current pattern.
 
-        sl = self._single_slice_list()
+        :returns: a lazy sequence of slice groups (a list if the data is
+            selected from the raw data).
+        :rtype: SliceRange or list(tuple(slice))
+        """
+        if self._get_plugin_data().selected_data is not True:
+            index = self._get_slice_index()
+            return index.get_range(0, len(index))
 
-        if self._get_plugin_data().selected_data is True:
-            sl = self.get_tomo_raw()._get_frame_raw(sl)
+        max_frames = self._get_plugin_data()._get_frame_chunk()
+        max_frames = (1 if max_frames is None else max_frames)
+        sl = self.get_tomo_raw()._get_frame_raw(self._single_slice_list())
 
         if sl is None:
             raise Exception("Data type", self.get_current_pattern_name(),
@@ -371,18 +619,21 @@ class Hdf5TransportData(object):
         return self.__grouped_slice_list(sl, max_frames)
 
     def _get_slice_list_per_process(self, expInfo):
+        """ Get the slice groups of this process.  For the static scheduler,
+        only the slices of the groups of this process are created.
+        """
         processes = expInfo.get_meta_data("processes")
         process = expInfo.get_meta_data("process")
         slice_list = self._get_grouped_slice_list()
 
-        frame_index = np.arange(len(slice_list))
-        try:
-            frames = np.array_split(frame_index, len(processes))[process]
-            process_slice_list = slice_list[frames[0]:frames[-1]+1]
-        except IndexError:
-            process_slice_list = []
+        if expInfo.get_dictionary().get('scheduler', 'static') == 'dynamic':
+            # slice groups are shared out as the processes become free
+            return slice_list
 
-        return process_slice_list
+        # the groups of each process are as numpy.array_split
+        size, extra = divmod(len(slice_list), len(processes))
+        start = process*size + min(process, extra)
+        return slice_list[start:start + size + (process < extra)]
 
     def __calculate_slice_padding(self, in_slice, pad_ammount, data_stop):
         sl = in_slice
@@ -430,25 +681,254 @@ class Hdf5TransportData(object):
                     slice_list.append(slice(slice_tup[i], slice_tup[i]+1, 1))
                     pad_list.append(pad_tup[i])
 
-        data_slice = self.data[tuple(slice_list)]
-        data_slice = np.pad(data_slice, tuple(pad_list), mode='edge')
+        return self.__read_padded(tuple(slice_list), pad_list)
 
-        return data_slice
-
-    def __get_padding_dict(self):
+    def __read_padded(self, slice_tup, pad_list):
+        """ Read the data into the middle of an array that includes the
+        padding, and fill the padding with the values at the edges.
+        """
+        if not isinstance(self.data, h5py.Dataset):
+            data_slice = np.asarray(self.data[slice_tup])
+            inner = tuple([slice(before, before + n) for (before, after), n
+                           in zip(pad_list, data_slice.shape)])
+            padded = np.empty([n + sum(pad) for pad, n in
+                               zip(pad_list, data_slice.shape)],
+                              dtype=data_slice.dtype)
+            padded[inner] = data_slice
+        else:
+            inner = []
+            padded_shape = []
+            dims = [(sl, n) for sl, n in zip(slice_tup, self.data.shape) if
+                    isinstance(sl, slice)]
+            for (sl, n), (before, after) in zip(dims, pad_list):
+                length = len(xrange(*sl.indices(n)))
+                inner.append(slice(before, before + length))
+                padded_shape.append(before + length + after)
+            padded = np.empty(padded_shape, dtype=self.data.dtype)
+            self.__read_with_halo(slice_tup, padded, inner)
+
+        self.__fill_edges(padded, pad_list)
+        return padded
+
+    def __read_with_halo(self, slice_tup, padded, inner):
+        """ Read the slices from the file into the ``inner`` part of
+        ``padded``.  When the slice groups are padded in the main slice
+        dimension, the frames at the end of the previous slice group (the
+        halo) are kept, and only the frames that are not in it are read.
+        """
+        pData = self._get_plugin_data()
+        sdir = pData.get_slice_directions()[0]
+        sl = slice_tup[sdir] if sdir < len(slice_tup) else None
+        pad = self._get_padding_dict().get(sdir, 0)
+        if not pad or not isinstance(sl, slice) or sl.step not in (None, 1):
+            self.__halo = None
+            self.__read_direct(padded, slice_tup, tuple(inner))
+            return
+
+        axis = len([s for s in slice_tup[:sdir] if isinstance(s, slice)])
+        start, stop = sl.indices(self.data.shape[sdir])[:2]
+        others = slice_tup[:sdir] + slice_tup[sdir+1:]
+
+        def frames(a, b):
+            """ Frames a to b of the main slice dimension in ``padded``. """
+            index = list(inner)
+            offset = inner[axis].start - start
+            index[axis] = slice(offset + a, offset + b)
+            return tuple(index)
+
+        first = start
+        if self.__halo is not None:
+            halo_pData, halo_others, hstart, hstop, buf = self.__halo
+            if halo_pData is pData and halo_others == others and \
+                    hstart <= start < hstop:
+                first = min(hstop, stop)
+                index = [slice(None)]*buf.ndim
+                index[axis] = slice(start - hstart, first - hstart)
+                padded[frames(start, first)] = buf[tuple(index)]
+        if first < stop:
+            source = list(slice_tup)
+            source[sdir] = slice(first, stop, 1)
+            self.__read_direct(padded, tuple(source), frames(first, stop))
+
+        # keep the frames that overlap the next slice group
+        hstart = max(start, stop - 2*pad)
+        halo = padded[frames(hstart, stop)]
+        buf = self.__halo[4] if self.__halo is not None else None
+        if buf is None or buf.shape != halo.shape:
+            buf = np.empty_like(halo)
+        buf[...] = halo
+        self.__halo = (pData, others, hstart, stop, buf)
+
+    def __read_direct(self, array, source_sel, dest_sel):
+        if self.__memmap is not None:
+            array[dest_sel] = self.__memmap[source_sel]
+            return
+        if self.__chunk_reader is not None:
+            frames = self.__chunk_reader.read(source_sel)
+            if frames is not None:
+                array[dest_sel] = frames
+                return
+        if self.__strided is not None and \
+                isinstance(self.data, h5py.Dataset) and \
+                sr.is_strided(source_sel):
+            array[dest_sel] = sr.read(self.data, source_sel, *self.__strided)
+            return
+        self.data.read_direct(array, source_sel, dest_sel)
+
+    def __fill_edges(self, array, pad_list):
+        """ Fill the padding in place, as numpy.pad with mode='edge'. """
+        for axis, (before, after) in enumerate(pad_list):
+            n = array.shape[axis]
+            for dest, edge in [(slice(0, before), slice(before, before+1)),
+                               (slice(n-after, n), slice(n-after-1, n-after))]:
+                if dest.start == dest.stop:
+                    continue
+                index = [slice(None)]*array.ndim
+                index[axis] = edge
+                edge_values = array[tuple(index)]
+                index[axis] = dest
+                array[tuple(index)] = edge_values
+
+    def _get_padding_dict(self):
         pData = self._get_plugin_data()
         padding = Padding(pData.get_pattern())
         for key in pData.padding.keys():
             getattr(padding, key)(pData.padding[key])
         return padding._get_padding_directions()
 
+    def _get_chunk_cache_size(self, slice_list):
+        """ The size of chunk cache that holds the chunks of a slice group,
+        or 0 if the data is not a chunked hdf5 dataset.
+        """
+        if not isinstance(self.data, h5py.Dataset) or not self.data.chunks:
+            return 0
+        nChunks = cc.get_chunks_touched(slice_list, self.data.shape,
+                                        self.data.chunks)
+        return self.data.dtype.itemsize*int(np.prod(self.data.chunks))*nChunks
+
+    def _set_chunk_cache(self, slice_list, nbytes, w0=0.75):
+        """ Reopen the dataset with a chunk cache of ``nbytes``, and log the
+        estimated hit rate of the cache for the slice list.
+
+        :param list(tuple(slice)) slice_list: the slice groups of this
+            process.
+        :param int nbytes: the size of the cache.
+        :param float w0: the hdf5 preemption policy (1 evicts the chunks that
+            have been read or written in full first).
+        """
+        shape, chunks = self.data.shape, self.data.chunks
+        chunk_bytes = self.data.dtype.itemsize*int(np.prod(chunks))
+        nChunks = nbytes // chunk_bytes
+        if not cc.set_chunk_cache(self.data, nbytes, cc.get_nslots(nChunks),
+                                  w0):
+            logging.debug("%s is open elsewhere, so its chunk cache is not "
+                          "changed", self.get_name())
+            return
+        logging.info(
+            "Chunk cache of %s: %.1f MB (%i chunks of %s), estimated hit rate"
+            " %.0f%% (%.0f%% with the default cache)", self.get_name(),
+            nbytes/1e6, nChunks, chunks, 100*cc.estimate_hit_rate(
+                slice_list, shape, chunks, nChunks),
+            100*cc.estimate_hit_rate(slice_list, shape, chunks,
+                                     cc.DEFAULT_NBYTES // chunk_bytes))
+
+    def _plan_reads(self, slice_list, nbytes):
+        """ Plan the reads of the slice groups of this process, so that slice
+        groups that follow on from each other are read together, in reads of
+        at most ``nbytes``.  Padded slice groups are read with a halo
+        instead.
+
+        :param list(tuple(slice)) slice_list: the slice groups in the order
+            they are read.
+        :param int nbytes: the largest read.
+        """
+        self.__read_plan = None
+        pData = self._get_plugin_data()
+        if nbytes and pData.padding is None and \
+                isinstance(self.data, h5py.Dataset):
+            self.__read_plan = rp.ReadPlan(
+                self.data, slice_list, pData.get_slice_directions()[0],
+                nbytes, strided=self.__strided)
+
+    def _set_strided_reads(self, nbytes, strategy='auto'):
+        """ Read stepped (previewed) selections with a strategy from
+        strided_reads, rather than as strided hyperslabs.  Data that is not
+        an hdf5 dataset (e.g. held in memory) is sliced as before.
+
+        :param int nbytes: the largest bulk read.
+        :param str strategy: 'auto' to choose the cheapest strategy for each
+            selection, or 'hyperslab', 'bulk' or 'runs'.
+        """
+        self.__strided = (nbytes, strategy) if \
+            isinstance(self.data, h5py.Dataset) else None
+
+    def _map_data(self):
+        """ Read the slice groups from a memory map of the file, without
+        calls to the hdf5 library, if the dataset is stored contiguously and
+        uncompressed.  The frames of unpadded slice groups are read-only
+        views of the map.
+
+        :returns: True if the dataset is mapped.
+        """
+        self.__memmap = mm.get_memory_map(self.data)
+        return self.__memmap is not None
+
+    def _read_chunks(self, workers, nbytes):
+        """ Read the slice groups of a compressed dataset as raw chunks,
+        which are decompressed in ``workers`` threads, if every filter of
+        the dataset can be decoded.
+
+        :param int nbytes: the memory limit for decompressed chunks.
+        :returns: True if the chunks are read directly.
+        """
+        filters = cr.get_filters(self.data) if workers and \
+            isinstance(self.data, h5py.Dataset) else None
+        if not filters:
+            return False
+        self.__chunk_reader = \
+            cr.ChunkReader(self.data, filters, workers, nbytes)
+        return True
+
+    def _clear_read_plan(self):
+        self.__read_plan = None
+        self.__strided = None
+        self.__memmap = None
+        if self.__chunk_reader is not None:
+            self.__chunk_reader.close()
+            self.__chunk_reader = None
+
+    def __read(self, slice_tup):
+        """ Read an unpadded slice group, from the memory map or from the
+        staged reads of the plan if it is in one.  A list of indices is read
+        as runs of hyperslabs, and a stepped selection with the strategy of
+        strided_reads.
+        """
+        if self.__memmap is not None:
+            return self.__memmap[slice_tup]
+        if self.__chunk_reader is not None:
+            frames = self.__chunk_reader.read(slice_tup)
+            if frames is not None:
+                return frames
+        if self.__read_plan is not None:
+            frames = self.__read_plan.get(slice_tup)
+            if frames is not None:
+                return frames
+        if isinstance(self.data, h5py.Dataset) and \
+                [s for s in slice_tup if isinstance(s, (list, np.ndarray))]:
+            return rp.read_index_runs(self.data, slice_tup)
+        if self.__strided is not None and \
+                isinstance(self.data, h5py.Dataset) and \
+                sr.is_strided(slice_tup):
+            return sr.read(self.data, slice_tup, *self.__strided)
+        return self.data[slice_tup]
+
     def _get_padded_slice_data(self, input_slice_list):
         slice_list = list(input_slice_list)
         pData = self._get_plugin_data()
         if pData.padding is None:
-            return self.data[tuple(slice_list)]
+            return self.__read(tuple(slice_list))
 
-        padding_dict = self.__get_padding_dict()
+        padding_dict = self._get_padding_dict()
         pad_list = []
         for i in range(len(slice_list)):
             pad_list.append((0, 0))
@@ -462,12 +942,70 @@ class Hdf5TransportData(object):
         temp = self.__get_pad_data(tuple(slice_list), tuple(pad_list))
         return temp
 
+    def _set_collective_writes(self, collective):
+        """ Write the slice groups with collective operations, which every
+        process that opened the file must take part in.
+        """
+        self.__collective = collective
+
+    def _set_slice_data(self, slice_list, frames):
+        """ Write the frames of a slice group.  Contiguous frames of the
+        dataset type are written to an hdf5 file without a copy.
+        """
+        if self.__rank_regions is not None:
+            self.__rank_regions.append(slice_list)
+        if self.__collective:
+            with self.data.collective:
+                self.__write(tuple(slice_list), frames)
+        else:
+            self.__write(tuple(slice_list), frames)
+
+    def _set_empty_slice_data(self):
+        """ Take part in a collective write without writing any frames, when
+        this process has no more slice groups.
+        """
+        fspace = self.data.id.get_space()
+        fspace.select_none()
+        mspace = h5py.h5s.create_simple((1,))
+        mspace.select_none()
+        dxpl = h5py.h5p.create(h5py.h5p.DATASET_XFER)
+        dxpl.set_dxpl_mpio(h5py.h5fd.MPIO_COLLECTIVE)
+        self.data.id.write(mspace, fspace, np.zeros(1, dtype=self.data.dtype),
+                           dxpl=dxpl)
+
+    def __get_compressor(self):
+        if self.__compressor is None:
+            threads = self.exp.meta_data.get_dictionary().get(
+                'compression_threads', 4)
+            self.__compressor = comp.ChunkCompressor(self.data, threads)
+        return self.__compressor
+
+    def __write(self, slice_list, frames):
+        if isinstance(self.data, h5py.Dataset) and \
+                self.data.compression is not None and \
+                not self.__collective:
+            if self.__get_compressor().write(slice_list, frames):
+                return
+        if isinstance(self.data, h5py.Dataset) and \
+                isinstance(frames, np.ndarray) and \
+                frames.flags.c_contiguous and \
+                frames.dtype == self.data.dtype and \
+                frames.shape == self.__get_selection_shape(slice_list):
+            self.data.write_direct(frames, dest_sel=slice_list)
+        else:
+            self.data[slice_list] = frames
+
+    def __get_selection_shape(self, slice_list):
+        return tuple([len(xrange(*sl.indices(n))) for sl, n in
+                      zip(slice_list, self.data.shape) if
+                      isinstance(sl, slice)])
+
     def _get_unpadded_slice_data(self, input_slice_list, padded_dataset):
         padding_dict = self._get_plugin_data().padding
         if padding_dict is None:
             return padded_dataset
 
-        padding_dict = self.__get_padding_dict()
+        padding_dict = self._get_padding_dict()
 
         slice_list = list(input_slice_list)
         pad_list = []
@@ -0,0 +1,160 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: local_tier
+   :platform: Unix
+   :synopsis: Places intermediate datasets on node-local scratch storage \
+   (an SSD or /dev/shm) within a capacity budget.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import socket
+import logging
+import collections
+
+import savu.core.utils as cu
+
+# the fraction of the free space of the scratch directory used by default
+FREE_FRACTION = 0.9
+
+
+def get_local_tier(options):
+    """ The local tier of the ``local_dir`` option, or None if it is not set
+    or the processes run on more than one node.
+    """
+    path = options.get('local_dir', None)
+    if not path:
+        return None
+    # the next plugin reads frames written by any process, so a dataset is
+    # only kept locally if every process can read it
+    nodes = set(cu.COMM_WORLD.allgather(socket.gethostname()))
+    if len(nodes) > 1:
+        logging.warn("The processes run on %i nodes: intermediate datasets "
+                     "are written to the shared directory.", len(nodes))
+        return None
+    if cu.COMM_WORLD.rank == 0 and not os.path.exists(path):
+        os.makedirs(path)
+    cu.COMM_WORLD.barrier()
+    budget = options.get('local_budget_mb', None)
+    if budget is None:
+        stat = os.statvfs(path)
+        nbytes = stat.f_bavail*stat.f_frsize*FREE_FRACTION
+    else:
+        nbytes = budget*1e6
+    return LocalTier(path, nbytes)
+
+
+class LocalTier(object):
+    """ Node-local storage for intermediate datasets.  The datasets are
+    placed in order, when the files of a run are created.  A dataset goes on
+    the local tier if it fits in the budget alongside the local datasets
+    that are still in use while it is written (an output replaces the input
+    of the same name once its plugin completes), otherwise it spills to the
+    shared tier.
+
+    Datasets that are no longer used are kept, with their links in the nexus
+    file, in the space the busiest plugin leaves free, and evicted least
+    recently used first.  All remaining local datasets are removed at the
+    end of the run: only the final results, which are always written to the
+    output directory, are kept.
+
+    :param str path: the scratch directory.
+    :param float nbytes: the capacity budget.
+    """
+
+    def __init__(self, path, nbytes):
+        self.path = path
+        self.budget = nbytes
+        # the placement of each dataset, by plugin number and name
+        self.placed = {}
+        # the local datasets in use before the current plugin and those of
+        # the current plugin, by name, and the most bytes in use
+        self.live = {}
+        self.current = {}
+        self.count = None
+        self.peak = 0
+        # the size and nexus links of each local file, and the files no
+        # longer used, least recently used first
+        self.files = {}
+        self.released = collections.OrderedDict()
+
+    def place(self, count, key, filename, nbytes):
+        """ The file of output dataset ``key`` of plugin ``count``: in the
+        scratch directory if the dataset fits, else ``filename``.
+        """
+        if (count, key) in self.placed:
+            return self.placed[(count, key)]
+        if count != self.count:
+            # the inputs replaced by the last plugin are no longer in use
+            self.live.update(self.current)
+            self.current = {}
+            self.count = count
+        live = sum(self.live.values()) + sum(self.current.values())
+        local = live + nbytes <= self.budget
+        if local:
+            self.peak = max(self.peak, live + nbytes)
+            self.current[key] = nbytes
+            placed = os.path.join(self.path, os.path.basename(filename))
+            self.files[placed] = [nbytes, []]
+        else:
+            self.current[key] = 0
+            placed = filename
+            logging.info("The local tier is full: %s is written to %s",
+                         key, os.path.dirname(filename))
+        self.placed[(count, key)] = placed
+        return placed
+
+    def add_link(self, filename, link):
+        """ Record a nexus file link to a local file. """
+        if filename in self.files:
+            self.files[filename][1].append(link)
+
+    def release(self, filename, nxs_file):
+        """ Keep a local file that is no longer used while there is space,
+        evicting the least recently used files.
+        """
+        if filename not in self.files or filename in self.released:
+            return
+        self.released[filename] = self.files[filename][0]
+        while sum(self.released.values()) > self.budget - self.peak:
+            self.__evict(self.released.popitem(last=False)[0], nxs_file)
+
+    def close(self, nxs_file):
+        """ Remove all of the local files at the end of the run. """
+        for filename in self.files.keys():
+            self.__evict(filename, nxs_file)
+        self.released.clear()
+
+    def __evict(self, filename, nxs_file):
+        nbytes, links = self.files.pop(filename)
+        for link in links:
+            if nxs_file is not None and link in nxs_file:
+                del nxs_file[link]
+        cu.COMM_WORLD.barrier()
+        if cu.COMM_WORLD.rank == 0:
+            for name in [filename] + self.__get_rank_files(filename):
+                if os.path.exists(name):
+                    os.remove(name)
+        logging.debug("Evicted %s (%.1f MB) from the local tier", filename,
+                      nbytes/1e6)
+
+    def __get_rank_files(self, filename):
+        """ The files of each process joined by a local dataset. """
+        prefix = os.path.splitext(os.path.basename(filename))[0] + '_r'
+        return [os.path.join(self.path, f) for f in os.listdir(self.path)
+                if f.startswith(prefix) and f.endswith('.h5')]
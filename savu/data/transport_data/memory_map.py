@@ -0,0 +1,66 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memory_map
+   :platform: Unix
+   :synopsis: Read-only memory maps of hdf5 datasets that are stored \
+   contiguously and uncompressed.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import logging
+import h5py
+import numpy as np
+
+# the file drivers that store a dataset at its offset in a single file
+MAPPED_DRIVERS = ['sec2', 'stdio', 'mpio']
+# the external storage and virtual layout of a dataset are only known from
+# h5py 2.9, without which a dataset is read through h5py
+MEMORY_MAPS = h5py.version.version_tuple[:2] >= (2, 9)
+
+
+def get_memory_map(dataset):
+    """ A read-only array of a dataset, mapped from its file, if the dataset
+    is stored contiguously in one file without filters and has been written.
+
+    :rtype: np.ndarray or None
+    """
+    if not MEMORY_MAPS or not isinstance(dataset, h5py.Dataset) or \
+            dataset.chunks is not None or dataset.compression is not None \
+            or 0 in dataset.shape or dataset.dtype.hasobject:
+        return None
+    try:
+        if getattr(dataset, 'external', None) or \
+                getattr(dataset, 'is_virtual', False) or \
+                dataset.file.driver not in MAPPED_DRIVERS:
+            return None
+        offset = dataset.id.get_offset()
+    except (ValueError, RuntimeError):
+        # the dataset has no storage of its own
+        return None
+    nbytes = int(np.prod(dataset.shape))*dataset.dtype.itemsize
+    if offset is None or dataset.id.get_storage_size() < nbytes or \
+            os.path.getsize(dataset.file.filename) < offset + nbytes:
+        # not written yet
+        return None
+    mapped = np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r',
+                       offset=offset, shape=dataset.shape)
+    logging.debug("Reading %s of %s from a memory map", dataset.name,
+                  dataset.file.filename)
+    # slices of the map are plain arrays, which keep the map open
+    return mapped.view(np.ndarray)
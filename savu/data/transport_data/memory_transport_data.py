@@ -0,0 +1,162 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memory_transport_data
+   :platform: Unix
+   :synopsis: A data transport class that is inherited by Data class at \
+   runtime.  Intermediate datasets are held in memory shared by all \
+   processes on a node, final results are saved to hdf5.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+import logging
+import numpy as np
+
+import savu.core.utils as cu
+from savu.data.transport_data.hdf5_transport_data import Hdf5TransportData
+
+
+class SharedArray(object):
+    """ A numpy array in memory that is shared by all processes in the node
+    communicator, which replaces the hdf5 file as the backing of a dataset.
+    """
+
+    def __init__(self, name, shape, dtype, comm=None):
+        self.filename = name
+        self.window = None
+        self.nbytes = int(np.prod(shape))*dtype.itemsize
+
+        if comm is None or not self.nbytes:
+            self.array = np.zeros(shape, dtype)
+            return
+
+        size = self.nbytes if comm.rank == 0 else 0
+        self.window = \
+            cu.MPI.Win.Allocate_shared(size, dtype.itemsize, comm=comm)
+        buf, itemsize = self.window.Shared_query(0)
+        self.array = np.ndarray(buffer=buf, dtype=dtype, shape=shape)
+        if comm.rank == 0:
+            self.array.fill(0)
+        self.sync()
+
+    def sync(self):
+        """ Make all writes to the array visible to all processes on the node.
+        This is collective over the node communicator.
+        """
+        if self.window is not None:
+            self.window.Fence()
+
+    def close(self):
+        """ Free the shared memory.  This is collective over the node
+        communicator.
+        """
+        self.array = None
+        if self.window is not None:
+            self.window.Free()
+            self.window = None
+
+
+class MemoryTransportData(Hdf5TransportData):
+    """
+    The MemoryTransportData class keeps the intermediate datasets in shared
+    memory, falling back to the hdf5 transport for final results and for any
+    dataset that would exceed the memory budget.
+    """
+
+    def __init__(self):
+        super(MemoryTransportData, self).__init__()
+
+    def _create_backing(self, saver_plugin, count):
+        """ Allocate shared memory for the output datasets of plugin number
+        ``count``, if they are not final results and fit in the memory budget.
+        The remaining datasets are saved to hdf5 files by the saver plugin.
+        """
+        expInfo = self.exp.meta_data
+        plugin_list = expInfo.plugin_list
+        final = count == \
+            (plugin_list.n_plugins - plugin_list.n_loaders - 1)
+
+        for key, data in self.exp.index["out_data"].iteritems():
+            if final or expInfo.get_meta_data(["filename", key]) is None \
+                    or not self.__fits_in_memory(data):
+                continue
+            group_name = expInfo.get_meta_data(["group_name", key])
+            data.data_info.set_meta_data('group_name', group_name)
+            data.backing_file = SharedArray(
+                'shared memory (%s)' % group_name, data.get_shape(),
+                self.__get_dtype(data), expInfo.get_meta_data('node_comm'))
+            data.data = data.backing_file.array
+            expInfo.set_meta_data('memory_used', self.__get_memory_used() +
+                                  data.backing_file.nbytes)
+            logging.debug("Holding %s in shared memory (%i bytes)",
+                          group_name, data.backing_file.nbytes)
+
+        saver_plugin.setup()
+
+    def __fits_in_memory(self, data):
+        shape = data.get_shape()
+        if [s for s in shape if not isinstance(s, (int, long))]:
+            return False
+        nbytes = int(np.prod(shape))*self.__get_dtype(data).itemsize
+        budget = self.exp.meta_data.get_meta_data('memory_budget')
+        if self.__get_memory_used() + nbytes > budget:
+            logging.info("Dataset %s does not fit in the memory budget: "
+                         "saving to hdf5", data.get_name())
+            return False
+        return True
+
+    def __get_dtype(self, data):
+        # match the hdf5 default used by the saver
+        return np.dtype(np.float32 if data.dtype is None else data.dtype)
+
+    def __get_memory_used(self):
+        return self.exp.meta_data.get_meta_data('memory_used')
+
+    def __in_memory(self):
+        return isinstance(self.backing_file, SharedArray)
+
+    def _get_padded_slice_data(self, input_slice_list):
+        """ As for hdf5, the plugin is given a copy of the frames, so that
+        changing them does not change the dataset.
+        """
+        data = super(MemoryTransportData, self)._get_padded_slice_data(
+            input_slice_list)
+        if self.__in_memory() and np.may_share_memory(data, self.data):
+            return data.copy()
+        return data
+
+    def _save_data(self, link_type):
+        """ Shared memory datasets are not linked in the nexus file, as they
+        do not exist after the run.
+        """
+        if not self.__in_memory():
+            return super(MemoryTransportData, self)._save_data(link_type)
+        self.backing_file.sync()
+        logging.info('save_data _barrier')
+        self.exp._barrier()
+
+    def _close_file(self):
+        """ Free the shared memory, or close the hdf5 backing file. """
+        if not self.__in_memory():
+            return super(MemoryTransportData, self)._close_file()
+        if self.backing_file.array is not None:
+            logging.debug("Freeing %s", self.backing_file.filename)
+            self.exp.meta_data.set_meta_data(
+                'memory_used',
+                self.__get_memory_used() - self.backing_file.nbytes)
+            self.backing_file.close()
+        self.backing_file = None
+        self.data = None
@@ -0,0 +1,101 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: rank_files
+   :platform: Unix
+   :synopsis: Intermediate datasets written by each process to its own file, \
+   and joined by an hdf5 virtual dataset.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import logging
+import h5py
+
+import savu.data.transport_data.chunk_compression as cc
+
+
+def get_rank_filename(filename, rank):
+    """ The file of process ``rank`` for the dataset in ``filename``. """
+    return "%s_r%i.h5" % (os.path.splitext(filename)[0], rank)
+
+
+def get_compression(options):
+    """ The keyword arguments for create_dataset that compress the files of
+    the processes (rank_file_compression, or else compression).
+    """
+    compression = options.get('rank_file_compression', None)
+    if compression:
+        return cc.get_filters({'compression': compression})
+    return cc.get_filters(options)
+
+
+def __as_slice(sl):
+    return sl if isinstance(sl, slice) else slice(sl, sl + 1, 1)
+
+
+def merge_regions(selections, shape):
+    """ Merge the selections written by a process, in the order they were
+    written, where they follow on from each other in one dimension.
+
+    :param list(tuple) selections: the selection of each slice group.
+    :param tuple shape: the shape of the dataset.
+    :returns: the merged selections, with a start, stop and step for each
+        dimension.
+    :rtype: list(tuple(tuple(int)))
+    """
+    regions = []
+    for sel in selections:
+        region = tuple([__as_slice(sl).indices(n) for sl, n in
+                        zip(sel, shape)])
+        if regions:
+            last = regions[-1]
+            diff = [d for d in range(len(shape)) if last[d] != region[d]]
+            if len(diff) == 1:
+                d = diff[0]
+                if last[d][2] == region[d][2] == 1 and \
+                        last[d][1] == region[d][0]:
+                    merged = list(last)
+                    merged[d] = (last[d][0], region[d][1], 1)
+                    regions[-1] = tuple(merged)
+                    continue
+        regions.append(region)
+    return regions
+
+
+def create_virtual_dataset(group, name, shape, dtype, sources):
+    """ Create a virtual dataset that presents the regions written by all of
+    the processes as one dataset.
+
+    :param h5py.Group group: the group of the dataset in the shared file.
+    :param str name: the name of the dataset.
+    :param list(tuple) sources: the file name and the regions of each
+        process (see merge_regions).
+    :returns: the virtual dataset.
+    """
+    layout = h5py.VirtualLayout(shape, dtype)
+    nRegions = 0
+    for filename, regions in sources:
+        source = h5py.VirtualSource(os.path.abspath(filename), 'data',
+                                    shape=shape)
+        for region in regions:
+            sel = tuple([slice(*r) for r in region])
+            layout[sel] = source[sel]
+            nRegions += 1
+    logging.debug("Virtual dataset %s of %i regions in %i files",
+                  group.name, nRegions, len(sources))
+    return group.create_virtual_dataset(name, layout, fillvalue=0)
@@ -0,0 +1,169 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: read_planner
+   :platform: Unix
+   :synopsis: Plans the reads of the slice groups of a process from an hdf5 \
+   dataset as a few large hyperslab reads.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import numpy as np
+
+import savu.data.transport_data.strided_reads as sr
+
+
+def _key(slice_tup):
+    """ A hashable version of a slice tuple. """
+    return tuple([(s.start, s.stop, s.step) if isinstance(s, slice) else s
+                  for s in slice_tup])
+
+
+def _length(sl, n):
+    return len(xrange(*sl.indices(n)))
+
+
+class ReadPlan(object):
+    """ Merges the slice groups of a process that follow on from each other
+    in the main slice dimension into runs, which are read with a single
+    read_direct into a staging buffer of at most ``nbytes``.  The frames of
+    each slice group are then views of the buffer.
+
+    :param h5py.Dataset dataset: the dataset that is read.
+    :param list(tuple) slice_list: the slice groups of the process, in the
+        order they are read.
+    :param int sdir: the main slice dimension.
+    :param int nbytes: the largest staging buffer.
+    :param tuple strided: the largest bulk read and the strategy for runs
+        with a step (see strided_reads.read), or None to read them as
+        strided hyperslabs.
+    """
+
+    def __init__(self, dataset, slice_list, sdir, nbytes, strided=None):
+        self.dataset = dataset
+        self.sdir = sdir
+        self.strided = strided
+        self.runs = []
+        self.groups = {}
+        self.staged = (None, None)
+        self.__plan(slice_list, nbytes)
+        logging.debug("Reading %i slice groups in %i runs", len(self.groups),
+                      len(self.runs))
+
+    def __plan(self, slice_list, nbytes):
+        itemsize = self.dataset.dtype.itemsize
+        shape = self.dataset.shape
+        run = None
+        for sl in slice_list:
+            sl = tuple(sl)
+            main = sl[self.sdir] if self.sdir < len(sl) else None
+            if len(sl) != len(shape) or not isinstance(main, slice) or \
+                    [s for s in sl if not isinstance(s, (slice, int, long))]:
+                run = None
+                continue
+            start, stop, step = main.indices(shape[self.sdir])
+            nFrames = _length(main, shape[self.sdir])
+            size = itemsize*int(np.prod(
+                [_length(s, n) for s, n in zip(sl, shape) if
+                 isinstance(s, slice)]))
+            others = _key(sl[:self.sdir] + sl[self.sdir+1:])
+            if run is None or run['others'] != others or \
+                    run['step'] != step or run['next'] != start or \
+                    run['nbytes'] + size > nbytes:
+                run = {'slices': sl, 'others': others, 'start': start,
+                       'step': step, 'next': start, 'frames': 0,
+                       'nbytes': 0, 'groups': []}
+                self.runs.append(run)
+            run['groups'].append(_key(sl))
+            self.groups[_key(sl)] = \
+                (len(self.runs) - 1, run['frames'], run['frames'] + nFrames)
+            run['frames'] += nFrames
+            run['next'] = start + nFrames*step
+            run['nbytes'] += size
+
+        # slice groups that are not merged are read as they are requested
+        for run in self.runs:
+            if len(run['groups']) == 1:
+                del self.groups[run['groups'][0]]
+
+    def get(self, slice_tup):
+        """ Get the frames of a slice group, reading the run it is in if it
+        is not staged.
+
+        :returns: the frames, or None if the slice group is not planned.
+        """
+        entry = self.groups.get(_key(slice_tup))
+        if entry is None:
+            return None
+        idx, first, last = entry
+        if self.staged[0] != idx:
+            self.staged = (idx, self.__read_run(self.runs[idx]))
+        buf = self.staged[1]
+        axis = len([s for s in slice_tup[:self.sdir] if
+                    isinstance(s, slice)])
+        index = [slice(None)]*buf.ndim
+        index[axis] = slice(first, last)
+        return buf[tuple(index)]
+
+    def __read_run(self, run):
+        selection = list(run['slices'])
+        selection[self.sdir] = slice(run['start'], run['next'], run['step'])
+        selection = tuple(selection)
+        if self.strided is not None and sr.is_strided(selection):
+            return sr.read(self.dataset, selection, *self.strided)
+        buf = np.empty([_length(s, n) for s, n in
+                        zip(selection, self.dataset.shape) if
+                        isinstance(s, slice)], dtype=self.dataset.dtype)
+        self.dataset.read_direct(buf, selection)
+        return buf
+
+    def close(self):
+        self.staged = (None, None)
+
+
+def read_index_runs(dataset, slice_tup):
+    """ Read a selection that has a list of indices in one dimension (e.g. an
+    image key selection) as a hyperslab read for each run of consecutive
+    indices, rather than as a point selection.
+    """
+    dim = [d for d in range(len(slice_tup)) if not
+           isinstance(slice_tup[d], (slice, int, long))][0]
+    indices = np.asarray(slice_tup[dim])
+    if indices.dtype == bool:
+        indices = np.where(indices)[0]
+    breaks = np.where(np.diff(indices) != 1)[0] + 1
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [len(indices)]])
+
+    shape = []
+    for d, sl in enumerate(slice_tup):
+        if d == dim:
+            shape.append(len(indices))
+        elif isinstance(sl, slice):
+            shape.append(_length(sl, dataset.shape[d]))
+    out = np.empty(shape, dtype=dataset.dtype)
+    axis = len([s for s in slice_tup[:dim] if isinstance(s, slice)])
+    if not len(indices):
+        return out
+    for a, b in zip(starts, stops):
+        source = list(slice_tup)
+        source[dim] = slice(int(indices[a]), int(indices[b-1]) + 1, 1)
+        dest = [slice(None)]*out.ndim
+        dest[axis] = slice(a, b)
+        dataset.read_direct(out, tuple(source), tuple(dest))
+    return out
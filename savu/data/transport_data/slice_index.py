@@ -0,0 +1,199 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: slice_index
+   :platform: Unix
+   :synopsis: An array-backed index of the slice groups of a dataset, which \
+   creates the slices of a range of slice groups when they are needed.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import numpy as np
+
+# the largest number of slice indices that are kept
+MAX_CACHED = 64
+_cache = {}
+
+
+def get_slice_index(key, create):
+    """ Get the slice index for ``key``, calling ``create`` to make it if it
+    has not been made before.
+
+    :param tuple key: everything that determines the slice list (shape,
+        pattern, preview, frame chunk).
+    :param function create: returns a new SliceIndex.
+    """
+    if key not in _cache:
+        if len(_cache) >= MAX_CACHED:
+            _cache.clear()
+        _cache[key] = create()
+    return _cache[key]
+
+
+def clear_cache():
+    _cache.clear()
+
+
+class SliceIndex(object):
+    """ The slice groups of a dataset in a pattern.
+
+    Rather than a slice for each dimension of each frame, the index holds the
+    values taken by each slice dimension, and the number of frames before
+    each value changes (the first slice dimension changes fastest).  Frames
+    are banked by the length of the first slice dimension and each bank is
+    split into groups of ``max_frames``.  The slices of a range of groups are
+    created from the start, stop and step arrays of the range.
+
+    :param list(slice) template: the slice of each dimension that is not a
+        slice dimension.
+    :param list(int) slice_dirs: the slice dimensions.
+    :param list(np.ndarray) values: the index values of each slice dimension.
+    :param list(int) chunks: the frames before each slice dimension changes.
+    :param int nFrames: the total number of frames.
+    :param int bank: the number of frames in a bank.
+    :param int max_frames: the number of frames in a slice group.
+    :param int step: the step of the first slice dimension in a slice group.
+    :param int var_dim: the dimension of variable length, which is removed
+        from the slices (or None).
+    """
+
+    def __init__(self, template, slice_dirs, values, chunks, nFrames, bank,
+                 max_frames, step, var_dim=None):
+        self.template = list(template)
+        self.slice_dirs = list(slice_dirs)
+        self.values = [np.ravel(np.array(v, dtype=np.int64)) for v in values]
+        self.chunks = list(chunks)
+        self.nFrames = nFrames
+        self.bank = max(int(bank), 1)
+        self.max_frames = max(int(max_frames), 1)
+        self.step = step
+        self.var_dim = var_dim
+        self.per_bank = -(-self.bank // self.max_frames)
+        full, remainder = divmod(nFrames, self.bank)
+        self.nGroups = full*self.per_bank + -(-remainder // self.max_frames)
+        logging.debug("Slice index of %i frames in %i slice groups", nFrames,
+                      self.nGroups)
+
+    def __len__(self):
+        return self.nGroups
+
+    def get_range(self, start, stop):
+        """ A lazy view of the slice groups ``start`` to ``stop``. """
+        start = min(max(start, 0), self.nGroups)
+        return SliceRange(self, start, max(start, min(stop, self.nGroups)))
+
+    def get_group_slices(self, start, stop):
+        """ Create the slices of the slice groups ``start`` to ``stop``.
+
+        :rtype: list(tuple(slice))
+        """
+        groups = np.arange(start, stop, dtype=np.int64)
+        bank, sub = np.divmod(groups, self.per_bank)
+        first = bank*self.bank + sub*self.max_frames
+        last = np.minimum(np.minimum(first + self.max_frames,
+                                     (bank + 1)*self.bank), self.nFrames) - 1
+        starts = self.__get_starts(first)
+        if self.slice_dirs:
+            stops = self.__get_index(0, last) + 1
+            starts[0] = (starts[0], stops, self.step)
+        return self.__make_slices(starts, len(groups))
+
+    def get_frame_slices(self, start=0, stop=None):
+        """ Create the slices of the single frames ``start`` to ``stop``.
+
+        :rtype: list(tuple(slice))
+        """
+        stop = self.nFrames if stop is None else stop
+        frames = np.arange(start, stop, dtype=np.int64)
+        return self.__make_slices(self.__get_starts(frames), len(frames))
+
+    def __get_index(self, sdir, frames):
+        values = self.values[sdir]
+        return values[(frames // self.chunks[sdir]) % len(values)]
+
+    def __get_starts(self, frames):
+        return [self.__get_index(d, frames) for d in
+                range(len(self.slice_dirs))]
+
+    def __make_slices(self, starts, n):
+        """ Combine the template with the (start[, stop, step]) arrays of each
+        slice dimension.
+        """
+        columns = []
+        for entry in starts:
+            if isinstance(entry, tuple):
+                sl_starts, sl_stops, step = entry
+                columns.append([slice(a, b, step) for a, b in
+                                zip(sl_starts.tolist(), sl_stops.tolist())])
+            else:
+                columns.append([slice(a, a + 1, 1) for a in entry.tolist()])
+
+        slices = []
+        for i in range(n):
+            sl = list(self.template)
+            for d, dim in enumerate(self.slice_dirs):
+                sl[dim] = columns[d][i]
+            if self.var_dim is not None:
+                del sl[self.var_dim]
+            slices.append(tuple(sl))
+        return slices
+
+
+class SliceRange(object):
+    """ A sequence of the slice groups ``start`` to ``stop`` of a SliceIndex,
+    whose slices are created in blocks as they are used.
+    """
+
+    block = 1024
+
+    def __init__(self, index, start, stop):
+        self.index = index
+        self.start = start
+        self.stop = stop
+        self.__block = (None, [])
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return SliceRange(self.index, self.start + start,
+                              self.start + max(start, stop))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("slice group %i out of range" % item)
+        first, slices = self.__block
+        if first is None or not first <= item < first + len(slices):
+            first = item - item % self.block
+            slices = self.__get_block(first)
+            self.__block = (first, slices)
+        return slices[item - first]
+
+    def __iter__(self):
+        for first in range(0, len(self), self.block):
+            for sl in self.__get_block(first):
+                yield sl
+
+    def __get_block(self, first):
+        return self.index.get_group_slices(
+            self.start + first, min(self.start + first + self.block,
+                                    self.stop))
@@ -0,0 +1,268 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: strided_reads
+   :platform: Unix
+   :synopsis: Chooses how a stepped (previewed) selection of an hdf5 dataset \
+   is read: as a strided hyperslab, as a bulk read that is decimated in \
+   memory, or as a read of each index of the outer stepped dimension.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import time
+import logging
+import tempfile
+import h5py
+import numpy as np
+
+from savu.data.chunking import CHUNK_OVERHEAD
+
+HYPERSLAB = 'hyperslab'
+BULK = 'bulk'
+RUNS = 'runs'
+STRATEGIES = [HYPERSLAB, BULK, RUNS]
+
+# the cost of copying a run of a selection out of a chunk, and of each
+# element of a stepped selection of a chunked dataset (which hdf5 copies one
+# at a time), as the bytes that could be read in the same time
+RUN_OVERHEAD = 1000
+ELEMENT_OVERHEAD = 100
+# the hdf5 sieve buffer, which reads the runs of a contiguous dataset that
+# are closer together than this in one request
+SIEVE_BYTES = 65536
+
+
+def is_strided(slice_tup):
+    """ Whether a selection has a step greater than 1 and is otherwise made
+    of slices and indices.
+    """
+    if [s for s in slice_tup if not isinstance(s, (slice, int, long,
+                                                   np.integer))]:
+        return False
+    return any([isinstance(s, slice) and s.step is not None and s.step > 1
+                for s in slice_tup])
+
+
+def __get_selection(slice_tup, shape):
+    """ The start, number of elements and step of each dimension. """
+    selection = []
+    for sl, n in zip(slice_tup, shape):
+        if isinstance(sl, slice):
+            start, stop, step = sl.indices(n)
+            selection.append((start, len(xrange(start, stop, step)), step))
+        else:
+            selection.append((int(sl), 1, 1))
+    return selection
+
+
+def __get_box(selection):
+    """ The selection of the elements from the first to the last selected
+    element in each dimension.
+    """
+    return [(start, (count - 1)*step + 1, 1) for start, count, step in
+            selection]
+
+
+def __get_runs(selection, shape):
+    """ The number of contiguous runs of elements in a selection of a C-order
+    array, the number of elements in each run and the innermost dimension
+    that the runs are spread over.
+    """
+    length = 1
+    dim = len(shape) - 1
+    while dim >= 0 and selection[dim] == (0, shape[dim], 1):
+        length *= shape[dim]
+        dim -= 1
+    if dim >= 0 and selection[dim][2] == 1:
+        length *= selection[dim][1]
+        dim -= 1
+    return int(np.prod([s[1] for s in selection[:dim+1]])), length, dim
+
+
+def __get_sieved_reads(selection, shape, itemsize):
+    """ The number of requests for a selection of a contiguous dataset, and
+    the bytes in each, when the runs that are closer together than the sieve
+    buffer are read together.
+    """
+    nRuns, length, dim = __get_runs(selection, shape)
+    nbytes = length*itemsize
+    for d in range(dim, -1, -1):
+        start, count, step = selection[d]
+        spacing = itemsize*step*int(np.prod(shape[d+1:]))
+        if spacing - nbytes >= SIEVE_BYTES:
+            break
+        nbytes += (count - 1)*spacing
+        nRuns //= count
+    return nRuns, nbytes
+
+
+def __get_chunks_touched(selection, chunks):
+    return int(np.prod(
+        [len(np.unique((start + step*np.arange(count)) // c)) for
+         (start, count, step), c in zip(selection, chunks)]))
+
+
+def __get_read_cost(selection, shape, itemsize, chunks):
+    """ The cost of a read of a selection, as the bytes that could be read in
+    the same time.  A chunked dataset moves every chunk the selection
+    touches, and the selection is then copied out of the chunks.  A
+    contiguous dataset is read in a request for each run, or group of runs
+    that fit in the sieve buffer.
+    """
+    if not chunks:
+        nReads, nbytes = __get_sieved_reads(selection, shape, itemsize)
+        return nReads*(nbytes + CHUNK_OVERHEAD)
+    nRuns, length = __get_runs(selection, shape)[:2]
+    if [s for s in selection if s[2] > 1]:
+        copy = nRuns*length*ELEMENT_OVERHEAD
+    else:
+        copy = nRuns*RUN_OVERHEAD
+    chunk = itemsize*int(np.prod(chunks)) + CHUNK_OVERHEAD
+    return __get_chunks_touched(selection, chunks)*chunk + copy
+
+
+def get_costs(shape, itemsize, chunks, slice_tup, nbytes):
+    """ The cost of reading a stepped selection with each strategy.  A
+    strategy that needs a buffer of more than ``nbytes`` is not possible.
+
+    :param tuple shape: the shape of the dataset.
+    :param int itemsize: the size of an element of the dataset.
+    :param tuple chunks: the chunk shape, or None if the dataset is
+        contiguous.
+    :param tuple slice_tup: the selection.
+    :param int nbytes: the largest buffer for a bulk read.
+    :returns: the cost of each possible strategy, as the bytes that could be
+        read in the same time.
+    :rtype: dict
+    """
+    selection = __get_selection(slice_tup, shape)
+    costs = {HYPERSLAB: __get_read_cost(selection, shape, itemsize, chunks)}
+
+    box = __get_box(selection)
+    if itemsize*np.prod([s[1] for s in box]) <= nbytes:
+        costs[BULK] = __get_read_cost(box, shape, itemsize, chunks)
+
+    # a read of the box of the other dimensions for each index of the outer
+    # stepped dimension
+    outer = [d for d, s in enumerate(selection) if s[2] > 1][0]
+    box[outer] = (selection[outer][0], 1, 1)
+    if itemsize*np.prod([s[1] for s in box]) <= nbytes:
+        cost = __get_read_cost(box, shape, itemsize, chunks)
+        costs[RUNS] = selection[outer][1]*cost
+    return costs
+
+
+def plan_read(shape, itemsize, chunks, slice_tup, nbytes):
+    """ The cheapest strategy for reading a stepped selection (see
+    get_costs).  A hyperslab read is preferred when the costs are equal.
+
+    :rtype: str
+    """
+    costs = get_costs(shape, itemsize, chunks, slice_tup, nbytes)
+    return min(STRATEGIES, key=lambda s: costs.get(s, np.inf))
+
+
+def read(dataset, slice_tup, nbytes, strategy='auto'):
+    """ Read a stepped selection of a dataset with a strategy, or the
+    cheapest strategy if ``strategy`` is 'auto'.
+
+    :param h5py.Dataset dataset: the dataset that is read.
+    :param tuple slice_tup: the selection.
+    :param int nbytes: the largest buffer for a bulk read.
+    :param str strategy: 'auto', 'hyperslab', 'bulk' or 'runs'.
+    :returns: the selected elements, as dataset[slice_tup].
+    """
+    if strategy not in STRATEGIES:
+        strategy = plan_read(dataset.shape, dataset.dtype.itemsize,
+                             dataset.chunks, slice_tup, nbytes)
+    if strategy == HYPERSLAB:
+        return dataset[slice_tup]
+
+    selection = __get_selection(slice_tup, dataset.shape)
+    box = []
+    decimate = []
+    for sl, (start, count, step) in zip(slice_tup, selection):
+        if isinstance(sl, slice):
+            box.append(slice(start, start + (count - 1)*step + 1, 1))
+            decimate.append(slice(None, None, step))
+        else:
+            box.append(sl)
+    if strategy == BULK:
+        return np.ascontiguousarray(dataset[tuple(box)][tuple(decimate)])
+
+    outer = [d for d, s in enumerate(selection) if s[2] > 1][0]
+    axis = len([sl for sl in slice_tup[:outer] if isinstance(sl, slice)])
+    start, count, step = selection[outer]
+    shape = [s[1] for s, sl in zip(selection, slice_tup) if
+             isinstance(sl, slice)]
+    frames = np.empty(shape, dtype=dataset.dtype)
+    index = [slice(None)]*len(shape)
+    del decimate[axis]
+    for i in range(count):
+        box[outer] = start + i*step
+        index[axis] = i
+        frames[tuple(index)] = dataset[tuple(box)][tuple(decimate)]
+    return frames
+
+
+def benchmark(shape, dtype, chunks, path, steps=(2, 4, 8, 16), nbytes=256e6):
+    """ Measure the time taken to read every ``step`` frames of a dataset, as
+    projections (stepped in the first dimension) and as previewed
+    projections (stepped in every dimension) with each strategy, to check
+    the cost model against a filesystem.
+
+    :param tuple shape: the shape of the dataset.
+    :param dtype: the type of the dataset.
+    :param tuple chunks: the chunk shape, or None for a contiguous dataset.
+    :param str path: the directory to create the test file in.
+    :param tuple(int) steps: the preview steps to measure.
+    :param int nbytes: the largest buffer for a bulk read.
+    :returns: the selection, the strategy chosen by the cost model and the
+        time taken by each strategy, for each step.
+    :rtype: list(tuple)
+    """
+    fd, filename = tempfile.mkstemp(suffix='.h5', dir=path)
+    os.close(fd)
+    results = []
+    try:
+        with h5py.File(filename, 'w') as h5:
+            data = h5.create_dataset('data', shape, dtype, chunks=chunks)
+            for i in range(shape[0]):
+                data[i] = i
+        with h5py.File(filename, 'r') as h5:
+            data = h5['data']
+            data[0]
+            for step in steps:
+                for sl in [(slice(0, shape[0], step),) +
+                           (slice(None),)*(len(shape) - 1),
+                           (slice(0, shape[0], step),) +
+                           (slice(0, None, step),)*(len(shape) - 1)]:
+                    times = {}
+                    for strategy in STRATEGIES:
+                        start = time.time()
+                        read(data, sl, nbytes, strategy)
+                        times[strategy] = time.time() - start
+                    results.append((sl, plan_read(
+                        shape, data.dtype.itemsize, chunks, sl, nbytes),
+                        times))
+                    logging.info("%s: %s chosen, %s", sl, results[-1][1],
+                                 ", ".join(["%s %.3fs" % (s, times[s]) for
+                                            s in STRATEGIES]))
+    finally:
+        os.remove(filename)
+    return results
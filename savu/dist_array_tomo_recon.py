@@ -0,0 +1,33 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: dist_array_tomo_recon
+   :platform: Unix
+   :synopsis: Runner for the Savu framework with the dist_array transport, \
+   which keeps intermediate datasets in the memory of the processes.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+from savu import tomo_recon
+
+
+def main():
+    tomo_recon.main(transport='dist_array')
+
+
+if __name__ == '__main__':
+    main()
@@ -40,11 +40,14 @@ class BaseCorrection(Plugin):
     def __init__(self, name='BaseCorrection'):
         super(BaseCorrection, self).__init__(name)
 
-    def process_frames(self, data, slice_list):
+    def process_frames(self, data, slice_list, out=None):
         """
-        Perform the correction
+        Perform the correction, into the output buffer if the plugin reuses
+        output buffers
         """
-        return self.correct(data[0])
+        if out is None:
+            return self.correct(data[0])
+        return self.correct(data[0], out=out[0])
 
     def correct(self, data):
         """
@@ -57,11 +57,14 @@ class BaseFilter(Plugin):
         """
         return 8
 
-    def process_frames(self, data, _):
+    def process_frames(self, data, _, out=None):
         """
-        Calls the main filter processing function
+        Calls the main filter processing function, which is passed the output
+        buffer if the plugin reuses output buffers
         """
-        return self.filter_frames(data)
+        if out is None:
+            return self.filter_frames(data)
+        return self.filter_frames(data, out=out[0])
 
     def filter_frames(self, data):
         """
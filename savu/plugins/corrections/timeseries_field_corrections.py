@@ -57,21 +57,27 @@ class TimeseriesFieldCorrections(BaseCorrection, CpuPlugin):
         self.flat_idx = np.where(image_keys == 1)[0]
         self.dark_idx = np.where(image_keys == 2)[0]
 
-    def correct(self, data):
+    def reuse_output_buffers(self):
+        return True
+
+    def correct(self, data, out=None):
         trimmed_data = data[self.data_idx]
         dark = data[self.dark_idx].mean(0)
-        dark = np.tile(dark, (trimmed_data.shape[0], 1, 1))
-        flat = data[self.flat_idx].mean(0)
-        flat = np.tile(flat, (trimmed_data.shape[0], 1, 1))
-
-        if len(data.shape) is 2:
-            flat = flat.squeeze()
-            dark = dark.squeeze()
-
-        data = (trimmed_data-dark)/(flat-dark)
-
-        # finally clean up and trim the data
-        data = np.nan_to_num(data)
+        flat = data[self.flat_idx].mean(0) - dark
+
+        if out is None:
+            data = (trimmed_data-dark)/flat
+        else:
+            # the correction is computed in double precision one frame at a
+            # time and cast once into the buffer, so no temporary of the
+            # size of the result is created
+            for i in range(len(trimmed_data)):
+                np.divide(trimmed_data[i] - dark, flat, out=out[i],
+                          casting='unsafe')
+            data = out
+
+        # finally clean up the data (infinities are cropped below)
+        data[np.isnan(data)] = 0
 
         # make high and low crop masks
         low_crop = data < self.LOW_CROP_LEVEL
@@ -23,8 +23,7 @@
 import logging
 import copy
 import numpy as np
-from mpi4py import MPI
-
+import savu.core.utils as cu
 from savu.plugins.driver.plugin_driver import PluginDriver
 
 
@@ -39,6 +38,10 @@ class GpuPlugin(PluginDriver):
     def _run_plugin(self, exp, transport):
 
         expInfo = exp.meta_data
+        if expInfo.get_meta_data("mpi") is False:
+            self.__run_single_process(transport)
+            return
+
         processes = copy.copy(expInfo.get_meta_data("processes"))
         process = expInfo.get_meta_data("process")
 
@@ -67,16 +70,25 @@ class GpuPlugin(PluginDriver):
             self._run_plugin_instances(transport, communicator=self.new_comm)
             self._clean_up()
             self.__free_communicator()
-            expInfo.set_meta_data('process', MPI.COMM_WORLD.Get_rank())
+            expInfo.set_meta_data('process', cu.COMM_WORLD.Get_rank())
 
         self.exp._barrier()
         expInfo.set_meta_data('processes', processes)
         return
 
+    def __run_single_process(self, transport):
+        """ Without MPI there is a single process, which runs the plugin on
+        the first GPU.
+        """
+        logging.info("Running the GPU plugin in a single process")
+        self.parameters['GPU_index'] = 0
+        self._run_plugin_instances(transport)
+        self._clean_up()
+
     def __create_new_communicator(self, ranks, exp, process):
-        self.group = MPI.COMM_WORLD.Get_group()
-        self.new_group = MPI.Group.Incl(self.group, ranks)
-        self.new_comm = MPI.COMM_WORLD.Create(self.new_group)
+        self.group = cu.COMM_WORLD.Get_group()
+        self.new_group = cu.MPI.Group.Incl(self.group, ranks)
+        self.new_comm = cu.COMM_WORLD.Create(self.new_group)
         self.exp._barrier()
 
     def __free_communicator(self):
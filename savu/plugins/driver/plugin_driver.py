@@ -23,9 +23,9 @@
 import logging
 import copy
 import numpy as np
-from mpi4py import MPI
-
 import savu.plugins.utils as pu
+import savu.core.utils as cu
+import savu.core.trace as trace
 
 
 class PluginDriver(object):
@@ -36,7 +36,7 @@ class PluginDriver(object):
     def __init__(self):
         super(PluginDriver, self).__init__()
 
-    def _run_plugin_instances(self, transport, communicator=MPI.COMM_WORLD):
+    def _run_plugin_instances(self, transport, communicator=cu.COMM_WORLD):
         """ Runs the pre_process, process and post_process methods.
 
         If parameter tuning is required, loop over the methods and set the
@@ -62,16 +62,19 @@ class PluginDriver(object):
                         .set_fixed_directions(param_dims[j], param_idx[i])
 
             logging.info("%s.%s", self.__class__.__name__, 'pre_process')
-            self.pre_process()
+            with trace.span('pre_process', self.name):
+                self.pre_process()
 
             logging.info("%s.%s", self.__class__.__name__, 'process')
-            transport._process(self)
+            transport._process(self, communicator)
 
             logging.info("%s.%s", self.__class__.__name__, '_barrier')
-            self.exp._barrier(communicator=communicator)
+            with trace.span('barrier', self.name):
+                self.exp._barrier(communicator=communicator)
 
             logging.info("%s.%s", self.__class__.__name__, 'post_process')
-            self.post_process()
+            with trace.span('post_process', self.name):
+                self.post_process()
 
         for j in range(len(out_data)):
             out_data[j].set_shape(out_data[j].data.shape)
@@ -71,3 +71,12 @@ class BandPass(BaseFilter, CpuPlugin):
             lp = gaussian_filter(data, self.parameters['blur_width'])
             result = data - lp
         return result
+
+    def get_frame_pool(self):
+        """
+        The scipy.ndimage filters release the GIL and the filter does not
+        change the plugin state, so slice groups can be processed in threads
+
+         :returns:  'thread'
+        """
+        return 'thread'
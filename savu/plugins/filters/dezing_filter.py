@@ -51,8 +51,10 @@ class DezingFilter(BaseFilter, CpuPlugin):
             dezing.setup_size(self.data_size, self.parameters['outlier_mu'],
                               self.pad)
 
-    def filter_frames(self, data):
-        result = np.empty_like(data[0])
+    def filter_frames(self, data, out=None):
+        # dezing.run fills as many elements as there are in data[0]
+        result = out if out is not None and out.dtype == data[0].dtype \
+            and out.shape == data[0].shape else np.empty_like(data[0])
         logging.debug("Python: calling cython funciton dezing.run")
         (retval, self.warnflag, self.errflag) = dezing.run(data[0], result)
         return result
@@ -60,6 +62,9 @@ class DezingFilter(BaseFilter, CpuPlugin):
     def post_process(self):
         (retval, self.warnflag, self.errflag) = dezing.cleanup()
 
+    def reuse_output_buffers(self):
+        return True
+
     def get_max_frames(self):
         """
         :returns:  an integer of the number of frames. Default 100
@@ -59,3 +59,12 @@ class MedianFilter(BaseFilter, CpuPlugin):
 
     def get_max_frames(self):
         return 8
+
+    def get_frame_pool(self):
+        """
+        The filter does not change the plugin state, so slice groups can be
+        processed in separate processes
+
+         :returns:  'process'
+        """
+        return 'process'
@@ -51,7 +51,10 @@ class PaganinFilter(BaseFilter, CpuPlugin):
                       " initialised")
         super(PaganinFilter, self).__init__("PaganinFilter")
         self.filtercomplex = None
-        self.count = 0
+
+    def pre_process(self):
+        height, width = self.get_plugin_in_datasets()[0].get_shape()
+        self._setup_paganin(width, height)
 
     def _setup_paganin(self, width, height):
         if self.filtercomplex is None:
@@ -89,14 +92,9 @@ class PaganinFilter(BaseFilter, CpuPlugin):
         return result
 
     def filter_frames(self, data):
-        if (self.count % 100 == 0):
-            logging.debug("... %i" % self.count)
-        self.count += 1
         logging.debug("Getting the filter frame of Paganin Filter")
         data = data[0]
         logging.debug("Paganin Filter input shape %s" % str(data.shape))
-        height, width = data.shape
-        self._setup_paganin(width, height)
         data = np.nan_to_num(data)  # Noted performance
         data[data == 0] = 1.0
         padtopbottom = self.parameters['Padtopbottom']
@@ -114,4 +112,14 @@ class PaganinFilter(BaseFilter, CpuPlugin):
     def get_max_frames(self):
         return 1
 
+    def get_frame_pool(self):
+        """
+        The filter is built once in pre_process, and filter_frames does not
+        change the state of the plugin, so slice groups can be processed in
+        threads
+
+         :returns:  'thread'
+        """
+        return 'thread'
+
 # TODO Add the citation information here
@@ -82,6 +82,15 @@ class PolyBackgroundEstimator(BaseFilter, CpuPlugin):
         """
         return 1
 
+    def get_frame_pool(self):
+        """
+        The filter is pure python and does not change the plugin state, so
+        slice groups can be processed in separate processes
+
+         :returns:  'process'
+        """
+        return 'process'
+
     def __generate_parameters(self, n, weight, xdata, ydata):
         """
         generates polynomials based on
@@ -98,6 +98,15 @@ class SinogramAlignment(BaseFilter, CpuPlugin):
         """
         return 1
 
+    def get_frame_pool(self):
+        """
+        The filter does not change the plugin state, so slice groups can be
+        processed in separate processes
+
+         :returns:  'process'
+        """
+        return 'process'
+
     def get_citation_information(self):
         cite_info = CitationInformation()
         cite_info.description = \
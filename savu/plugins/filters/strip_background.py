@@ -102,5 +102,14 @@ class StripBackground(BaseFilter, CpuPlugin):
         """
         return 1
 
+    def get_frame_pool(self):
+        """
+        The filter is pure python and does not change the plugin state, so
+        slice groups can be processed in separate processes
+
+         :returns:  'process'
+        """
+        return 'process'
+
     def nOutput_datasets(self):
         return 1
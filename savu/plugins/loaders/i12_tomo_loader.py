@@ -27,6 +27,7 @@ import numpy as np
 import os
 
 import savu.data.data_structures as ds
+import savu.data.raw_cache as raw_cache
 from savu.plugins.base_loader import BaseLoader
 import savu.test.test_utils as tu
 
@@ -79,8 +80,8 @@ class I12TomoLoader(BaseLoader):
 
         logging.debug("Getting the path to the data")
 
-        data_obj.data = \
-            data_obj.backing_file[self.parameters['data_path']]
+        data_obj.data = raw_cache.get_data(exp, data_obj.backing_file,
+                                           self.parameters['data_path'])
 
         logging.debug("Getting the path to the dark data")
 
@@ -24,6 +24,7 @@
 import h5py
 import logging
 
+import savu.data.raw_cache as raw_cache
 from savu.data.data_structures.data_add_ons import TomoRaw
 from savu.plugins.base_loader import BaseLoader
 
@@ -70,7 +71,8 @@ class NxtomoLoader(BaseLoader):
         logging.debug("Opening file '%s' '%s'", 'tomo_entry',
                       data_obj.backing_file.filename)
 
-        data_obj.data = data_obj.backing_file[self.parameters['data_path']]
+        data_obj.data = raw_cache.get_data(exp, data_obj.backing_file,
+                                           self.parameters['data_path'])
 
         self.__set_dark_and_flat(data_obj)
 
@@ -186,6 +186,40 @@ class Plugin(PluginDatasets):
         logging.error("process frames needs to be implemented")
         raise NotImplementedError("process needs to be implemented")
 
+    def get_frame_pool(self):
+        """
+        Should be overridden if process_frames can be called for several
+        slice groups at the same time, when more than one frame worker is
+        requested
+
+        :returns: 'thread' if process_frames releases the GIL and is thread
+            safe, 'process' if it does not change the state of the plugin, or
+            None to process one slice group at a time
+        """
+        return None
+
+    def reuse_output_buffers(self):
+        """
+        Should be overridden to return True if process_frames accepts an
+        ``out`` keyword, a list of arrays with the shape and type of the
+        result for each output dataset, and fills them rather than creating
+        new arrays.  The arrays are reused for later slice groups once the
+        results have been written.
+
+        :returns: True if process_frames fills the output buffers
+        """
+        return False
+
+    def get_memory_per_frame(self):
+        """
+        Should be overridden if process_frames uses more memory than its
+        input and output frames, when the number of frames in each slice
+        group is chosen from a memory budget
+
+        :returns: the extra memory used for each frame (bytes)
+        """
+        return 0
+
     def post_process(self):
         """
         This method is called after the process function in the pipeline
@@ -200,7 +234,7 @@ class Plugin(PluginDatasets):
     def _clean_up(self):
         """ Perform necessary plugin clean up after the plugin has completed.
         """
-        self.__copy_meta_data()
+        self._copy_meta_data()
         self.__clean_up_plugin_data()
         self.__delete_mappings()
 
@@ -213,7 +247,7 @@ class Plugin(PluginDatasets):
                 del self.exp.index['mapping'][data.get_name()]
                 self.mapping = False
 
-    def __copy_meta_data(self):
+    def _copy_meta_data(self):
         """
         Copy all metadata from input datasets to output datasets, except axis
         # data that is no longer valid.
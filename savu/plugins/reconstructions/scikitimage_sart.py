@@ -111,6 +111,15 @@ class ScikitimageSart(BaseRecon, CpuPlugin):
     def get_max_frames(self):
         return 1
 
+    def get_frame_pool(self):
+        """
+        The reconstruction does not change the plugin state, so slice groups
+        can be processed in separate processes
+
+         :returns:  'process'
+        """
+        return 'process'
+
     def get_citation_information(self):
         cite_info = CitationInformation()
         cite_info.description = \
@@ -24,11 +24,13 @@
 
 import h5py
 import logging
-from mpi4py import MPI
 
+import savu.core.utils as cu
+import savu.core.mpi_io as mpi_io
 from savu.plugins.base_saver import BaseSaver
 from savu.plugins.utils import register_plugin
 from savu.data.chunking import Chunking
+import savu.data.transport_data.chunk_compression as comp
 
 NX_CLASS = 'NX_class'
 
@@ -57,6 +59,12 @@ class Hdf5TomoSaver(BaseSaver):
         count = 0
         for key in out_data_dict.keys():
             out_data = out_data_dict[key]
+            if out_data.backing_file is not None or \
+                    exp.meta_data.get_meta_data(["filename", key]) is None:
+                # already held elsewhere (e.g. in memory by the transport) or
+                # not saved
+                count += 1
+                continue
 
             logging.info("saver setup: 2")
             self.exp._barrier()
@@ -82,15 +90,9 @@ class Hdf5TomoSaver(BaseSaver):
         filename = expInfo.get_meta_data(["filename", key])
         if expInfo.get_meta_data("mpi") is True:
 
-            info = MPI.Info.Create()
-            info.Set("romio_ds_read", "disable")
-            info.Set("romio_ds_write", "disable")
-#            info.Set("romio_cb_read", "enable")
-#            info.Set("romio_cb_write", "disable")
+            info = mpi_io.get_info(expInfo.get_dictionary())
             backing_file = h5py.File(filename, 'w', driver='mpio',
-                                     comm=MPI.COMM_WORLD, info=info)
-            # fapl = backing_file.id.get_access_plist()
-            # comm, info = fapl.get_fapl_mpio()
+                                     comm=cu.COMM_WORLD, info=info)
         else:
             backing_file = h5py.File(filename, 'w')
 
@@ -121,8 +123,17 @@ class Hdf5TomoSaver(BaseSaver):
         self.exp._barrier()
 
         shape = data.get_shape()
+        rank_files = \
+            expInfo.get_dictionary().get('rank_files', {}).get(key, False)
+        filters = {} if rank_files else self.__get_filters(key)
         if current_and_next is 0:
-            data.data = group.create_dataset("data", shape, data.dtype)
+            if rank_files:
+                data.data = data._create_rank_file(True)
+            elif filters:
+                data.data = group.create_dataset("data", shape, data.dtype,
+                                                 chunks=True, **filters)
+            else:
+                data.data = group.create_dataset("data", shape, data.dtype)
         else:
             logging.info("create_entries: 2")
             self.exp._barrier()
@@ -131,9 +142,29 @@ class Hdf5TomoSaver(BaseSaver):
             chunks = chunking._calculate_chunking(shape, data.dtype)
             logging.info("create_entries: 3")
             self.exp._barrier()
-            data.data = group.create_dataset("data", shape, data.dtype,
-                                             chunks=chunks)
+            if rank_files:
+                data.data = data._create_rank_file(chunks)
+            else:
+                data.data = group.create_dataset("data", shape, data.dtype,
+                                                 chunks=chunks, **filters)
             logging.info("create_entries: 4")
             self.exp._barrier()
 
         return group_name, group
+
+    def __get_filters(self, key):
+        """ The compression filters of a dataset in a shared file, which is
+        only compressed if it can be written collectively (see
+        mpi_io.compress_shared_files).
+        """
+        expInfo = self.exp.meta_data
+        filters = comp.get_filters(expInfo.get_dictionary())
+        if filters and not \
+                expInfo.get_dictionary().get('compress', {}).get(key, True):
+            logging.warn("Datasets written independently by many processes "
+                         "are not compressed: use --collective_writes (with "
+                         "hdf5 1.10.2 or later) to compress them, or "
+                         "--per_rank_files to compress the intermediate "
+                         "datasets.")
+            return {}
+        return filters
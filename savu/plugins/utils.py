@@ -27,6 +27,8 @@ import re
 import logging
 import numpy as np
 
+import savu.core.frame_batching as frame_batching
+
 plugins = {}
 plugins_path = {}
 count = 0
@@ -104,6 +106,7 @@ def plugin_loader(exp, plugin_dict, **kwargs):
 
     logging.debug("Running plugin main setup")
     plugin._main_setup(exp, plugin_dict['data'])
+    frame_batching.set_frame_batches(plugin)
 
     if check_flag is True:
         exp.meta_data.plugin_list._set_datasets_list(plugin)
@@ -204,3 +207,12 @@ def calc_param_indices(dims):
         idx = np.ravel(np.kron(range(dims[i]), np.ones((repeat, chunk))))
         indices_list.append(idx.astype(int))
     return np.transpose(np.array(indices_list))
+
+
+def has_post_process(plugin):
+    """
+    Does the plugin override Plugin.post_process?
+    """
+    from savu.plugins.plugin import Plugin
+    return type(plugin).post_process.__func__ is not \
+        Plugin.post_process.__func__
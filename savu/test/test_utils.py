@@ -25,6 +25,7 @@ import inspect
 import tempfile
 import os
 import copy
+import h5py
 
 from savu.core.plugin_runner import PluginRunner
 from savu.data.experiment_collection import Experiment
@@ -76,7 +77,7 @@ def set_experiment(exp_type, **kwargs):
 
 def set_tomoRaw_experiment(filename, **kwargs):
     # create experiment
-    options = set_options(get_test_data_path(filename))
+    options = set_options(get_test_data_path(filename), **kwargs)
     options['loader'] = 'savu.plugins.loaders.nxtomo_loader'
     options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
     return options
@@ -191,6 +192,40 @@ def plugin_runner(options):
     return plugin_runner._run_plugin_list()
 
 
+CHAIN = ['corrections.timeseries_field_corrections', 'filters.median_filter',
+         'filters.no_process_plugin']
+
+
+def run_chain(plugins=CHAIN, data=None, **kwargs):
+    """ Run the tomoRaw test data through a list of plugins (relative to
+    savu.plugins), with extra experiment options, and return the output path.
+    By default each plugin processes the tomo dataset in place.
+    """
+    options = set_experiment('tomoRaw', **kwargs)
+    options.update(kwargs)
+    if data is None:
+        data = [{}] + [set_data_dict(['tomo'], ['tomo'])]*len(plugins) + [{}]
+    set_plugin_list(options, ['savu.plugins.' + p for p in plugins], data)
+    plugin_runner(options)
+    return options['out_path']
+
+
+def get_result_name(plugin, index):
+    """ The file and dataset written by plugin number index (counting from
+    one) of a chain. """
+    name = plugin.split('.')[-1]
+    return ('tomo_p%i_%s.h5' % (index, name),
+            '%i-%s-tomo/data' % (index, pu.module2class(name)))
+
+
+def get_result(path, plugin=CHAIN[-1], index=len(CHAIN)):
+    """ The output of plugin number index of a chain, by default the last
+    plugin of the default chain. """
+    filename, name = get_result_name(plugin, index)
+    with h5py.File(os.path.join(path, filename), 'r') as h5:
+        return h5[name][...]
+
+
 def plugin_runner_load_plugin(options):
     plugin_runner = PluginRunner(options)
     plugin_runner.exp = Experiment(options)
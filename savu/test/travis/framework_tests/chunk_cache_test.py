@@ -0,0 +1,105 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_cache_test
+   :platform: Unix
+   :synopsis: unittest test for the sizing of hdf5 chunk caches
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import unittest
+import tempfile
+import h5py
+import numpy as np
+
+import savu.test.test_utils as tu
+import savu.data.transport_data.chunk_cache as cc
+
+
+class ChunkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __sinograms(self, nFrames):
+        return [(slice(None), slice(i, i + nFrames, 1), slice(None)) for i
+                in range(0, 64, nFrames)]
+
+    def test_chunks_touched(self):
+        shape, chunks = (90, 64, 100), (1, 64, 100)
+        # a sinogram touches every projection chunk
+        self.assertEqual(
+            cc.get_chunks_touched(self.__sinograms(4), shape, chunks), 90)
+        projections = [(slice(i, i + 8, 1), slice(None), slice(None)) for i
+                       in range(0, 90, 8)]
+        self.assertEqual(
+            cc.get_chunks_touched(projections, shape, chunks), 8)
+
+    def test_hit_rate(self):
+        shape, chunks = (90, 64, 100), (1, 16, 100)
+        slice_list = self.__sinograms(4)
+        # each chunk holds 4 slice groups
+        self.assertEqual(
+            cc.estimate_hit_rate(slice_list, shape, chunks, 90), 0.75)
+        self.assertEqual(
+            cc.estimate_hit_rate(slice_list, shape, chunks, 89), 0.0)
+
+    def test_nslots(self):
+        for nChunks in [0, 1, 10, 77]:
+            n = cc.get_nslots(nChunks)
+            self.assertTrue(n >= 100*nChunks)
+            self.assertFalse([d for d in range(2, n) if n % d == 0])
+
+    def test_share_budget(self):
+        self.assertEqual(cc.share_budget([4e6, 2e6], 12e6), [4e6, 2e6])
+        self.assertEqual(cc.share_budget([4e6, 2e6], 3e6),
+                         [2e6, cc.DEFAULT_NBYTES])
+
+    def test_set_chunk_cache(self):
+        data, pData = tu.get_data_object(tu.load_test_data("tomo"))
+        h5 = h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w')
+        values = np.random.rand(*data.get_shape()).astype(np.float32)
+        data.data = h5.create_dataset('data', data=values,
+                                      chunks=(1,) + values.shape[1:])
+        data._finalise_patterns()
+        pData.plugin_data_setup('SINOGRAM', 4)
+        slice_list = data._get_grouped_slice_list()
+        nbytes = data._get_chunk_cache_size(slice_list)
+        self.assertEqual(nbytes, values.nbytes)
+
+        dataset = data.data
+        data._set_chunk_cache(slice_list, nbytes)
+        self.assertTrue(data.data is dataset)
+        self.assertEqual(data.data.id.get_access_plist().get_chunk_cache()[1],
+                         nbytes)
+        for sl in slice_list:
+            self.assertTrue(np.array_equal(data.data[sl], values[sl]))
+
+        # the cache of a dataset that is open elsewhere is not changed
+        other = h5['data']
+        data._set_chunk_cache(slice_list, 2*nbytes)
+        self.assertEqual(data.data.id.get_access_plist().get_chunk_cache()[1],
+                         nbytes)
+        h5.close()
+
+if __name__ == "__main__":
+    unittest.main()
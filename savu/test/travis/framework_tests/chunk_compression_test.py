@@ -0,0 +1,120 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_compression_test
+   :platform: Unix
+   :synopsis: unittest test for compressed datasets written with direct \
+   chunk writes
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+import savu.data.transport_data.chunk_compression as cc
+
+
+class ChunkCompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_direct_chunk_writes(self):
+        shape = (10, 12, 9)
+        expected = np.random.rand(*shape).astype(np.float32)
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w') as h5:
+            data = h5.create_dataset('data', shape, np.float32,
+                                     chunks=(4, 12, 3),
+                                     **cc.get_filters({'compression': 'gzip'}))
+            compressor = cc.ChunkCompressor(data, 2)
+            # whole chunks, then chunks at the end of the dataset
+            self.assertTrue(compressor.write(
+                (slice(0, 4, 1), slice(None), slice(None)), expected[0:4]))
+            self.assertTrue(compressor.write(
+                (slice(8, 10, 1), slice(None), slice(None)), expected[8:10]))
+            # chunks completed by two slice groups
+            for i in [4, 6]:
+                self.assertTrue(compressor.write(
+                    (slice(i, i + 2, 1), slice(None), slice(0, 9, 1)),
+                    expected[i:i + 2]))
+            self.assertEqual(compressor.partial, {})
+            compressor.close()
+            np.testing.assert_array_equal(data[...], expected)
+
+            nbytes, stored, seconds, waited = compressor.get_stats()
+            self.assertEqual(nbytes, expected.nbytes)
+            self.assertTrue(0 < stored)
+            self.assertTrue(0 < seconds)
+
+            # stepped selections are written by the caller
+            self.assertFalse(compressor.write(
+                (slice(0, 4, 2), slice(None), slice(None)), expected[0:4:2]))
+
+    def test_incomplete_chunks(self):
+        shape = (10, 12, 9)
+        expected = np.zeros(shape, np.float32)
+        expected[1:7, 2:5] = np.random.rand(6, 3, 9)
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w') as h5:
+            data = h5.create_dataset('data', shape, np.float32,
+                                     chunks=(4, 12, 3),
+                                     **cc.get_filters({'compression': 'gzip'}))
+            # room for one incomplete chunk
+            compressor = cc.ChunkCompressor(data, 2, 4*12*3*4)
+            for i in [1, 4]:
+                self.assertTrue(compressor.write(
+                    (slice(i, i + 3, 1), slice(2, 5, 1), slice(None)),
+                    expected[i:i + 3, 2:5]))
+            self.assertEqual(len(compressor.partial), 1)
+            compressor.close()
+            np.testing.assert_array_equal(data[...], expected)
+            self.assertTrue(cc.get_report('data', [compressor.get_stats()]))
+
+    def test_lzf_is_not_written_directly(self):
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w') as h5:
+            data = h5.create_dataset('data', (4, 4), np.float32, chunks=True,
+                                     **cc.get_filters({'compression': 'lzf'}))
+            compressor = cc.ChunkCompressor(data, 2)
+            self.assertFalse(compressor.write((slice(None), slice(None)),
+                                              np.zeros((4, 4), np.float32)))
+            compressor.close()
+        self.assertEqual(cc.get_filters({}), {})
+
+    def get_compression(self, path, plugin, index):
+        filename, name = tu.get_result_name(plugin, index)
+        with h5py.File(os.path.join(path, filename), 'r') as h5:
+            return h5[name].compression
+
+    def test_compressed_chain(self):
+        path = tu.run_chain()
+        expected = tu.get_result(path)
+        self.assertEqual(self.get_compression(path, tu.CHAIN[2], 3), None)
+        path = tu.run_chain(compression='gzip')
+        np.testing.assert_array_equal(tu.get_result(path), expected)
+        for i in [2, 3]:
+            self.assertEqual(
+                self.get_compression(path, tu.CHAIN[i - 1], i), 'gzip')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_reader_test
+   :platform: Unix
+   :synopsis: unittest test for compressed datasets read as raw chunks and \
+   decompressed in threads
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import zlib
+import h5py
+import struct
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+import savu.data.transport_data.chunk_reader as cr
+import savu.data.transport_data.chunk_compression as cc
+
+
+class ChunkReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5 = h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w')
+        self.expected = np.random.rand(10, 12, 9).astype(np.float32)
+
+    def tearDown(self):
+        self.h5.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_decode(self):
+        # the chunks written by a ChunkCompressor are shuffled and deflated
+        chunk = np.ascontiguousarray(self.expected[0:4, 0:5])
+        filters = [(cr.SHUFFLE, (4,)), (cr.DEFLATE, (1,))]
+        data, seconds = cc._compress(chunk, 1)
+        np.testing.assert_array_equal(
+            cr._decode(data, 0, filters, chunk.dtype, chunk.shape), chunk)
+        # the filters of the mask are skipped
+        data = chunk.tobytes()
+        np.testing.assert_array_equal(
+            cr._decode(data, 3, filters, chunk.dtype, chunk.shape), chunk)
+
+    def test_deflate(self):
+        chunk = self.expected[0:4]
+        shuffled = np.frombuffer(chunk.tobytes(), np.uint8).reshape(
+            -1, chunk.dtype.itemsize).T.tobytes()
+        np.testing.assert_array_equal(cr._decode(
+            zlib.compress(shuffled), 0, [(cr.SHUFFLE, (4,)),
+                                         (cr.DEFLATE, (4,))],
+            chunk.dtype, chunk.shape), chunk)
+
+    def __lz4_filter(self, blocks, total, block):
+        """ The hdf5 lz4 filter output: the sizes, then each block with its
+        size. """
+        return struct.pack('>QI', total, block) + b''.join(
+            [struct.pack('>I', len(b)) + b for b in blocks])
+
+    def test_lz4(self):
+        chunk = self.expected[0:4]
+        data = chunk.tobytes()
+        # blocks that do not compress are stored as they are
+        blocks = [data[:1000], data[1000:]]
+        np.testing.assert_array_equal(cr._decode(
+            self.__lz4_filter(blocks, len(data), 1000), 0, [(cr.LZ4, (0,))],
+            chunk.dtype, chunk.shape), chunk)
+        if cr.lz4 is None:
+            return
+        data = np.zeros(chunk.shape, chunk.dtype).tobytes()
+        blocks = [cr.lz4.compress(data[i:i+1000], store_size=False) for i in
+                  range(0, len(data), 1000)]
+        np.testing.assert_array_equal(cr._decode(
+            self.__lz4_filter(blocks, len(data), 1000), 0, [(cr.LZ4, (0,))],
+            chunk.dtype, chunk.shape), 0)
+
+    @unittest.skipUnless(cr.bitshuffle, "bitshuffle is not installed")
+    def test_bitshuffle(self):
+        chunk = self.expected[0:4]
+        # only the compressed data starts with the sizes
+        for block in [0, 64]:
+            data = cr.bitshuffle.bitshuffle(chunk.ravel(), block).tobytes()
+            np.testing.assert_array_equal(cr._decode(
+                data, 0, [(cr.BITSHUFFLE, (0, 3, 4, block, 0))],
+                chunk.dtype, chunk.shape), chunk)
+        block = 64
+        data = struct.pack('>QI', chunk.nbytes, block*4) + \
+            cr.bitshuffle.compress_lz4(chunk.ravel(), block).tobytes()
+        np.testing.assert_array_equal(cr._decode(
+            data, 0, [(cr.BITSHUFFLE, (0, 3, 4, 0, 2))], chunk.dtype,
+            chunk.shape), chunk)
+
+    @unittest.skipUnless(cr.DIRECT_CHUNK_READS,
+                         "the raw chunks can not be read")
+    def test_read(self):
+        data = self.h5.create_dataset('data', data=self.expected,
+                                      chunks=(4, 5, 9), compression='gzip',
+                                      shuffle=True)
+        filters = cr.get_filters(data)
+        self.assertEqual([f[0] for f in filters], [cr.SHUFFLE, cr.DEFLATE])
+        reader = cr.ChunkReader(data, filters, 2, 3*data.id.get_storage_size())
+        for sl in [(slice(1, 9, 1), slice(None), slice(None)),
+                   (slice(None), 3, slice(2, 7, 1)),
+                   (9, slice(10, 12, 1), 0)]:
+            np.testing.assert_array_equal(reader.read(sl), self.expected[sl])
+        # stepped selections are read by h5py
+        self.assertEqual(
+            reader.read((slice(0, 10, 2), slice(None), slice(None))), None)
+        reader.close()
+
+    @unittest.skipUnless(cr.DIRECT_CHUNK_READS,
+                         "the raw chunks can not be read")
+    def test_unwritten_chunks(self):
+        data = self.h5.create_dataset('data', (10, 12, 9), np.float32,
+                                      chunks=(4, 12, 9), compression='gzip',
+                                      fillvalue=2)
+        data[0:4] = self.expected[0:4]
+        reader = cr.ChunkReader(data, cr.get_filters(data), 2, 1e6)
+        np.testing.assert_array_equal(reader.read((slice(None),)*3),
+                                      data[...])
+        reader.close()
+
+    @unittest.skipUnless(cr.DIRECT_CHUNK_READS,
+                         "the raw chunks can not be read")
+    def test_unsupported_filters(self):
+        self.assertEqual(cr.get_filters(self.h5.create_dataset(
+            'contiguous', data=self.expected)), None)
+        self.assertEqual(cr.get_filters(self.h5.create_dataset(
+            'scaleoffset', data=self.expected, scaleoffset=2)), None)
+
+    def test_compressed_chain(self):
+        # the intermediate datasets are compressed, and read as raw chunks
+        expected = tu.get_result(tu.run_chain())
+        for threads in [4, 0]:
+            np.testing.assert_array_equal(tu.get_result(tu.run_chain(
+                compression='gzip', read_threads=threads)), expected)
+
+if __name__ == "__main__":
+    unittest.main()
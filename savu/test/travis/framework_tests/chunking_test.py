@@ -21,16 +21,24 @@
 
 """
 
+import shutil
 import unittest
+import tempfile
 from savu.test import test_utils as tu
 import numpy as np
 
-from savu.data.chunking import Chunking
+from savu.data.chunking import Chunking, benchmark
 from savu.data.experiment_collection import Experiment
 
 
 class ChunkingTests(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
 #    def test_spectra_to_tomo(self):
 #        options = {
 #            "transport": "hdf5",
@@ -41,11 +49,13 @@ class ChunkingTests(unittest.TestCase):
 #            }
 #        run_protected_plugin_runner(options)
 
-    def create_chunking_instance(self, current_list, nnext_list, nProcs):
+    def create_chunking_instance(self, current_list, nnext_list, nProcs,
+                                 **kwargs):
         current = self.create_pattern('a', current_list)
         nnext = self.create_pattern('b', nnext_list)
         options = tu.set_experiment('tomoRaw')
         options['processes'] = range(nProcs)
+        options.update(kwargs)
         # set a dummy process list
         options['process_file'] = \
             tu.get_test_process_path('basic_tomo_process.nxs')
@@ -66,100 +76,110 @@ class ChunkingTests(unittest.TestCase):
             prod *= np.ceil(shape[i]/float(chunks[i]))
         return prod
 
+    def check_chunks(self, chunking, shape, expected):
+        chunks = chunking._calculate_chunking(shape, np.float32)
+        self.assertEqual(chunks, expected)
+        self.assertTrue(4*np.prod(chunks) <= chunking.target)
+
     def test_chunks_2D(self):
         current = [1, (0,), (1,)]
         nnext = [1, (0,), (1,)]
-        shape = (100, 20)
-        nProcs = 1
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, True)
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        # a chunk smaller than a filesystem block costs the same to read
+        chunking.block = 4096
+        self.check_chunks(chunking, (100, 20), (50, 20))
+
+        nnext = [1, (1,), (0,)]
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        chunking.block = 4096
+        self.check_chunks(chunking, (1000, 2000), (128, 128))
 
     def test_chunks_3D_1(self):
         current = [1, (0,), (1, 2)]
         nnext = [1, (0,), (1, 2)]
         shape = (5000, 500, 500)
-        nProcs = 1
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (1, 500, 500))
-
-        nProcs = 2
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (1, 500, 500))
-
-        shape = (5000, 5000, 5000)
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        print "nChunks =", self.get_nChunks(shape, chunks)
-        self.assertEqual(chunks, (1, 625, 313))
-
-        shape = (5000, 5000, 5000)
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        print "nChunks =", self.get_nChunks(shape, chunks)
-        self.assertEqual(chunks, (1, 625, 313))
+        for nProcs in [1, 2]:
+            chunking = self.create_chunking_instance(current, nnext, nProcs)
+            chunking.block = 4096
+            self.check_chunks(chunking, shape, (1, 500, 500))
 
-        shape = (1, 800, 500)
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        print "nChunks =", self.get_nChunks(shape, chunks)
-        self.assertEqual(chunks, (1, 400, 500))
+        self.check_chunks(chunking, (5000, 5000, 5000), (1, 40, 5000))
+        self.check_chunks(chunking, (1, 800, 500), (1, 400, 500))
 
     def test_chunks_3D_2(self):
         current = [1, (0,), (1, 2)]
         nnext = [1, (1,), (0, 2)]
         shape = (50, 300, 100)
-        nProcs = 1
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (50, 50, 100))
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        chunking.block = 4096
+        self.check_chunks(chunking, shape, (13, 16, 100))
 
         current = [8, (0,), (1, 2)]
         nnext = [4, (1,), (0, 2)]
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (48, 52, 100))
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        chunking.block = 4096
+        self.check_chunks(chunking, shape, (25, 16, 100))
 
-        nProcs = 10
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (8, 28, 100))
+        # each process writes to its own chunks
+        chunking = self.create_chunking_instance(current, nnext, 10)
+        chunking.block = 4096
+        self.check_chunks(chunking, shape, (8, 8, 100))
 
     def test_chunks_4D_1(self):
-        current = [1, (0, 1), (2, 3)]
-        nnext = [1, (0, 1), (2, 3)]
         shape = (800, 700, 600, 500)
-        nProcs = 1
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (1, 1, 300, 500))
-
         current = [1, (0, 1), (2, 3)]
-        nnext = [1, (2, 3), (0, 1)]
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (23, 22, 22, 22))
+        nnext = [1, (0, 1), (2, 3)]
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        chunking.block = 4096
+        self.check_chunks(chunking, shape, (1, 1, 300, 500))
 
         current = [1, (0,), (1, 2, 3)]
         nnext = [1, (0,), (1, 2, 3)]
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (1, 44, 75, 63))
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        chunking.block = 4096
+        self.check_chunks(chunking, shape, (1, 3, 150, 500))
 
         current = [4, (0,), (1, 2, 3)]
         nnext = [8, (1, 2), (0, 3)]
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
+        for nProcs in [1, 200]:
+            chunking = self.create_chunking_instance(current, nnext, nProcs)
+            chunking.block = 4096
+            self.check_chunks(chunking, shape, (4, 8, 1, 500))
+
+    def test_chunks_5D(self):
+        current = [1, (0, 1, 2), (3, 4)]
+        nnext = [1, (3, 4, 0), (1, 2)]
+        chunking = self.create_chunking_instance(current, nnext, 4)
+        chunking.block = 4096
+        self.check_chunks(chunking, (20, 30, 40, 256, 256),
+                          (1, 15, 10, 1, 128))
+
+    def test_target(self):
+        current = [1, (0,), (1, 2)]
+        nnext = [1, (1,), (0, 2)]
+        shape = (1800, 2560, 2160)
+        chunking = self.create_chunking_instance(current, nnext, 1,
+                                                 chunk_target_mb=4)
+        self.assertEqual(chunking.target, 4e6)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (8, 8, 7, 500))
+        self.assertTrue(4*np.prod(chunks) <= 4e6)
 
-        nProcs = 200
-        current = [4, (0,), (1, 2, 3)]
-        nnext = [8, (1, 2), (0, 3)]
-        chunking = self.create_chunking_instance(current, nnext, nProcs)
-        chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(chunks, (4, 8, 15, 500))
+        # the best chunks have the lowest cost
+        ranked = chunking._rank_chunks(shape, np.float32, 5)
+        self.assertEqual(ranked[0][0], chunks)
+        costs = [cost for _, cost in ranked]
+        self.assertEqual(costs, sorted(costs))
+
+    def test_benchmark(self):
+        current = [1, (0,), (1, 2)]
+        nnext = [1, (1,), (0, 2)]
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        results = benchmark(chunking, (20, 30, 40), np.float32,
+                            self.tmpdir, nCandidates=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0][0],
+                         chunking._calculate_chunking((20, 30, 40),
+                                                      np.float32))
 
 if __name__ == "__main__":
     unittest.main()
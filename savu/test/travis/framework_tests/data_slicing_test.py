@@ -21,13 +21,28 @@
 
 """
 
+import os
+import shutil
 import unittest
+import tempfile
+import itertools
+import h5py
+import numpy as np
+
 import savu.test.test_utils as tu
 from savu.data.data_structures.data_add_ons import Padding
+from savu.data.transport_data.slice_index import SliceIndex
+from savu.data.transport_data.read_planner import read_index_runs
 
 
 class Test(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
     def test_slice(self):
         data, pData = tu.get_data_object(tu.load_test_data("tomo"))
 
@@ -92,6 +107,40 @@ class Test(unittest.TestCase):
             total.append(data._get_slice_list_per_process(exp.meta_data))
         self.assertEqual(len(sl), sum(len(t) for t in total))
 
+    def test_slice_index(self):
+        exp = tu.load_test_data("tomo")
+        data, pData = tu.get_data_object(exp)
+        processes = ['t', 't', 't']
+
+        pData.plugin_data_setup('SINOGRAM', 8)
+        self.assertIs(data._get_slice_index(), data._get_slice_index())
+        gsl = list(data._get_grouped_slice_list())
+        self.assertEqual(gsl[0], (slice(0, 91, 1), slice(0, 8, 1),
+                                  slice(0, 160, 1)))
+        self.assertEqual(gsl[-1], (slice(0, 91, 1), slice(128, 135, 1),
+                                   slice(0, 160, 1)))
+        total = []
+        for i in range(len(processes)):
+            tu.set_process(exp, i, processes)
+            total += list(data._get_slice_list_per_process(exp.meta_data))
+        self.assertEqual(gsl, total)
+
+    def test_slice_index_multiple_slice_dims(self):
+        values = [np.arange(2, 12, 2), np.arange(3), np.array([7, 9])]
+        index = SliceIndex([slice(None)]*4, [3, 1, 0], values, [1, 5, 15],
+                           30, 5, 2, 2)
+        frames = [(slice(c, c+1, 1), slice(b, b+1, 1), slice(None),
+                   slice(a, a+1, 1)) for c, b, a in
+                  itertools.product(values[2], values[1], values[0])]
+        self.assertEqual(index.get_frame_slices(), frames)
+
+        groups = index.get_range(0, len(index))
+        self.assertEqual(len(groups), 18)
+        self.assertEqual(groups[1][3], slice(6, 9, 2))
+        self.assertEqual(groups[2][3], slice(10, 11, 2))
+        self.assertEqual(groups[3][1], slice(1, 2, 1))
+        self.assertEqual(list(groups[16:]), [groups[-2], groups[-1]])
+
     def test_get_padded_slice_data(self):
         data, pData = tu.get_data_object(tu.load_test_data("tomo"))
 
@@ -104,6 +153,66 @@ class Test(unittest.TestCase):
             getattr(padding, key)(data.padding[key])
         return padding._get_padding_directions()
 
+    def test_get_padded_slice_data_halo(self):
+        data, pData = tu.get_data_object(tu.load_test_data("tomo"))
+        h5 = h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w')
+        values = np.random.rand(*data.get_shape()).astype(np.float32)
+        data.data = h5.create_dataset('data', data=values)
+
+        data._finalise_patterns()
+        pData.plugin_data_setup('PROJECTION', 8)
+        pData.padding = {'pad_multi_frames': 3}
+        expected = np.pad(values, ((3, 3), (0, 0), (0, 0)), mode='edge')
+        for sl in data._get_grouped_slice_list():
+            frames = data._get_padded_slice_data(sl)
+            self.assertTrue(np.array_equal(
+                frames, expected[sl[0].start:sl[0].stop + 6]))
+            # changing the frames must not change the next slice group
+            frames[...] = -1
+        h5.close()
+
+    def test_planned_reads(self):
+        data, pData = tu.get_data_object(tu.load_test_data("tomo"))
+        h5 = h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w')
+        values = np.random.rand(*data.get_shape()).astype(np.float32)
+        data.data = h5.create_dataset('data', data=values)
+
+        data._finalise_patterns()
+        for pattern, nFrames, step in [('SINOGRAM', 4, 1),
+                                       ('PROJECTION', 8, 3)]:
+            data.get_preview().set_preview(
+                ['0:%i:%i:1' % (values.shape[0], step), ':', ':'])
+            pData.plugin_data_setup(pattern, nFrames)
+            slice_list = data._get_grouped_slice_list()
+            frame_bytes = 4*np.prod(values.shape)/values.shape[
+                pData.get_slice_directions()[0]]
+            data._plan_reads(slice_list, 20*frame_bytes)
+            plan = data._Hdf5TransportData__read_plan
+            self.assertTrue(1 < len(plan.runs) < len(slice_list))
+            for sl in slice_list:
+                self.assertTrue(np.array_equal(
+                    data._get_padded_slice_data(sl), values[sl]))
+            data._clear_read_plan()
+        h5.close()
+
+    def test_read_index_runs(self):
+        h5 = h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w')
+        values = np.random.rand(20, 5, 6).astype(np.float32)
+        dataset = h5.create_dataset('data', data=values)
+        index = [1, 2, 3, 7, 8, 15]
+        self.assertTrue(np.array_equal(
+            read_index_runs(dataset, (index, slice(None), 2)),
+            values[index, :, 2]))
+        self.assertTrue(np.array_equal(
+            read_index_runs(dataset, (slice(2, 4, 1), [0, 1, 4],
+                                      slice(None))), values[2:4, [0, 1, 4]]))
+        # an empty selection, e.g. an image key with no dark frames
+        for index in [[], np.zeros(20, dtype=bool)]:
+            empty = read_index_runs(dataset, (index, slice(None), 2))
+            self.assertEqual(empty.shape, values[[], :, 2].shape)
+            self.assertEqual(empty.dtype, values.dtype)
+        h5.close()
+
 #        in_data.padding = {'pad_multi_frames':10, 'pad_edges':5}
 #                
 #        in_data.padding = {'pad_direction':[0, 3]}
@@ -0,0 +1,60 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: dist_array_transport_test
+   :platform: Unix
+   :synopsis: unittest test for the distributed array transport
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import numpy as np
+
+import savu.core.utils as cu
+import savu.data.transport_data.dist_array_transport_data as dat
+from savu.test import test_utils as tu
+
+
+@unittest.skipIf(cu.MPI is None, "mpi4py is not installed")
+class DistArrayTransportTest(unittest.TestCase):
+
+    def test_dist_array(self):
+        # only the final dataset is written to a file
+        path = tu.run_chain(transport='dist_array')
+        self.assertEqual([f for f in os.listdir(path) if f.endswith('.h5')],
+                         ['tomo_p3_no_process_plugin.h5'])
+        np.testing.assert_array_equal(tu.get_result(path),
+                                      tu.get_result(tu.run_chain()))
+
+    def test_gather(self):
+        data = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+        array = dat.DistArray('test', data.shape, data.dtype, cu.MPI.COMM_SELF)
+        array.allocate(dat.get_boxes([(slice(0, 2, 1),), (slice(2, 3, 1),)],
+                                     data.shape))
+        self.assertEqual(len(array.owned), 1)
+        array[0:2] = data[0:2]
+        array[2:3] = data[2:3]
+        array.gather(((0, 3), (1, 4), (0, 5)))
+        np.testing.assert_array_equal(array[:, 1:4:2, 2], data[:, 1:4:2, 2])
+        # frames are only written to the blocks that this process owns
+        array.allocate(dat.get_boxes([(slice(0, 2, 1),)], data.shape))
+        self.assertRaises(IndexError, array.__setitem__, slice(1, 3),
+                          data[1:3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: estimate_test
+   :platform: Unix
+   :synopsis: unittest test for estimating the cost of a process list
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import tempfile
+import unittest
+
+import savu.core.estimate as estimate
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class EstimateTest(unittest.TestCase):
+
+    def test_estimate(self):
+        options = tu.set_experiment('tomoRaw')
+        options['estimate'] = True
+        plugin = 'savu.plugins.'
+        plugins = [plugin + 'corrections.timeseries_field_corrections',
+                   plugin + 'filters.median_filter',
+                   plugin + 'filters.no_process_plugin']
+        data = [{}] + [tu.set_data_dict(['tomo'], ['tomo'])]*3 + [{}]
+        tu.set_plugin_list(options, plugins, data)
+        exp = run_protected_plugin_runner(options)
+
+        self.assertFalse([f for f in os.listdir(options['out_path'])
+                          if f.endswith('.h5')])
+        estimates = exp.meta_data.get_meta_data('estimates')
+        self.assertEqual([e['name'] for e in estimates],
+                         ['TimeseriesFieldCorrections', 'MedianFilter',
+                          'NoProcessPlugin'])
+        for est in estimates:
+            self.assertEqual(est['files'], 1)
+            self.assertGreater(est['written'], 0)
+            self.assertGreaterEqual(est['amplification'], 1.0)
+            self.assertGreater(est['memory'], 0)
+            self.assertGreater(est['processing'], 0)
+            self.assertEqual(est['time'], est['io_time'] + est['processing'])
+        # the output of each plugin is the input of the next
+        self.assertEqual(estimates[1]['read'],
+                         estimates[0]['written']*estimates[1]['amplification'])
+
+    def test_drop_cache(self):
+        fd, filename = tempfile.mkstemp()
+        os.write(fd, '0'*1024)
+        os.close(fd)
+        try:
+            self.assertTrue(estimate._drop_cache(filename, sync=True))
+        finally:
+            os.remove(filename)
+
+    def test_read_amplification(self):
+        sino = {'SINOGRAM': {'core_dir': (0, 2), 'slice_dir': (1,),
+                             'max_frames': 1}}
+        self.assertEqual(
+            estimate._read_amplification((10, 20, 30), None, sino), 1.0)
+        self.assertEqual(
+            estimate._read_amplification((10, 20, 30), (10, 1, 30), sino),
+            1.0)
+        self.assertEqual(
+            estimate._read_amplification((10, 20, 30), (1, 20, 30), sino),
+            20.0)
+        self.assertEqual(
+            estimate._read_amplification((10, 20, 30), (1, 8, 30), sino),
+            8.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_batching_test
+   :platform: Unix
+   :synopsis: unittest test for choosing the number of frames in each slice \
+   group from a memory budget
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import unittest
+import numpy as np
+
+import savu.core.frame_batching as fb
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class FrameBatchingTest(unittest.TestCase):
+
+    def run_median_filter(self, **kwargs):
+        options = tu.set_experiment('tomoRaw')
+        options.update(kwargs)
+        plugin = 'savu.plugins.'
+        plugins = [plugin + 'corrections.timeseries_field_corrections',
+                   plugin + 'filters.median_filter']
+        data = [{}] + [tu.set_data_dict(['tomo'], ['tomo'])]*2 + [{}]
+        tu.set_plugin_list(options, plugins, data)
+        exp = run_protected_plugin_runner(options)
+        self.datasets_list = exp.meta_data.plugin_list._get_datasets_list()
+        pattern = self.datasets_list[-1]['in_datasets'][0]['pattern']
+        filename = os.path.join(options['out_path'],
+                                'tomo_p2_median_filter.h5')
+        with h5py.File(filename, 'r') as h5:
+            result = h5['2-MedianFilter-tomo']['data'][...]
+        return pattern.values()[0]['max_frames'], result
+
+    def test_frame_budget(self):
+        nFrames, expected = self.run_median_filter()
+        self.assertEqual(nFrames, 8)
+        # without a budget, the chunking uses the plugin maximum for every
+        # dataset
+        for entry, max_frames in zip(self.datasets_list, [4, 8]):
+            for data in entry['in_datasets'] + entry['out_datasets']:
+                self.assertEqual(
+                    data['pattern'].values()[0]['max_frames'], max_frames)
+        # 1 MB holds 5 input and output projections
+        nFrames, result = self.run_median_filter(frame_budget_mb=1)
+        self.assertEqual(nFrames, 5)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_choose_frames(self):
+        # limited by the plugin maximum
+        self.assertEqual(fb.choose_frames((100, 1), 1, 8, 10, 0, 0, 1e6), 8)
+        # limited by memory
+        self.assertEqual(fb.choose_frames((100, 1), 1, 8, 10, 0, 0, 55), 5)
+        # 17 slice groups of 8 frames on 4 processes is 5 groups (40 frames)
+        # for the busiest process, and 20 groups of 7 is 5 groups (35)
+        self.assertEqual(fb.choose_frames((135, 1), 4, 8, 1, 0, 0, 1e6), 7)
+        # padding is at most half of the frames read
+        self.assertEqual(fb.choose_frames((100, 1), 1, 8, 10, 2, 10, 1e6), 8)
+        self.assertEqual(fb.choose_frames((100, 1), 1, 100, 1, 2, 1, 1e6),
+                         100)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_pool_test
+   :platform: Unix
+   :synopsis: unittest test for processing several slice groups at once
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import time
+import tempfile
+import unittest
+import numpy as np
+
+import savu.core.frame_pool as fp
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+def process(item):
+    count, data = item
+    time.sleep(0.01*(count % 3))
+    return count, [data*2, os.getpid()]
+
+
+def fail(item):
+    if item[0] == 5:
+        raise ValueError("process failed")
+    return process(item)
+
+
+class FramePoolTest(unittest.TestCase):
+
+    def run_pool(self, pool):
+        items = [(i, np.ones((2, 5))*i) for i in range(12)]
+        results = list(pool.map(process, iter(items)))
+        self.assertEqual([r[0] for r in results], range(12))
+        for count, result in results:
+            np.testing.assert_array_equal(result[0], np.ones((2, 5))*2*count)
+        return set([r[1][1] for r in results])
+
+    def test_get_frame_pool(self):
+        self.assertIsInstance(fp.get_frame_pool(['process'], 1),
+                              fp.SerialPool)
+        self.assertIsInstance(fp.get_frame_pool(['thread', None], 4),
+                              fp.SerialPool)
+        self.assertIsInstance(fp.get_frame_pool(['thread'], 4),
+                              fp.ThreadFramePool)
+        self.assertIsInstance(fp.get_frame_pool(['thread', 'process'], 4),
+                              fp.ProcessFramePool)
+        # process pools are not forked in MPI processes
+        self.assertIsInstance(fp.get_frame_pool(['process'], 4, mpi=True),
+                              fp.SerialPool)
+        self.assertIsInstance(fp.get_frame_pool(['thread'], 4, mpi=True),
+                              fp.ThreadFramePool)
+
+    def test_pools(self):
+        self.assertEqual(self.run_pool(fp.SerialPool()), set([os.getpid()]))
+        self.assertEqual(self.run_pool(fp.ThreadFramePool(3)),
+                         set([os.getpid()]))
+        self.assertNotIn(os.getpid(), self.run_pool(fp.ProcessFramePool(3)))
+
+    def test_process_pool_cleanup(self):
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else \
+            tempfile.gettempdir()
+        before = set(os.listdir(shm))
+        items = [(i, np.ones((2, 5))*i) for i in range(12)]
+        results = fp.ProcessFramePool(3).map(fail, iter(items))
+        self.assertRaises(ValueError, list, results)
+        # a pool that is closed before its results are consumed
+        results = fp.ProcessFramePool(3).map(process, iter(items))
+        results.next()
+        results.close()
+        self.assertEqual(set(os.listdir(shm)) - before, set())
+
+    def run_background(self, workers):
+        options = tu.set_options(
+            tu.get_test_data_path('mm.nxs'),
+            process_file=tu.get_test_process_path('poly_background_test.nxs'))
+        options['frame_workers'] = workers
+        run_protected_plugin_runner(options)
+        results = []
+        for f in sorted(os.listdir(options['out_path'])):
+            if f.endswith('.h5'):
+                with h5py.File(os.path.join(options['out_path'], f), 'r') as h:
+                    h.visititems(lambda n, d: results.append(d[...]) if
+                                 isinstance(d, h5py.Dataset) and
+                                 n.endswith('/data') else None)
+        return results
+
+    def test_process_pool_plugin(self):
+        serial = self.run_background(1)
+        pooled = self.run_background(3)
+        self.assertEqual(len(serial), len(pooled))
+        for s, p in zip(serial, pooled):
+            np.testing.assert_array_equal(s, p)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_scheduler_test
+   :platform: Unix
+   :synopsis: unittest test for sharing slice groups between processes
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import unittest
+
+import savu.core.utils as cu
+import savu.core.frame_scheduler as fs
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+class FrameSchedulerTest(unittest.TestCase):
+
+    def test_static(self):
+        scheduler = fs.get_scheduler(7, cu.SerialComm(), 'dynamic')
+        self.assertIsInstance(scheduler, fs.StaticScheduler)
+        self.assertEqual(list(scheduler), range(7))
+        scheduler.close('test')
+
+    @unittest.skipIf(cu.MPI is None, "mpi4py is not installed")
+    def test_dynamic(self):
+        scheduler = fs.DynamicScheduler(7, cu.MPI.COMM_SELF)
+        self.assertEqual(list(scheduler), range(7))
+        self.assertEqual(scheduler.processed, 7)
+        scheduler.close('test')
+
+    def test_dynamic_plugin(self):
+        options = tu.set_experiment('tomo')
+        options['scheduler'] = 'dynamic'
+        plugin = 'savu.plugins.filters.median_filter'
+        run_protected_plugin_runner_no_process_list(options, plugin)
+
+if __name__ == "__main__":
+    unittest.main()
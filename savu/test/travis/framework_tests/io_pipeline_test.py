@@ -0,0 +1,131 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: io_pipeline_test
+   :platform: Unix
+   :synopsis: unittest test for the read ahead and write behind frame pipeline
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import unittest
+import threading
+import numpy as np
+
+import savu.core.io_pipeline as iop
+
+
+class IoPipelineTest(unittest.TestCase):
+
+    def get_frames(self, count):
+        return [np.ones((4, 10, 10))*count], [count]
+
+    def read_all(self, depth, nbytes=1e9, nSlices=20):
+        limit = iop.BufferLimit(nbytes)
+        reader = iop.get_frame_reader(self.get_frames, range(nSlices), depth,
+                                      limit)
+        frames = [f for count, f in reader]
+        reader.close()
+        self.assertEqual(limit.held, 0)
+        return frames
+
+    def test_read_ahead(self):
+        serial = self.read_all(0)
+        for depth, nbytes in [(1, 1e9), (4, 1e9), (4, 1)]:
+            frames = self.read_all(depth, nbytes=nbytes)
+            for i in range(len(serial)):
+                self.assertEqual(frames[i][1], serial[i][1])
+                np.testing.assert_array_equal(frames[i][0][0],
+                                              serial[i][0][0])
+
+    def test_read_ahead_close_early(self):
+        limit = iop.BufferLimit(1e9)
+        reader = iop.get_frame_reader(self.get_frames, range(50), 2, limit)
+        iter(reader).next()
+        reader.close()
+        self.assertEqual(limit.held, 0)
+
+    def test_read_ahead_error(self):
+        def get_frames(count):
+            if count == 3:
+                raise ValueError("read failed")
+            return self.get_frames(count)
+
+        reader = iop.get_frame_reader(get_frames, range(10), 2,
+                                      iop.BufferLimit(1e9))
+        frames = iter(reader)
+        for i in range(3):
+            self.assertEqual(frames.next()[0], i)
+        self.assertRaises(ValueError, frames.next)
+        reader.close()
+
+    def test_write_behind(self):
+        written = []
+        limit = iop.BufferLimit(1000)
+        writer = iop.get_frame_writer(
+            lambda count, result: written.append((count, result.sum())), 3,
+            limit)
+        for i in range(20):
+            writer.put(i, np.ones(100)*i)
+        writer.close()
+        self.assertEqual(written, [(i, 100.0*i) for i in range(20)])
+        self.assertEqual(limit.held, 0)
+
+    def test_write_behind_error(self):
+        def set_frames(count, result):
+            raise IOError("write failed")
+
+        writer = iop.get_frame_writer(set_frames, 2, iop.BufferLimit(1e9))
+        writer.put(0, np.ones(10))
+        self.assertRaises(IOError, writer.close)
+
+    def test_read_ahead_and_write_behind(self):
+        # the prefetched slice groups and a result are more than the limit
+        written = []
+        read_limit, write_limit = iop.get_buffer_limits(3500, 4, 4)
+        reader = iop.get_frame_reader(
+            lambda count: ([np.ones(125)*count], [count]), range(20), 4,
+            read_limit)
+        writer = iop.get_frame_writer(
+            lambda count, result: written.append(count), 4, write_limit)
+
+        def run():
+            for count, frames in reader:
+                writer.put(count, frames[0][0].copy())
+            reader.close()
+            writer.close()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(30)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(written, range(20))
+        self.assertEqual(read_limit.held + write_limit.held, 0)
+
+    def test_buffer_pool(self):
+        pool = iop.BufferPool()
+        a = pool.get(0, (4, 5), np.float32)
+        b = pool.get(1, (4, 5), np.float32)
+        self.assertIsNot(a, b)
+        self.assertEqual(a.dtype, np.float32)
+        pool.release(0)
+        self.assertIs(pool.get(2, (4, 5), np.float32), a)
+        self.assertIsNot(pool.get(3, (4, 5), np.float64), a)
+        self.assertEqual(pool.created, 3)
+
+if __name__ == "__main__":
+    unittest.main()
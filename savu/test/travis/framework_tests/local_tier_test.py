@@ -0,0 +1,103 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: local_tier_test
+   :platform: Unix
+   :synopsis: unittest test for intermediate datasets on node-local storage
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+import savu.data.transport_data.local_tier as lt
+
+
+class LocalTierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_placement(self):
+        tier = lt.LocalTier(self.tmpdir, 250)
+        local = lambda name: os.path.join(self.tmpdir, name)
+        # the input of a plugin is in use while its output is written
+        self.assertEqual(tier.place(1, 'tomo', '/shared/a.h5', 100),
+                         local('a.h5'))
+        self.assertEqual(tier.place(2, 'tomo', '/shared/b.h5', 100),
+                         local('b.h5'))
+        self.assertEqual(tier.place(2, 'sino', '/shared/c.h5', 100),
+                         '/shared/c.h5')
+        self.assertEqual(tier.place(3, 'tomo', '/shared/d.h5', 100),
+                         local('d.h5'))
+        self.assertEqual(tier.peak, 200)
+        # placements are not repeated
+        self.assertEqual(tier.place(2, 'sino', '/shared/c.h5', 10),
+                         '/shared/c.h5')
+
+    def test_eviction(self):
+        tier = lt.LocalTier(self.tmpdir, 300)
+        names = []
+        for count in range(1, 4):
+            names.append(tier.place(count, 'tomo', 'p%i.h5' % count, 100))
+            open(names[-1], 'w').close()
+        with h5py.File(os.path.join(self.tmpdir, 'test.nxs'), 'w') as nxs:
+            nxs['entry/intermediate/p1'] = h5py.ExternalLink(names[0], 'a')
+            tier.add_link(names[0], '/entry/intermediate/p1')
+            # the space left by the busiest plugin holds one released file
+            tier.release(names[0], nxs)
+            tier.release(names[1], nxs)
+            self.assertFalse(os.path.exists(names[0]))
+            self.assertFalse('entry/intermediate/p1' in nxs)
+            self.assertTrue(os.path.exists(names[1]))
+            tier.close(nxs)
+        self.assertFalse(any([os.path.exists(n) for n in names]))
+
+    def test_local_intermediates(self):
+        options = tu.set_experiment('tomoRaw')
+        options['local_dir'] = os.path.join(self.tmpdir, 'local')
+        plugin = 'savu.plugins.'
+        plugins = [plugin + 'corrections.timeseries_field_corrections',
+                   plugin + 'filters.median_filter',
+                   plugin + 'filters.no_process_plugin']
+        data = [{}] + [tu.set_data_dict(['tomo'], ['tomo'])]*3 + [{}]
+        tu.set_plugin_list(options, plugins, data)
+        run_protected_plugin_runner(options)
+
+        path = options['out_path']
+        files = os.listdir(path)
+        self.assertTrue('tomo_p3_no_process_plugin.h5' in files)
+        self.assertFalse('tomo_p2_median_filter.h5' in files)
+        self.assertEqual(os.listdir(options['local_dir']), [])
+        with h5py.File(os.path.join(path, 'tomo_p3_no_process_plugin.h5'),
+                       'r') as h5:
+            self.assertEqual(
+                h5['3-NoProcessPlugin-tomo']['data'].shape, (91, 135, 160))
+            self.assertTrue(np.any(h5['3-NoProcessPlugin-tomo']['data']))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memory_map_test
+   :platform: Unix
+   :synopsis: unittest test for reading contiguous datasets from memory maps
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+import savu.data.transport_data.memory_map as mm
+
+
+class MemoryMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @unittest.skipUnless(mm.MEMORY_MAPS, "h5py 2.9 or later is required")
+    def test_get_memory_map(self):
+        expected = np.arange(60, dtype='>f4').reshape(3, 4, 5)
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w',
+                       userblock_size=512) as h5:
+            self.assertEqual(
+                mm.get_memory_map(h5.create_dataset('empty', (3, 4, 5))),
+                None)
+            h5.create_dataset('contiguous', data=expected)
+            h5.create_dataset('chunked', data=expected, chunks=(1, 4, 5))
+            h5.create_dataset('compressed', data=expected, compression='lzf')
+            h5.flush()
+
+            mapped = mm.get_memory_map(h5['contiguous'])
+            np.testing.assert_array_equal(mapped[1:3, :, 2],
+                                          expected[1:3, :, 2])
+            self.assertFalse(mapped[0].flags.writeable)
+            self.assertEqual(type(mapped[0]), np.ndarray)
+            self.assertEqual(mm.get_memory_map(h5['chunked']), None)
+            self.assertEqual(mm.get_memory_map(h5['compressed']), None)
+
+    def run_chain(self, **kwargs):
+        plugins = ['filters.median_filter', 'filters.no_process_plugin']
+        path = tu.run_chain(plugins, **kwargs)
+        return tu.get_result(path, plugins[-1], 2)
+
+    def test_mapped_chain(self):
+        # the raw data is contiguous, and read with padding by the filter
+        expected = self.run_chain(memmap=False)
+        np.testing.assert_array_equal(self.run_chain(), expected)
+
+if __name__ == "__main__":
+    unittest.main()
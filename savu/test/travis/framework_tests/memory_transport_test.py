@@ -0,0 +1,54 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memory_transport_test
+   :platform: Unix
+   :synopsis: unittest test for the shared memory transport
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class MemoryTransportTest(unittest.TestCase):
+
+    def run_mm(self, **kwargs):
+        options = tu.set_options(tu.get_test_data_path('mm.nxs'),
+                                 process_file=tu.get_test_process_path(
+                                     'MMtest.nxs'), transport='memory')
+        options.update(kwargs)
+        run_protected_plugin_runner(options)
+        return sorted([f for f in os.listdir(options['out_path'])
+                       if f.endswith('.h5')])
+
+    def test_intermediate_in_memory(self):
+        self.assertEqual(self.run_mm(),
+                         ['NXfluo_p3_no_process_plugin.h5'])
+
+    def test_memory_budget(self):
+        self.assertEqual(self.run_mm(memory_budget_mb=0),
+                         ['NXfluo_p3_no_process_plugin.h5',
+                          'NXstxm_p1_no_process_plugin.h5',
+                          'NXxrd_p2_no_process_plugin.h5'])
+
+if __name__ == "__main__":
+    unittest.main()
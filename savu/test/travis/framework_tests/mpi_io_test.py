@@ -0,0 +1,80 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: mpi_io_test
+   :platform: Unix
+   :synopsis: unittest test for the MPI-IO hints and collective writes
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import unittest
+import h5py
+
+import savu.core.utils as cu
+import savu.core.mpi_io as mpi_io
+
+
+class MpiIoTest(unittest.TestCase):
+
+    def test_hints(self):
+        self.assertEqual(mpi_io.get_hints({}),
+                         mpi_io.HINT_PROFILES['default'])
+        hints = mpi_io.get_hints({'mpi_hints': 'lustre',
+                                  'mpi_hint': ['cb_nodes=4',
+                                               'striping_unit = 1048576']})
+        self.assertEqual(hints['cb_nodes'], '4')
+        self.assertEqual(hints['striping_unit'], '1048576')
+        self.assertEqual(hints['romio_cb_write'], 'enable')
+        self.assertEqual(mpi_io.get_hints({'mpi_hints': 'none'}), {})
+
+        self.assertRaises(ValueError, mpi_io.get_hints,
+                          {'mpi_hints': 'unknown'})
+        self.assertRaises(ValueError, mpi_io.get_hints,
+                          {'mpi_hint': ['cb_nodes']})
+
+    @unittest.skipIf(cu.MPI is None, "mpi4py is not installed")
+    def test_info(self):
+        info = mpi_io.get_info({'mpi_hints': 'collective',
+                                'mpi_hint': ['cb_nodes=2']})
+        self.assertEqual(info.Get('romio_cb_write'), 'enable')
+        self.assertEqual(info.Get('cb_nodes'), '2')
+        info.Free()
+
+    def test_collective_writes(self):
+        comm = cu.COMM_WORLD
+        options = {'mpi': True, 'collective_writes': True}
+        self.assertFalse(mpi_io.use_collective_writes({'mpi': True}, comm))
+        self.assertFalse(mpi_io.use_collective_writes(
+            {'collective_writes': True}, comm))
+        self.assertEqual(mpi_io.use_collective_writes(options, comm),
+                         h5py.get_config().mpi)
+        options['scheduler'] = 'dynamic'
+        self.assertFalse(mpi_io.use_collective_writes(options, comm))
+
+    def test_compress_shared_files(self):
+        nProcs = cu.COMM_WORLD.size
+        options = {'mpi': True, 'collective_writes': True}
+        self.assertTrue(mpi_io.compress_shared_files({}, nProcs))
+        self.assertFalse(mpi_io.compress_shared_files({'mpi': True}, nProcs))
+        self.assertEqual(mpi_io.compress_shared_files(options, nProcs),
+                         h5py.get_config().mpi and
+                         h5py.version.hdf5_version_tuple >= (1, 10, 2))
+        # a plugin that runs on some of the processes writes independently
+        self.assertFalse(mpi_io.compress_shared_files(options, nProcs + 1))
+
+if __name__ == "__main__":
+    unittest.main()
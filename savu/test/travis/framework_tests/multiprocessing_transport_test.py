@@ -0,0 +1,107 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: multiprocessing_transport_test
+   :platform: Unix
+   :synopsis: unittest test for the multiprocessing transport
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+import savu.core.utils as cu
+import savu.core.frame_pool as fp
+from savu.data.meta_data import MetaData
+from savu.core.transports.multiprocessing_transport import \
+    MultiprocessingTransport
+from savu.plugins.corrections.timeseries_field_corrections import \
+    TimeseriesFieldCorrections
+from savu.plugins.filters.median_filter import MedianFilter
+from savu.plugins.reconstructions.simple_recon import SimpleRecon
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class MultiprocessingTransportTest(unittest.TestCase):
+
+    def run_median(self, **kwargs):
+        options = tu.set_experiment('tomo')
+        options.update(kwargs)
+        tu.set_plugin_list(options, 'savu.plugins.filters.median_filter')
+        run_protected_plugin_runner(options)
+        path = options['out_path']
+        filename = [f for f in os.listdir(path) if f.endswith('.h5')][0]
+        with h5py.File(os.path.join(path, filename), 'r') as h5:
+            return h5['1-MedianFilter-test0']['data'][...]
+
+    def test_multiprocessing(self):
+        serial = self.run_median()
+        pooled = self.run_median(transport='multiprocessing',
+                                 process_names='CPU0,CPU1,CPU2')
+        np.testing.assert_array_equal(pooled, serial)
+
+    def test_workers(self):
+        # a reconstruction is shared between the worker processes, which
+        # each leave a file named after their process id
+        pids = tempfile.mkdtemp()
+        reconstruct = SimpleRecon.reconstruct
+
+        def record(plugin, *args):
+            open(os.path.join(pids, str(os.getpid())), 'a').close()
+            return reconstruct(plugin, *args)
+
+        SimpleRecon.reconstruct = record
+        try:
+            options = tu.set_experiment('tomo', transport='multiprocessing',
+                                        process_names='CPU0,CPU1,CPU2')
+            tu.set_plugin_list(
+                options, 'savu.plugins.reconstructions.simple_recon')
+            run_protected_plugin_runner(options)
+            self.assertGreater(len(os.listdir(pids)), 1)
+            self.assertNotIn(str(os.getpid()), os.listdir(pids))
+        finally:
+            SimpleRecon.reconstruct = reconstruct
+            shutil.rmtree(pids)
+
+    def test_frame_pool(self):
+        # only the plugins that declare a frame pool are run in the workers
+        transport = MultiprocessingTransport()
+        transport.exp = type('Experiment', (object,), {})()
+        transport.exp.meta_data = MetaData()
+        transport.exp.meta_data.set_meta_data('frame_workers', 3)
+        self.assertIsInstance(
+            transport._get_frame_pool([MedianFilter()]), fp.ProcessFramePool)
+        self.assertIsInstance(
+            transport._get_frame_pool([SimpleRecon()]), fp.ProcessFramePool)
+        self.assertIsInstance(
+            transport._get_frame_pool([TimeseriesFieldCorrections()]),
+            fp.SerialPool)
+
+    def test_serial_comm(self):
+        comm = cu.SerialComm()
+        self.assertEqual((comm.rank, comm.size), (0, 1))
+        self.assertEqual(comm.gather('message', root=0), ['message'])
+        comm.barrier()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: output_buffer_test
+   :platform: Unix
+   :synopsis: unittest test for plugins that fill reusable output buffers
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+from savu.plugins.corrections.timeseries_field_corrections import \
+    TimeseriesFieldCorrections
+
+
+class OutputBufferTest(unittest.TestCase):
+
+    def run_corrections(self, **kwargs):
+        options = tu.set_experiment('tomoRaw')
+        options.update(kwargs)
+        plugin = 'savu.plugins.corrections.timeseries_field_corrections'
+        data = [{}, tu.set_data_dict(['tomo'], ['tomo']), {}]
+        tu.set_plugin_list(options, plugin, data)
+        run_protected_plugin_runner(options)
+        filename = os.path.join(options['out_path'],
+                                'tomo_p1_timeseries_field_corrections.h5')
+        with h5py.File(filename, 'r') as h5:
+            return h5['1-TimeseriesFieldCorrections-tomo']['data'][...]
+
+    def test_output_buffers(self):
+        result = self.run_corrections()
+        TimeseriesFieldCorrections.reuse_output_buffers = lambda self: False
+        try:
+            expected = self.run_corrections()
+        finally:
+            del TimeseriesFieldCorrections.reuse_output_buffers
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    def test_correct(self):
+        plugin = TimeseriesFieldCorrections()
+        plugin.dark_idx, plugin.flat_idx = np.arange(2), np.arange(2, 4)
+        plugin.data_idx = np.arange(4, 20)
+        data = 4000*np.random.rand(20, 9, 7)
+        data[2:4, 0, 0] = data[0:2, 0, 0]
+        out = np.empty((16, 9, 7), dtype=np.float32)
+        result = plugin.correct(data, out=out)
+        self.assertTrue(result is out)
+        np.testing.assert_array_equal(
+            result, plugin.correct(data).astype(np.float32))
+
+    def test_output_buffers_write_behind(self):
+        expected = self.run_corrections()
+        result = self.run_corrections(write_behind=4, frame_workers=2)
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+if __name__ == "__main__":
+    unittest.main()
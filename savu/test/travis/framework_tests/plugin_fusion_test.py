@@ -0,0 +1,69 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: plugin_fusion_test
+   :platform: Unix
+   :synopsis: unittest test for running adjacent plugins in a single pass
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+
+
+class PluginFusionTest(unittest.TestCase):
+
+    def run_chain(self, second='no_process_plugin', pattern=None, **kwargs):
+        plugins = ['corrections.timeseries_field_corrections',
+                   'filters.' + second, 'filters.no_process_plugin']
+        data = [{}] + [tu.set_data_dict(['tomo'], ['tomo'])]*3 + [{}]
+        if pattern:
+            data[3] = dict(data[3], pattern=pattern)
+        return tu.run_chain(plugins, data, **kwargs)
+
+    def get_files(self, path):
+        return sorted([f for f in os.listdir(path) if f.endswith('.h5')])
+
+    def test_fused(self):
+        path = self.run_chain(fusion=True)
+        self.assertEqual(self.get_files(path),
+                         ['tomo_p1_timeseries_field_corrections.h5',
+                          'tomo_p3_no_process_plugin.h5'])
+        corrected = tu.get_result(path, tu.CHAIN[0], 1)
+        np.testing.assert_array_equal(tu.get_result(path), corrected)
+
+    def test_no_fusion(self):
+        # plugins are not fused by default
+        path = self.run_chain()
+        self.assertEqual(self.get_files(path),
+                         ['tomo_p1_timeseries_field_corrections.h5',
+                          'tomo_p2_no_process_plugin.h5',
+                          'tomo_p3_no_process_plugin.h5'])
+
+    def test_fused_filter(self):
+        # the median filter changes the data that is passed on in memory
+        kwargs = {'second': 'median_filter', 'pattern': 'PROJECTION'}
+        expected = tu.get_result(self.run_chain(**kwargs))
+        path = self.run_chain(fusion=True, **kwargs)
+        self.assertFalse('tomo_p2_median_filter.h5' in self.get_files(path))
+        np.testing.assert_array_equal(tu.get_result(path), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: rank_files_test
+   :platform: Unix
+   :synopsis: unittest test for intermediate datasets written to a file per \
+   process and joined by a virtual dataset
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+import savu.data.transport_data.rank_files as rf
+
+
+class RankFilesTest(unittest.TestCase):
+
+    def test_rank_files(self):
+        expected = tu.get_result(tu.run_chain())
+        path = tu.run_chain(per_rank_files=True, rank_file_compression='gzip')
+        np.testing.assert_array_equal(tu.get_result(path), expected)
+
+        filename = os.path.join(path, 'tomo_p2_median_filter.h5')
+        self.assertTrue(os.path.exists(rf.get_rank_filename(filename, 0)))
+        with h5py.File(filename, 'r') as h5:
+            data = h5['2-MedianFilter-tomo']['data']
+            self.assertTrue(data.is_virtual)
+            self.assertEqual(len(data.virtual_sources()), 1)
+        # the final result is not split
+        self.assertFalse(os.path.exists(rf.get_rank_filename(os.path.join(
+            path, 'tomo_p3_no_process_plugin.h5'), 0)))
+
+    def test_merge_regions(self):
+        shape = (10, 20, 30)
+        groups = [(slice(0, 4, 1), slice(None), 3),
+                  (slice(4, 8, 1), slice(None), 3),
+                  (slice(8, 10, 1), slice(None), 3),
+                  (slice(0, 4, 1), slice(None), 4)]
+        self.assertEqual(rf.merge_regions(groups, shape),
+                         [((0, 10, 1), (0, 20, 1), (3, 4, 1)),
+                          ((0, 4, 1), (0, 20, 1), (4, 5, 1))])
+        stepped = [(slice(0, 4, 2), slice(None), slice(None)),
+                   (slice(4, 8, 2), slice(None), slice(None))]
+        self.assertEqual(len(rf.merge_regions(stepped, shape)), 2)
+
+if __name__ == "__main__":
+    unittest.main()
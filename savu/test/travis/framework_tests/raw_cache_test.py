@@ -0,0 +1,121 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: raw_cache_test
+   :platform: Unix
+   :synopsis: unittest test for the rechunked copy of the raw data
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+import savu.data.raw_cache as raw_cache
+from savu.data.meta_data import MetaData
+
+
+class Experiment(object):
+    """ The experiment options and barrier used by raw_cache.get_data. """
+
+    def __init__(self, **options):
+        self.meta_data = MetaData(options)
+
+    def _barrier(self):
+        pass
+
+
+class RawCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmpdir, 'cache')
+        self.expected = np.random.rand(91, 135, 160).astype(np.float32)
+        self.source = h5py.File(os.path.join(self.tmpdir, 'scan.h5'), 'w')
+        self.source.create_dataset('data', data=self.expected)
+        self.source.flush()
+
+    def get_data(self, **options):
+        options = dict(dict(raw_cache=self.cache, inter_path=self.tmpdir,
+                            processes=['CPU0']), **options)
+        return raw_cache.get_data(Experiment(**options), self.source, 'data')
+
+    def tearDown(self):
+        self.source.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_raw_cache(self):
+        expected = tu.get_result(tu.run_chain())
+        cache = self.cache
+        np.testing.assert_array_equal(
+            tu.get_result(tu.run_chain(raw_cache=cache)), expected)
+        files = os.listdir(cache)
+        self.assertEqual(len(files), 1)
+        created = os.path.getmtime(os.path.join(cache, files[0]))
+
+        # the copy is reused by the next run
+        np.testing.assert_array_equal(
+            tu.get_result(tu.run_chain(raw_cache=cache)), expected)
+        self.assertEqual(os.listdir(cache), files)
+        self.assertEqual(os.path.getmtime(os.path.join(cache, files[0])),
+                         created)
+
+    def test_processes(self):
+        # the copy is shared by runs with any number of processes
+        for processes in [1, 32]:
+            data = self.get_data(processes=['CPU%i' % i for i in
+                                            range(processes)])
+            np.testing.assert_array_equal(data[...], self.expected)
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+
+    def test_failed_copy(self):
+        get_filters = raw_cache.cc.get_filters
+        raw_cache.cc.get_filters = lambda options: {'compression': 'none'}
+        try:
+            data = self.get_data()
+        finally:
+            raw_cache.cc.get_filters = get_filters
+        # the source is read, and the partial copy is removed
+        self.assertEqual(data.file.filename, self.source.filename)
+        self.assertEqual(os.listdir(self.cache), [])
+
+    def test_cache_filename(self):
+        source = os.path.join(self.tmpdir, 'scan.nxs')
+        open(source, 'w').close()
+        os.utime(source, (0, 0))
+        name = raw_cache.get_cache_filename(self.tmpdir, source, 'data',
+                                            (8, 8, 160))
+        self.assertTrue(os.path.basename(name).startswith('scan_'))
+        self.assertNotEqual(name, raw_cache.get_cache_filename(
+            self.tmpdir, source, 'data', (4, 8, 160)))
+        self.assertNotEqual(name, raw_cache.get_cache_filename(
+            self.tmpdir, source, 'other', (8, 8, 160)))
+        self.assertEqual(name, raw_cache.get_cache_filename(
+            self.tmpdir, source, 'data', (8, 8, 160), {}))
+        self.assertNotEqual(name, raw_cache.get_cache_filename(
+            self.tmpdir, source, 'data', (8, 8, 160),
+            {'compression': 'gzip', 'shuffle': True}))
+        os.utime(source, (1, 1))
+        self.assertNotEqual(name, raw_cache.get_cache_filename(
+            self.tmpdir, source, 'data', (8, 8, 160)))
+
+if __name__ == "__main__":
+    unittest.main()
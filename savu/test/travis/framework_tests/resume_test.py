@@ -0,0 +1,62 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: resume_test
+   :platform: Unix
+   :synopsis: unittest test for resuming a process list that did not complete
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+
+
+class ResumeTest(unittest.TestCase):
+
+    def test_resume(self):
+        path = tu.run_chain()
+        expected = tu.get_result(path)
+
+        # the run stopped while the second plugin was writing its output
+        os.remove(os.path.join(path, 'tomo_p3_no_process_plugin.h5'))
+        with h5py.File(os.path.join(path, 'tomo_p2_median_filter.h5'),
+                       'r+') as h5:
+            del h5['2-MedianFilter-tomo'].attrs['complete']
+        with h5py.File(os.path.join(
+                path, 'tomo_p1_timeseries_field_corrections.h5'), 'r+') as h5:
+            h5.attrs['reused'] = True
+
+        tu.run_chain(out_path=path, resume=True)
+        with h5py.File(os.path.join(
+                path, 'tomo_p1_timeseries_field_corrections.h5'), 'r') as h5:
+            self.assertTrue(h5.attrs['reused'])
+        with h5py.File(os.path.join(path, 'tomo_p2_median_filter.h5'),
+                       'r') as h5:
+            self.assertTrue(h5['2-MedianFilter-tomo'].attrs['complete'])
+        np.testing.assert_array_equal(tu.get_result(path), expected)
+
+    def test_nothing_to_resume(self):
+        path = tu.run_chain(resume=True)
+        self.assertTrue(os.path.exists(
+            os.path.join(path, 'tomo_p3_no_process_plugin.h5')))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: strided_reads_test
+   :platform: Unix
+   :synopsis: unittest test for the strategies that read stepped selections
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import h5py
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from savu.test import test_utils as tu
+import savu.data.transport_data.strided_reads as sr
+
+
+class StridedReadsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        expected = np.random.rand(20, 13, 11)
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w') as h5:
+            for chunks in [None, (3, 4, 5)]:
+                data = h5.create_dataset(str(chunks), data=expected,
+                                         chunks=chunks)
+                for sl in [(slice(1, 19, 3), slice(None), slice(0, 11, 2)),
+                           (2, slice(0, 13, 4), slice(None)),
+                           (slice(None), 5, slice(1, 10, 3)),
+                           (slice(0, 20, 7), slice(2, 3, 1), 7)]:
+                    self.assertTrue(sr.is_strided(sl))
+                    for strategy in sr.STRATEGIES + ['auto']:
+                        np.testing.assert_array_equal(
+                            sr.read(data, sl, 1e6, strategy), expected[sl])
+        self.assertFalse(sr.is_strided((slice(0, 4, 1), slice(None), 2)))
+        self.assertFalse(sr.is_strided((slice(0, 4, 2), [1, 3], 2)))
+
+    def test_plan_read(self):
+        shape = (200, 128, 128)
+        projections = (slice(0, 200, 8), slice(None), slice(None))
+        # frames that are far apart in a contiguous dataset are read as they
+        # are, but every other frame of a chunk is read with its chunk
+        self.assertEqual(sr.plan_read(shape, 4, None, projections, 1e9),
+                         sr.HYPERSLAB)
+        self.assertEqual(sr.plan_read(shape, 4, (16, 32, 32),
+                                      projections, 1e9), sr.BULK)
+        # unless the bulk read does not fit in the buffer
+        costs = sr.get_costs(shape, 4, (16, 32, 32), projections, 1e6)
+        self.assertEqual(sorted(costs.keys()), [sr.HYPERSLAB, sr.RUNS])
+
+    def test_benchmark(self):
+        results = sr.benchmark((16, 12, 10), np.float32, (4, 6, 10),
+                               self.tmpdir, steps=(2, 4))
+        self.assertEqual(len(results), 4)
+        for sl, strategy, times in results:
+            self.assertTrue(strategy in sr.STRATEGIES)
+            self.assertEqual(sorted(times.keys()), sorted(sr.STRATEGIES))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def run_chain(self, **kwargs):
+        plugins = ['filters.no_process_plugin', 'filters.median_filter']
+        preview = {'preview': [':', '0:end:2', '0:end:3']}
+        data = [preview] + [tu.set_data_dict(['tomo'], ['tomo'])]*2 + [{}]
+        path = tu.run_chain(plugins, data, memmap=False, **kwargs)
+        return tu.get_result(path, plugins[-1], 2)
+
+    def test_previewed_chain(self):
+        # the raw data is read with a preview step in the core dimensions
+        expected = self.run_chain(strided_reads='hyperslab')
+        for strategy in ['auto', 'bulk', 'runs']:
+            np.testing.assert_array_equal(
+                self.run_chain(strided_reads=strategy),
+                expected)
+
+    def test_previewed_memory_chain(self):
+        # the corrected data is held in memory, where it is sliced with the
+        # preview step rather than read with a strategy
+        plugins = ['corrections.timeseries_field_corrections',
+                   'reconstructions.simple_recon']
+        data_dict = tu.set_data_dict(['tomo'], ['tomo'])
+        data = [{}, data_dict,
+                dict(data_dict, preview=['0:end:2', ':', ':']), {}]
+        results = [tu.get_result(tu.run_chain(plugins, data,
+                                              transport=transport),
+                                 plugins[-1], 2)
+                   for transport in ['hdf5', 'memory']]
+        np.testing.assert_array_equal(results[1], results[0])
+
+if __name__ == "__main__":
+    unittest.main()
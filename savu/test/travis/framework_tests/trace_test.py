@@ -0,0 +1,93 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: trace_test
+   :platform: Unix
+   :synopsis: unittest test for tracing the processing
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import json
+import h5py
+import unittest
+
+import savu.core.trace as trace
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class TraceTest(unittest.TestCase):
+
+    def test_trace(self):
+        options = tu.set_experiment('tomoRaw')
+        options['trace'] = True
+        plugin = 'savu.plugins.'
+        plugins = [plugin + 'corrections.timeseries_field_corrections',
+                   plugin + 'filters.median_filter']
+        data = [{}] + [tu.set_data_dict(['tomo'], ['tomo'])]*2 + [{}]
+        tu.set_plugin_list(options, plugins, data)
+        exp = run_protected_plugin_runner(options)
+        self.assertFalse(trace.is_enabled())
+
+        with open(os.path.join(options['log_path'], 'trace_000.json')) as f:
+            events = json.load(f)['traceEvents']
+        names = set([(e['cat'], e['name']) for e in events])
+        for name in ['setup', 'read', 'process', 'write', 'barrier',
+                     'pre_process', 'post_process']:
+            self.assertIn(('MedianFilter', name), names)
+        read = [e for e in events if e['name'] == 'read']
+        self.assertTrue(all([e['args']['bytes'] > 0 for e in read]))
+        # median filter processes projections
+        nFrames = exp.index['in_data']['tomo'].get_shape()[0]
+        self.assertEqual(sum([e['args']['frames'] for e in events if
+                              e['name'] == 'process' and
+                              e['cat'] == 'MedianFilter']), nFrames)
+
+        nxs = exp.meta_data.get_meta_data('nxs_filename')
+        with h5py.File(nxs, 'r') as f:
+            summary = f['entry/trace/MedianFilter']
+            self.assertGreater(summary['frames_per_second'][...], 0)
+            self.assertGreater(summary['read_bandwidth'][...], 0)
+            self.assertEqual(summary['imbalance'][...], 1.0)
+            self.assertGreater(summary['setup_time'][...], 0)
+
+    def test_fused(self):
+        plugins = ['corrections.timeseries_field_corrections',
+                   'filters.no_process_plugin', 'filters.no_process_plugin']
+        path = tu.run_chain(plugins, fusion=True, trace=True)
+        with open(os.path.join(path, 'trace_000.json')) as f:
+            events = json.load(f)['traceEvents']
+        names = set([e['name'] for e in events if '+' in e['cat']])
+        for name in ['read', 'process', 'write', 'barrier']:
+            self.assertIn(name, names)
+
+    def test_disabled(self):
+        self.assertFalse(trace.is_enabled())
+        with trace.span('read', 'plugin') as span:
+            span.set(bytes=1)
+        trace.start()
+        with trace.span('read', 'plugin', bytes=2):
+            pass
+        events = trace.stop()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(trace.summarise(events)['plugin']['read'][1:],
+                         [2, 0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,6 +25,7 @@ import sys
 import os
 
 from savu.core.plugin_runner import PluginRunner
+import savu.core.mpi_io as mpi_io
 
 
 def __option_parser():
@@ -36,7 +37,8 @@ def __option_parser():
     parser.add_option("-n", "--names", dest="names", help="Process names",
                       default="CPU0")
     parser.add_option("-t", "--transport", dest="transport",
-                      help="Set the transport mechanism", default="hdf5")
+                      help="Set the transport mechanism (hdf5, memory, "
+                      "multiprocessing or dist_array)", default="hdf5")
     parser.add_option("-D", "--datestring", dest="datestring",
                       help="Set the date string" )
     parser.add_option("-f", "--folder", dest="folder",
@@ -49,6 +51,121 @@ def __option_parser():
                       help="Display all debug log messages", default=False)
     parser.add_option("-q", "--quiet", action="store_true", dest="quiet",
                       help="Display only Errors and Info", default=False)
+    parser.add_option("--read_ahead", dest="read_ahead", type="int",
+                      help="Number of slice groups to read ahead of the "
+                      "processing in a background thread", default=0)
+    parser.add_option("--write_behind", dest="write_behind", type="int",
+                      help="Number of processed slice groups that may wait "
+                      "to be written in a background thread", default=0)
+    parser.add_option("--io_buffer", dest="io_buffer_mb", type="float",
+                      help="Memory limit (MB) for read ahead and write behind "
+                      "buffers, split between them if both are used",
+                      default=1024)
+    parser.add_option("--read_buffer", dest="read_buffer_mb", type="float",
+                      help="Memory limit (MB) for a read that merges the "
+                      "slice groups of a process that follow on from each "
+                      "other (0 to read each slice group separately)",
+                      default=64)
+    parser.add_option("--chunk_cache", dest="chunk_cache_mb", type="float",
+                      help="Memory limit (MB) for the hdf5 chunk caches of "
+                      "the datasets used by each plugin, sized to hold the "
+                      "chunks of a slice group (0 for the hdf5 default)",
+                      default=256)
+    parser.add_option("--chunk_target", dest="chunk_target_mb", type="float",
+                      help="Largest chunk (MB) of the hdf5 datasets that are "
+                      "created (default: the filesystem block size, but at "
+                      "least 1 MB)", default=None)
+    parser.add_option("--mpi_hints", dest="mpi_hints", type="choice",
+                      choices=sorted(mpi_io.HINT_PROFILES), help="The MPI-IO "
+                      "hints used to open the hdf5 files (%s)" %
+                      ", ".join(sorted(mpi_io.HINT_PROFILES)),
+                      default="default")
+    parser.add_option("--mpi_hint", dest="mpi_hint", action="append",
+                      help="An MPI-IO hint 'key=value' added to the hint "
+                      "profile (may be repeated)", default=[])
+    parser.add_option("--collective_writes", action="store_true",
+                      dest="collective_writes", help="Write the slice "
+                      "groups with collective MPI-IO operations",
+                      default=False)
+    parser.add_option("--per_rank_files", action="store_true",
+                      dest="per_rank_files", help="Write the intermediate "
+                      "datasets to a file per process, joined by a virtual "
+                      "dataset", default=False)
+    parser.add_option("--rank_file_compression", dest="rank_file_compression",
+                      type="choice", choices=["gzip", "lzf"],
+                      help="Compress the files of each process (gzip or "
+                      "lzf)", default=None)
+    parser.add_option("--compression", dest="compression", type="choice",
+                      choices=["gzip", "lzf"], help="Compress the output "
+                      "datasets with shuffle and gzip or lzf (with MPI, the "
+                      "datasets in shared files are only compressed with "
+                      "--collective_writes and hdf5 1.10.2 or later)",
+                      default=None)
+    parser.add_option("--compression_threads", dest="compression_threads",
+                      type="int", help="The threads compressing the chunks "
+                      "of gzip datasets in each process", default=4)
+    parser.add_option("--local_dir", dest="local_dir", help="Node-local "
+                      "scratch directory (e.g. on an SSD or /dev/shm) for "
+                      "the intermediate datasets of single node runs",
+                      default=None)
+    parser.add_option("--local_budget", dest="local_budget_mb",
+                      type="float", help="Capacity (MB) of the local "
+                      "scratch directory (default: 90%% of its free space)",
+                      default=None)
+    parser.add_option("--raw_cache", dest="raw_cache", help="Directory "
+                      "for copies of the raw data rechunked for projection "
+                      "and sinogram access, reused by later runs",
+                      default=None)
+    parser.add_option("--memory_budget", dest="memory_budget_mb",
+                      type="float", help="Memory limit (MB) for intermediate "
+                      "datasets with the memory transport (default: half of "
+                      "the physical memory)", default=None)
+    parser.add_option("--frame_budget", dest="frame_budget_mb",
+                      type="float", help="Memory limit (MB) for the slice "
+                      "groups of each process, used to choose the number of "
+                      "frames in each slice group (default: the plugin "
+                      "maximum)", default=None)
+    parser.add_option("--read_threads", dest="read_threads", type="int",
+                      help="The threads decompressing the chunks of "
+                      "compressed datasets in each process (0 to "
+                      "decompress them in hdf5)", default=4)
+    parser.add_option("--strided_reads", dest="strided_reads",
+                      type="choice", choices=["auto", "hyperslab", "bulk",
+                                              "runs"],
+                      help="How stepped (previewed) selections are read: as "
+                      "hyperslabs, as bulk reads decimated in memory, as a "
+                      "read of each index of the outer stepped dimension, "
+                      "or auto to choose for each selection", default="auto")
+    parser.add_option("--no_memmap", action="store_false", dest="memmap",
+                      help="Read contiguous datasets through hdf5 rather "
+                      "than from memory maps", default=True)
+    parser.add_option("--fusion", action="store_true", dest="fusion",
+                      help="Run adjacent plugins in a single pass, without "
+                      "saving the datasets passed between them",
+                      default=False)
+    parser.add_option("--scheduler", dest="scheduler", type="choice",
+                      choices=["static", "dynamic"], help="Share the slice "
+                      "groups of each plugin between the processes up front "
+                      "(static) or as the processes become free (dynamic)",
+                      default="static")
+    parser.add_option("--frame_workers", dest="frame_workers", type="int",
+                      help="Number of slice groups each process may work on "
+                      "at the same time, in plugins that support it",
+                      default=1)
+    parser.add_option("--resume", action="store_true", dest="resume",
+                      help="Continue a run that did not complete, in the "
+                      "output folder set with -f, from the first plugin "
+                      "whose output is incomplete", default=False)
+    parser.add_option("--estimate", action="store_true", dest="estimate",
+                      help="Report the data read and written, memory and "
+                      "predicted time of each plugin, from a trial on "
+                      "random frames, without processing the data",
+                      default=False)
+    parser.add_option("--trace", action="store_true", dest="trace",
+                      help="Write the time spent reading, processing and "
+                      "writing by each process to trace_<rank>.json (Chrome "
+                      "trace format) and a summary to the nexus file",
+                      default=False)
 
     (options, args) = parser.parse_args()
     return [options, args]
@@ -91,6 +208,33 @@ def _set_options(opt, args):
     options["process_names"] = opt.names
     options["verbose"] = opt.verbose
     options["quiet"] = opt.quiet
+    options["read_ahead"] = opt.read_ahead
+    options["write_behind"] = opt.write_behind
+    options["io_buffer_mb"] = opt.io_buffer_mb
+    options["read_buffer_mb"] = opt.read_buffer_mb
+    options["chunk_cache_mb"] = opt.chunk_cache_mb
+    options["chunk_target_mb"] = opt.chunk_target_mb
+    options["mpi_hints"] = opt.mpi_hints
+    options["mpi_hint"] = opt.mpi_hint
+    options["collective_writes"] = opt.collective_writes
+    options["per_rank_files"] = opt.per_rank_files
+    options["rank_file_compression"] = opt.rank_file_compression
+    options["compression"] = opt.compression
+    options["compression_threads"] = opt.compression_threads
+    options["local_dir"] = opt.local_dir
+    options["local_budget_mb"] = opt.local_budget_mb
+    options["raw_cache"] = opt.raw_cache
+    options["memory_budget_mb"] = opt.memory_budget_mb
+    options["frame_budget_mb"] = opt.frame_budget_mb
+    options["fusion"] = opt.fusion
+    options["memmap"] = opt.memmap
+    options["read_threads"] = opt.read_threads
+    options["strided_reads"] = opt.strided_reads
+    options["scheduler"] = opt.scheduler
+    options["frame_workers"] = opt.frame_workers
+    options["resume"] = opt.resume
+    options["estimate"] = opt.estimate
+    options["trace"] = opt.trace
     options["data_file"] = args[0]
     options["process_file"] = args[1]
     options["out_path"] = set_output_folder(args[0], args[2], opt.folder,opt.datestring)
@@ -106,13 +250,13 @@ def _set_options(opt, args):
 
 
 def set_output_folder(in_file, out_path, set_folder,set_datestring):
-    from mpi4py import MPI
+    from savu.core.utils import COMM_WORLD
     import time
     if not set_folder:
        if not set_datestring:
-           MPI.COMM_WORLD.barrier()
+           COMM_WORLD.barrier()
            timestamp = time.strftime("%Y%m%d%H%M%S")
-           MPI.COMM_WORLD.barrier()
+           COMM_WORLD.barrier()
        else:
            timestamp=set_datestring
        name = os.path.basename(in_file.split('.')[-2])
@@ -120,15 +264,17 @@ def set_output_folder(in_file, out_path, set_folder,set_datestring):
     else:
        folder = os.path.join(out_path, set_folder)
     print "The output folder is", folder
-    if MPI.COMM_WORLD.rank == 0:
+    if COMM_WORLD.rank == 0:
         if not os.path.exists(folder):
             os.makedirs(folder)
     return folder
 
 
-def main():
+def main(transport=None):
     [options, args] = __option_parser()
     __check_input_params(args)
+    if transport:
+        options.transport = transport
     options = _set_options(options, args)
     plugin_runner = PluginRunner(options)
     plugin_runner._run_plugin_list()